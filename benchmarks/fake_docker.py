@@ -0,0 +1,257 @@
+"""
+A tiny in-process stand-in for the docker engine API, served over a unix
+socket so uam and rendered shims can be benchmarked without docker:
+
+    server = FakeDockerServer("/tmp/docker.sock")
+    server.start()
+    os.environ["DOCKER_HOST"] = "unix:///tmp/docker.sock"
+
+It answers the endpoints uam uses with canned, successful responses and
+counts requests per endpoint so round trips can be compared. Images added to
+`missing_images` are not found until they are pulled, which takes
+`pull_seconds` and is counted per image in `pulls`. Events passed to
+`publish_event` are streamed to every client watching `/events`.
+
+Containers behave like `cat`: what is written to an attached stdin is
+echoed back as stdout frames. Like docker, a container only sees the end of
+its stdin when it was created with StdinOnce, those counted in `stdin_eofs`
+exit then, the others keep waiting for input until `stdin_timeout`.
+"""
+import collections
+import http.server
+import json
+import os
+import queue
+import re
+import socketserver
+import struct
+import threading
+import time
+import urllib.parse
+import uuid
+
+
+API_VERSION = "1.30"
+VERSION_PREFIX = re.compile(r"^/v\d+\.\d+")
+
+
+class FakeDockerHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    ROUTES = [
+        ("GET", r"^/_ping$", "ping"),
+        ("GET", r"^/version$", "version"),
+        ("GET", r"^/images/(?P<name>.+)/json$", "inspect_image"),
+        ("GET", r"^/networks/(?P<name>[^/]+)$", "inspect_network"),
+        ("POST", r"^/networks/create$", "create_network"),
+        ("GET", r"^/volumes/(?P<name>[^/]+)$", "inspect_volume"),
+        ("POST", r"^/volumes/create$", "create_volume"),
+        ("DELETE", r"^/volumes/(?P<name>[^/]+)$", "delete"),
+        ("GET", r"^/containers/json$", "list_containers"),
+        ("POST", r"^/containers/create$", "create_container"),
+        ("POST", r"^/containers/(?P<id>[^/]+)/attach$", "attach_container"),
+        ("POST", r"^/containers/(?P<id>[^/]+)/start$", "start_container"),
+        ("POST", r"^/containers/(?P<id>[^/]+)/wait$", "wait_container"),
+        ("DELETE", r"^/containers/(?P<id>[^/]+)$", "delete"),
+        ("POST", r"^/images/create$", "pull_image"),
+        ("GET", r"^/events$", "stream_events"),
+    ]
+
+    # the client address of a unix socket is not a tuple.
+    def address_string(self):
+        return "unix"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def dispatch(self, method):
+        path, _, query = self.path.partition("?")
+        path = urllib.parse.unquote(VERSION_PREFIX.sub("", path))
+        self.query = dict(urllib.parse.parse_qsl(query))
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        for route_method, pattern, name in self.ROUTES:
+            matched = re.match(pattern, path)
+            if route_method == method and matched:
+                self.server.requests[name] += 1
+                return getattr(self, name)(body=body, **matched.groupdict())
+        self.server.requests["unknown"] += 1
+        self.respond(404, {"message": f"{method} {path} is not faked"})
+
+    def respond(self, status, data=None, content_type="application/json"):
+        payload = json.dumps(data).encode() if data is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def ping(self, body):
+        payload = b"OK"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def version(self, body):
+        self.respond(200, {"ApiVersion": API_VERSION, "Version": "17.06.0-fake",
+                           "MinAPIVersion": "1.12", "Os": "linux"})
+
+    def inspect_image(self, body, name):
+        with self.server.lock:
+            if name in self.server.missing_images:
+                return self.respond(404, {"message": f"No such image: {name}"})
+        self.respond(200, {"Id": "sha256:" + "0" * 64, "RepoTags": [name]})
+
+    def pull_image(self, body):
+        image = f"{self.query['fromImage']}:{self.query.get('tag') or 'latest'}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        layer_size, steps = 2 ** 20, 4
+        for step in range(1, steps + 1):
+            time.sleep(self.server.pull_seconds / steps)
+            self.write_chunk({"status": "Downloading", "id": "layer0",
+                              "progressDetail": {"current": layer_size * step // steps,
+                                                 "total": layer_size}})
+        with self.server.lock:
+            self.server.missing_images.discard(image)
+            self.server.pulls[image] += 1
+        self.write_chunk({"status": f"Downloaded newer image for {image}"})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def write_chunk(self, data):
+        payload = json.dumps(data).encode() + b"\r\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(payload), payload))
+        self.wfile.flush()
+
+    def inspect_network(self, body, name):
+        self.respond(200, {"Id": name, "Name": name, "Driver": "bridge"})
+
+    def create_network(self, body):
+        self.respond(201, {"Id": uuid.uuid4().hex})
+
+    def inspect_volume(self, body, name):
+        self.respond(200, {"Name": name, "Driver": "local", "Labels": {}})
+
+    def create_volume(self, body):
+        data = json.loads(body or b"{}")
+        self.respond(201, {"Name": data.get("Name", uuid.uuid4().hex), "Driver": "local"})
+
+    def list_containers(self, body):
+        self.respond(200, [])
+
+    def create_container(self, body):
+        image = json.loads(body or b"{}").get("Image", "")
+        with self.server.lock:
+            if image in self.server.missing_images:
+                return self.respond(404, {"message": f"No such image: {image}"})
+        container_id = uuid.uuid4().hex * 2
+        self.server.started[container_id] = threading.Event()
+        self.server.containers[container_id] = json.loads(body or b"{}")
+        self.respond(201, {"Id": container_id, "Warnings": None})
+
+    def attach_container(self, body, id):
+        self.send_response(101, "UPGRADED")
+        self.send_header("Content-Type", "application/vnd.docker.raw-stream")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Upgrade", "tcp")
+        self.end_headers()
+        self.wfile.flush()
+        # like docker, nothing is written before the container is started.
+        self.server.started[id].wait(10)
+        config = self.server.containers.get(id, {})
+        if config.get("OpenStdin") and self.query.get("stdin") in ("1", "True", "true"):
+            for data in iter(lambda: self.rfile.read1(2 ** 16), b""):
+                self.wfile.write(struct.pack(">BxxxI", 1, len(data)) + data)
+                self.wfile.flush()
+            if config.get("StdinOnce"):
+                with self.server.lock:
+                    self.server.stdin_eofs += 1
+            else:
+                # the stream ended, the container's stdin did not.
+                time.sleep(self.server.stdin_timeout)
+        self.close_connection = True
+
+    def start_container(self, body, id):
+        self.server.started.setdefault(id, threading.Event()).set()
+        self.respond(204)
+
+    def wait_container(self, body, id):
+        self.respond(200, {"StatusCode": 0})
+
+    def delete(self, body, **kwargs):
+        self.respond(204)
+
+    def stream_events(self, body):
+        events = queue.Queue()
+        with self.server.lock:
+            self.server.subscribers.append(events)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.wfile.flush()
+        try:
+            while True:
+                self.write_chunk(events.get())
+        except OSError:
+            pass
+        finally:
+            with self.server.lock:
+                self.server.subscribers.remove(events)
+
+
+class FakeDockerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # benchmarks connect from many processes at once.
+    request_queue_size = 128
+
+    def __init__(self, socket_path):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        self.socket_path = socket_path
+        self.requests = collections.Counter()
+        self.started = {}
+        self.containers = {}
+        self.stdin_eofs = 0
+        self.stdin_timeout = 5
+        self.lock = threading.Lock()
+        self.missing_images = set()
+        self.pulls = collections.Counter()
+        self.pull_seconds = 0.5
+        self.subscribers = []
+        super(FakeDockerServer, self).__init__(socket_path, FakeDockerHandler)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def publish_event(self, object_type, action, name, object_id=None):
+        event = {"Type": object_type, "Action": action, "time": int(time.time()),
+                 "Actor": {"ID": object_id or name, "Attributes": {"name": name}}}
+        with self.lock:
+            for events in self.subscribers:
+                events.put(event)
+
+    def reset_requests(self):
+        counts = dict(self.requests)
+        self.requests.clear()
+        return counts
@@ -0,0 +1,161 @@
+"""
+Check `uam upgrade --all` swaps the bin folder to a new generation at once:
+
+    python benchmarks/generations.py --apps 100
+
+While apps are upgraded, the bin folder is polled and must only ever hold
+all the old or all the new shims. Unchanged shims must be hardlinks of the
+previous generation's ones, `uam system rollback` must restore the old shims,
+and only the configured number of generations may be kept. The exit code is
+1 when any check fails.
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from fake_docker import API_VERSION
+from suite import BENCH_FORMULA, BenchEnv, populate
+
+
+def snapshot(bin_path):
+    """Returns a digest of the names and contents of every shim in bin_path."""
+    # a shell resolves the bin folder once per lookup of a command.
+    while True:
+        try:
+            folder_fd = os.open(bin_path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        break
+
+    def opener(path, flags):
+        return os.open(path, flags, dir_fd=folder_fd)
+
+    try:
+        digest = hashlib.sha1()
+        for name in sorted(os.listdir(folder_fd)):
+            if name.startswith("bench-"):
+                with open(name, "rb", opener=opener) as f_handler:
+                    digest.update(name.encode() + f_handler.read())
+        return digest.hexdigest()
+    except FileNotFoundError:
+        # a shim listed a moment ago is gone.
+        return None
+    finally:
+        os.close(folder_fd)
+
+
+def store_shims():
+    from uam.entities.app import generate_app_shims
+    from uam.adapters.database.gateway import DatabaseGateway
+    from uam.adapters.database.models import db
+    from uam.adapters.system.gateway import SystemGateway
+
+    for app in DatabaseGateway.list_apps():
+        SystemGateway.store_app_shims(generate_app_shims(app, api_version=API_VERSION))
+    db.close()
+
+
+def change_formulas(apps):
+    from uam.settings import TAP_PATH, FORMULA_FOLDER_NAME
+
+    for index in range(0, apps, 2):
+        path = os.path.join(TAP_PATH, "tap0", FORMULA_FOLDER_NAME, f"bench{index}", "1.1.0.yml")
+        with open(path, "w") as f_handler:
+            f_handler.write(BENCH_FORMULA.format(index=index).replace(
+                "container_arguments: bench", "container_arguments: upgraded"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", type=int, default=100)
+    parser.add_argument("--budget", type=float, default=1500,
+                        help="slowest allowed rollback, in ms.")
+    args = parser.parse_args()
+
+    work_path = tempfile.mkdtemp(prefix="uam-generations-")
+    bench_env = BenchEnv(work_path)
+    failures = []
+
+    def check(name, ok):
+        print(f"{'ok' if ok else 'FAILED'}: {name}")
+        if not ok:
+            failures.append(name)
+
+    try:
+        populate(bench_env, args.apps, 1, 2)
+        store_shims()
+        change_formulas(args.apps)
+        uam_path = os.path.join(bench_env.home, ".uam")
+        bin_path = os.path.join(uam_path, "bin")
+        generations_path = os.path.join(uam_path, ".bin.generations")
+        before = snapshot(bin_path)
+
+        seen, reads, done = set(), [0], threading.Event()
+
+        def poll():
+            while not done.is_set():
+                seen.add(snapshot(bin_path))
+                reads[0] += 1
+
+        poller = threading.Thread(target=poll)
+        poller.start()
+        started = time.perf_counter()
+        try:
+            bench_env.run([sys.executable, "-m", "uam", "upgrade", "--all"])
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            done.set()
+            poller.join()
+        after = snapshot(bin_path)
+        print(f"upgrade took {elapsed:.0f}ms, the bin folder was read {reads[0]} times")
+        check("upgraded shims are changed", after != before)
+        check("shells only see the old or the new shims", seen <= {before, after})
+        check("the bin folder is a symlink to a generation", os.path.islink(bin_path))
+
+        previous_path = os.path.join(generations_path, "0")
+        unchanged = [f"bench-{index}" for index in range(1, args.apps, 2)]
+        hardlinked = [
+            n for n in unchanged
+            if os.path.exists(os.path.join(previous_path, n)) and
+            os.stat(os.path.join(bin_path, n)).st_ino ==
+            os.stat(os.path.join(previous_path, n)).st_ino
+        ]
+        check(f"unchanged shims are hardlinked ({len(hardlinked)} of {len(unchanged)})",
+              len(hardlinked) == len(unchanged))
+
+        elapsed, _ = bench_env.uam("system", "rollback")
+        check(f"rollback restores the old shims ({elapsed:.0f}ms)", snapshot(bin_path) == before)
+        check(f"rollback takes at most {args.budget:.0f}ms", elapsed <= args.budget)
+        _, process = bench_env.run([sys.executable, "-m", "uam", "system", "rollback"],
+                                   check=False)
+        check("rollback past the first generation is refused",
+              b"no previous generation" in process.stdout + process.stderr)
+
+        from uam.settings import BIN_GENERATIONS_KEEP
+        from uam.adapters.system.gateway import SystemGateway
+        for _ in range(BIN_GENERATIONS_KEEP + 2):
+            with SystemGateway.stage_bin_folders():
+                SystemGateway.store_app_shims({"bench-extra": "#!/bin/sh\n"})
+        kept = [n for n in os.listdir(generations_path) if n.isdigit()]
+        check(f"old generations are collected ({len(kept)} kept)",
+              len(kept) == BIN_GENERATIONS_KEEP)
+        check("no staged generation is left",
+              not [n for n in os.listdir(generations_path) if n.startswith(".staging-")])
+        check("no temporary symlink is left",
+              not [n for n in os.listdir(uam_path) if n.startswith(".bin.") and
+                   n != ".bin.generations"])
+    finally:
+        bench_env.close()
+        shutil.rmtree(work_path, ignore_errors=True)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
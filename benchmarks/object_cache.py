@@ -0,0 +1,86 @@
+"""
+Check verify mode shims trust the docker objects earlier shims found:
+
+    python benchmarks/object_cache.py
+
+A second run of a shim must not look its image, network and volume up
+again. A shim failing to create its container with an image removed behind
+its back must pull it and succeed, and an object docker reports removed must
+be looked up again by the next shim. The exit code is 1 when any check fails.
+"""
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from suite import BenchEnv, render_shims
+
+
+LOOKUPS = ("inspect_image", "inspect_network", "inspect_volume")
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+def main():
+    work_path = tempfile.mkdtemp(prefix="uam-object-cache-")
+    bench_env = BenchEnv(work_path)
+    failures = []
+
+    def check(name, ok):
+        print(f"{'ok' if ok else 'FAILED'}: {name}")
+        if not ok:
+            failures.append(name)
+
+    def run_shim():
+        bench_env.docker.reset_requests()
+        _, process = bench_env.run([shim_path, "--bench"], stdin=b"", check=False)
+        requests = bench_env.docker.reset_requests()
+        if process.returncode != 0:
+            print(process.stderr.decode(errors="replace"), file=sys.stderr)
+        return process.returncode, requests
+
+    try:
+        shim_path = render_shims(bench_env)["verify"]
+        code, first = run_shim()
+        check(f"first run looks docker objects up ({sum(first.values())} requests)",
+              code == 0 and all(first.get(n) for n in LOOKUPS))
+        code, second = run_shim()
+        check(f"second run trusts them ({sum(second.values())} requests)",
+              code == 0 and not any(second.get(n) for n in LOOKUPS))
+
+        bench_env.docker.pull_seconds = 0
+        bench_env.docker.missing_images.add("busybox:latest")
+        code, _ = run_shim()
+        check("a removed image is pulled once creating the container fails",
+              code == 0 and bench_env.docker.pulls["busybox:latest"] == 1)
+
+        from uam.settings import GLOBAL_NETWORK_NAME
+        from uam.adapters.docker.client import get_docker_client
+        from uam.adapters.docker.object_cache import read_objects, watch_events
+        stop_event = threading.Event()
+        threading.Thread(target=watch_events, args=(get_docker_client(), stop_event),
+                         daemon=True).start()
+        check("docker events are watched", wait_for(lambda: bench_env.docker.subscribers))
+        bench_env.docker.publish_event("network", "destroy", GLOBAL_NETWORK_NAME)
+        check("a removed network is forgotten",
+              wait_for(lambda: f"network:{GLOBAL_NETWORK_NAME}" not in read_objects()))
+        stop_event.set()
+        code, third = run_shim()
+        check("only the forgotten network is looked up again",
+              code == 0 and {n: third[n] for n in LOOKUPS if third.get(n)} ==
+              {"inspect_network": 1})
+    finally:
+        bench_env.close()
+        shutil.rmtree(work_path, ignore_errors=True)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+Check `uam pull --all` against images missing from a fake docker engine:
+
+    python benchmarks/pull.py --apps 40 --images 8
+
+Apps share a few images under different spellings of the same reference, and
+two `uam pull --all` run at the same time. Every image must be pulled exactly
+once. The exit code is 1 when any check fails.
+"""
+import argparse
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from suite import BenchEnv, populate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", type=int, default=40)
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--pull-seconds", type=float, default=0.5,
+                        help="time the fake engine takes to pull an image.")
+    args = parser.parse_args()
+
+    work_path = tempfile.mkdtemp(prefix="uam-pull-")
+    bench_env = BenchEnv(work_path)
+    failures = []
+
+    def check(name, ok):
+        print(f"{'ok' if ok else 'FAILED'}: {name}")
+        if not ok:
+            failures.append(name)
+
+    try:
+        populate(bench_env, args.apps, 1, 1)
+        from uam.adapters.database.models import App, db
+        images = set()
+        for index in range(args.apps):
+            number = index % args.images
+            # `bench/0` and `bench/0:latest` are the same image.
+            image = f"bench/{number}" if index % 2 else f"bench/{number}:latest"
+            App.update(image=image).where(App.name == f"bench{index}").execute()
+            images.add(f"bench/{number}:latest")
+        db.close()
+        bench_env.docker.missing_images.update(images)
+        bench_env.docker.pull_seconds = args.pull_seconds
+
+        started = time.perf_counter()
+        processes = [
+            subprocess.Popen([sys.executable, "-m", "uam", "pull", "--all"], env=bench_env.env,
+                             cwd=work_path, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            for _ in range(2)
+        ]
+        outputs = [p.communicate() for p in processes]
+        elapsed = time.perf_counter() - started
+        for process, (_, stderr) in zip(processes, outputs):
+            if process.returncode != 0:
+                print(stderr.decode(errors="replace"), file=sys.stderr)
+        check(f"concurrent pulls succeed ({elapsed:.1f}s)",
+              all(p.returncode == 0 for p in processes))
+        check("every image is pulled", not bench_env.docker.missing_images)
+        pulls = bench_env.docker.pulls
+        check(f"every image is pulled once ({sum(pulls.values())} pulls of {len(images)} images)",
+              set(pulls) == images and set(pulls.values()) == {1})
+
+        elapsed, _ = bench_env.uam("pull", "--all")
+        check(f"pulled images are not pulled again ({elapsed:.0f}ms)",
+              sum(pulls.values()) == len(images))
+    finally:
+        bench_env.close()
+        shutil.rmtree(work_path, ignore_errors=True)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Count the sqlite queries issued by uam's database gateway while the number
+of installed apps grows, e.g.
+
+    python benchmarks/queries.py --sizes 10,100,1000,5000
+
+Listing apps or reading one app's detail must take the same number of
+queries at every size, the exit code is 1 otherwise.
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from suite import REPO_PATH, BENCH_FORMULA
+
+
+class QueryCounter(logging.Handler):
+    """Counts the queries peewee logs at debug level."""
+
+    def __init__(self):
+        super(QueryCounter, self).__init__(logging.DEBUG)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+def measure(counter, func):
+    counter.count = 0
+    started = time.perf_counter()
+    func()
+    return counter.count, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000,5000",
+                        help="comma separated numbers of installed apps.")
+    args = parser.parse_args()
+    sizes = sorted(int(s) for s in args.sizes.split(","))
+
+    work_path = tempfile.mkdtemp(prefix="uam-queries-")
+    os.environ["HOME"] = work_path
+    sys.path.insert(0, REPO_PATH)
+    from uam.entities.app import create_app
+    from uam.adapters.database.gateway import DatabaseGateway
+    from uam.adapters.database.models import db
+
+    counter = QueryCounter()
+    peewee_logger = logging.getLogger("peewee")
+    peewee_logger.setLevel(logging.DEBUG)
+    peewee_logger.addHandler(counter)
+
+    rows, stored = [], 0
+    try:
+        DatabaseGateway.assure_tables()
+        for size in sizes:
+            with db.atomic():
+                for index in range(stored, size):
+                    DatabaseGateway.store_app(create_app(
+                        "tap", "core", f"bench{index}", "1.0.0", BENCH_FORMULA.format(index=index)))
+            stored = size
+            list_queries, list_ms = measure(counter, lambda: DatabaseGateway.list_apps())
+            detail_queries, detail_ms = measure(
+                counter, lambda: DatabaseGateway.get_app_detail(f"bench{size - 1}"))
+            rows.append((size, list_queries, list_ms, detail_queries, detail_ms))
+    finally:
+        db.close()
+        shutil.rmtree(work_path, ignore_errors=True)
+
+    print(f"{'apps':>6} {'list queries':>13} {'list ms':>9} {'detail queries':>15} {'detail ms':>10}")
+    for size, list_queries, list_ms, detail_queries, detail_ms in rows:
+        print(f"{size:>6} {list_queries:>13} {list_ms:>9.1f} {detail_queries:>15} {detail_ms:>10.1f}")
+
+    if len({r[1] for r in rows}) > 1 or len({r[3] for r in rows}) > 1:
+        print("query count grows with the number of apps.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
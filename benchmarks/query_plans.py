@@ -0,0 +1,65 @@
+"""
+Check with EXPLAIN QUERY PLAN that the hot lookups of uam's database
+gateway are served by indexes of a freshly migrated uam.db:
+
+    python benchmarks/query_plans.py
+
+The exit code is 1 when any of them scans a table.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+from suite import REPO_PATH
+
+
+def hot_queries():
+    from uam.adapters.database.models import App, EntryPoint, Volume
+
+    aliases = ["ls", "grep"]
+    return {
+        "get_app_id, unpinned": App.select().where(
+            (App.name == "bench") & (App.pinned == False) & (App.venv == "")),
+        "get_app_detail, pinned": App.select().where(
+            (App.name == "bench") & (App.pinned == True) &
+            (App.pinned_version == "1.0.0") & (App.venv == "")),
+        "list_apps": App.select().where(App.venv == ""),
+        "list_apps, related rows": Volume.select(Volume.app, Volume.name).join(App).where(
+            App.venv == ""),
+        "get_conflicted_entrypoints": EntryPoint.select().join(App).where(
+            (EntryPoint.alias << aliases) & (EntryPoint.enabled == True) & (App.venv == "")),
+        "get_active_entrypoints": EntryPoint.select().where(
+            (EntryPoint.app == 1) & (EntryPoint.enabled == True)),
+    }
+
+
+def main():
+    work_path = tempfile.mkdtemp(prefix="uam-plans-")
+    os.environ["HOME"] = work_path
+    sys.path.insert(0, REPO_PATH)
+    from uam.adapters.database.gateway import DatabaseGateway
+    from uam.adapters.database.models import db
+
+    scans = []
+    try:
+        DatabaseGateway.assure_tables()
+        for name, query in hot_queries().items():
+            sql, params = query.sql()
+            plan = [row[-1] for row in db.execute_sql("EXPLAIN QUERY PLAN " + sql, params)]
+            print(f"{name}:")
+            for detail in plan:
+                print(f"    {detail}")
+            if any(detail.startswith("SCAN") for detail in plan):
+                scans.append(name)
+    finally:
+        db.close()
+        shutil.rmtree(work_path, ignore_errors=True)
+
+    for name in scans:
+        print(f"{name} scans instead of using an index.", file=sys.stderr)
+    return 1 if scans else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
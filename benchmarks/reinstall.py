@@ -0,0 +1,77 @@
+"""
+Check `uam reinstall` of a local app with many entrypoints only rewrites the
+shims whose content changed:
+
+    python benchmarks/reinstall.py --entrypoints 40
+
+The exit code is 1 when any check fails.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+from suite import BenchEnv
+
+
+def write_formula(path, entrypoints, changed_index=None):
+    with open(path, "w") as f_handler:
+        f_handler.write("description: reinstall benchmark\nimage: busybox:latest\nentrypoints:\n")
+        for index in range(entrypoints):
+            arguments = "changed" if index == changed_index else "bench"
+            f_handler.write(f"  reinstall-{index}:\n    container_entrypoint: echo\n"
+                            f"    container_arguments: {arguments}\n")
+
+
+def snapshot(bin_path):
+    return {
+        e.name: (e.inode(), e.stat().st_mtime_ns)
+        for e in os.scandir(bin_path) if e.name.startswith("reinstall-")
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entrypoints", type=int, default=40)
+    args = parser.parse_args()
+
+    work_path = tempfile.mkdtemp(prefix="uam-reinstall-")
+    bench_env = BenchEnv(work_path)
+    failures = []
+
+    def check(name, ok):
+        print(f"{'ok' if ok else 'FAILED'}: {name}")
+        if not ok:
+            failures.append(name)
+
+    try:
+        formula_path = os.path.join(work_path, "reinstall.yml")
+        bin_path = os.path.join(bench_env.home, ".uam", "bin")
+        write_formula(formula_path, args.entrypoints)
+        bench_env.uam("install", formula_path, stdin=b"n\n")
+        installed = snapshot(bin_path)
+        check(f"{args.entrypoints} shims are installed", len(installed) == args.entrypoints)
+
+        elapsed, _ = bench_env.uam("app", "reinstall", "reinstall", formula_path)
+        unchanged = snapshot(bin_path)
+        check(f"unchanged reinstall writes no shim ({elapsed:.0f}ms)", unchanged == installed)
+
+        write_formula(formula_path, args.entrypoints, changed_index=0)
+        elapsed, _ = bench_env.uam("app", "reinstall", "reinstall", formula_path)
+        changed = snapshot(bin_path)
+        written = sorted(n for n in changed if changed[n] != unchanged[n])
+        check(f"changed reinstall writes the changed shim only ({elapsed:.0f}ms)",
+              written == ["reinstall-0"])
+        check("no temporary shim is left",
+              not [n for n in os.listdir(bin_path) if n.startswith(".")])
+    finally:
+        bench_env.close()
+        shutil.rmtree(work_path, ignore_errors=True)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
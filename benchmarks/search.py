@@ -0,0 +1,93 @@
+"""
+Measure `uam search` lookups against a formula index of many taps, e.g.
+
+    python benchmarks/search.py --formulas 100000 --taps 20
+
+Search entries are stored straight into the database, without formula files.
+The exit code is 1 when the slowest query takes longer than --budget ms.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from suite import REPO_PATH
+
+
+WORDS = ("docker", "python", "node", "lint", "format", "http", "server", "client",
+         "database", "shell", "build", "test", "cloud", "image", "proxy", "cache")
+QUERIES = ("python", "lint py", "http server", "do", "cloud proxy cache", "nomatch")
+
+
+def build_entries(count):
+    for index in range(count):
+        words = [WORDS[(index * p) % len(WORDS)] for p in (1, 3, 7)]
+        yield {
+            "app_name": f"{words[0]}-{index}",
+            "version": "1.0.0",
+            "description": f"a {words[1]} tool for {words[2]} work",
+            "aliases": f"{words[0]} {words[0]}-{words[1]}",
+            "image": f"bench/{words[2]}:{index}",
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--formulas", type=int, default=100000)
+    parser.add_argument("--taps", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=50,
+                        help="slowest allowed query, in ms.")
+    args = parser.parse_args()
+
+    work_path = tempfile.mkdtemp(prefix="uam-search-")
+    os.environ["HOME"] = work_path
+    sys.path.insert(0, REPO_PATH)
+    from uam.usecases.search import search_formulas
+    from uam.adapters.database.gateway import DatabaseGateway
+    from uam.adapters.database.models import db
+
+    timings = {}
+    try:
+        DatabaseGateway.assure_tables()
+        per_tap = args.formulas // args.taps
+        started = time.perf_counter()
+        for t in range(args.taps):
+            alias = f"tap{t}"
+            DatabaseGateway.store_tap({"alias": alias, "priority": t,
+                                       "address": f"https://example.com/{alias}.git"})
+            entries = [
+                {**e, "app_name": f"{e['app_name']}-{t}"}
+                for e in build_entries(per_tap)
+            ]
+            DatabaseGateway.store_formula_index(alias, [], search_entries=entries)
+        print(f"indexed {per_tap * args.taps} formulas in {time.perf_counter() - started:.1f}s")
+
+        for query in QUERIES:
+            samples = []
+            for _ in range(args.rounds):
+                started = time.perf_counter()
+                results = search_formulas(DatabaseGateway, query)
+                samples.append((time.perf_counter() - started) * 1000)
+            timings[query] = (min(samples), max(samples), len(results))
+    finally:
+        db.close()
+        shutil.rmtree(work_path, ignore_errors=True)
+
+    print(f"{'query':<20} {'min ms':>8} {'max ms':>8} {'results':>8}")
+    for query, (fastest, slowest, count) in timings.items():
+        print(f"{query:<20} {fastest:>8.1f} {slowest:>8.1f} {count:>8}")
+
+    slowest = max(t[1] for t in timings.values())
+    if slowest > args.budget:
+        print(f"slowest search took {slowest:.1f}ms, over the {args.budget}ms budget.",
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
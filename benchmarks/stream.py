@@ -0,0 +1,92 @@
+"""
+Compare the throughput of a shim's raw streaming mode with the dockerpty
+path by piping random data through an installed app, e.g. one whose
+entrypoint is `cat`:
+
+    python benchmarks/stream.py ~/.uam/bin/cat --size 256
+
+Without a shim, data is streamed through the shims rendered by the benchmark
+suite against the fake docker API instead, whose containers echo stdin. The
+exit code is then 1 unless the output is intact and every container saw the
+end of its stdin.
+"""
+import argparse
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+MODES = ("stream", "pty")
+
+
+def run_shim(shim, mode, data_path, env=None):
+    env = {**(env or os.environ), "UAM_SHIM_MODE": mode}
+    digest = hashlib.sha1()
+    started = time.perf_counter()
+    with open(data_path, "rb") as stdin:
+        process = subprocess.Popen([shim], stdin=stdin, stdout=subprocess.PIPE, env=env)
+        for chunk in iter(lambda: process.stdout.read(1024 * 1024), b""):
+            digest.update(chunk)
+        process.wait()
+    return time.perf_counter() - started, digest.hexdigest(), process.returncode
+
+
+def check_fake(data_path, expected, size):
+    """Stream data_path through shims served by the fake docker API."""
+    import shutil
+    from suite import BenchEnv, render_shims
+
+    work_path = tempfile.mkdtemp(prefix="uam-stream-")
+    bench_env = BenchEnv(work_path)
+    failures = []
+    try:
+        for variant, shim in render_shims(bench_env).items():
+            eofs = bench_env.docker.stdin_eofs
+            elapsed, digest, returncode = run_shim(shim, "stream", data_path, bench_env.env)
+            ok = (digest == expected and returncode == 0 and
+                  bench_env.docker.stdin_eofs == eofs + 1)
+            print(f"{'ok' if ok else 'FAILED'}: {variant:>8} {size / elapsed:8.1f} MB/s, "
+                  f"output {'intact' if digest == expected else 'mangled'}, "
+                  f"end of stdin {'seen' if bench_env.docker.stdin_eofs > eofs else 'lost'}")
+            if not ok:
+                failures.append(variant)
+    finally:
+        bench_env.close()
+        shutil.rmtree(work_path, ignore_errors=True)
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("shim", nargs="?",
+                        help="path of a shim which copies stdin to stdout.")
+    parser.add_argument("--size", type=int, default=64, help="MB of data to pipe through.")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile() as data:
+        expected = hashlib.sha1()
+        for _ in range(args.size):
+            chunk = os.urandom(1024 * 1024)
+            expected.update(chunk)
+            data.write(chunk)
+        data.flush()
+
+        if not args.shim:
+            return check_fake(data.name, expected.hexdigest(), args.size)
+        for mode in MODES:
+            best = None
+            for _ in range(args.rounds):
+                elapsed, digest, returncode = run_shim(args.shim, mode, data.name)
+                best = elapsed if best is None else min(best, elapsed)
+            intact = "intact" if digest == expected.hexdigest() else "mangled"
+            print(f"{mode:>6}: {args.size / best:8.1f} MB/s, output {intact}, "
+                  f"exit code {returncode}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
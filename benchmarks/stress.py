@@ -0,0 +1,80 @@
+"""
+Run concurrent `uam install` and `uam uninstall` processes against one
+uam.db and a fake docker API, e.g.
+
+    python benchmarks/stress.py --processes 32 --iterations 5
+
+Every worker installs and uninstalls its own local formula. The exit code
+is 1 when any command failed or apps are left behind in the database.
+"""
+import argparse
+import concurrent.futures
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from suite import BENCH_FORMULA, BenchEnv, populate
+
+
+ERROR_MARKS = ("😟", "🏚", "🐞", "database is locked")
+
+
+def run_worker(bench_env, formula_path, iterations):
+    name = os.path.splitext(os.path.basename(formula_path))[0]
+    failures = []
+    for _ in range(iterations):
+        for args, stdin in ((["install", formula_path], b"n\n"), (["uninstall", name], None)):
+            _, process = bench_env.run([sys.executable, "-m", "uam", *args],
+                                       stdin=stdin, check=False)
+            output = (process.stdout + process.stderr).decode(errors="replace")
+            if process.returncode != 0 or any(mark in output for mark in ERROR_MARKS):
+                marked = [line for line in output.splitlines()
+                          if any(mark in line for mark in ERROR_MARKS)]
+                failures.append(f"uam {' '.join(args)}: {(marked or output.splitlines() or [''])[-1]}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=32)
+    parser.add_argument("--iterations", type=int, default=5,
+                        help="install and uninstall rounds of every worker.")
+    args = parser.parse_args()
+
+    work_path = tempfile.mkdtemp(prefix="uam-stress-")
+    bench_env = BenchEnv(work_path)
+    try:
+        populate(bench_env, 0, 1, 0)
+        formula_paths = []
+        for index in range(args.processes):
+            path = os.path.join(work_path, f"stress{index}.yml")
+            with open(path, "w") as f_handler:
+                f_handler.write(BENCH_FORMULA.format(index=f"stress{index}"))
+            formula_paths.append(path)
+
+        started = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(args.processes) as executor:
+            results = executor.map(lambda p: run_worker(bench_env, p, args.iterations),
+                                   formula_paths)
+            failures = [f for worker_failures in results for f in worker_failures]
+        elapsed = time.perf_counter() - started
+
+        from uam.adapters.database.gateway import DatabaseGateway
+        left = [app["name"] for app in DatabaseGateway.list_apps()]
+    finally:
+        bench_env.close()
+        shutil.rmtree(work_path, ignore_errors=True)
+
+    commands = args.processes * args.iterations * 2
+    print(f"{commands} commands from {args.processes} processes in {elapsed:.1f}s, "
+          f"{len(failures)} failed, {len(left)} apps left in database.")
+    for failure in failures:
+        print(f"failed: {failure}", file=sys.stderr)
+    return 1 if failures or left else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+"""
+Startup benchmarks of uam against a fake docker API, checked against
+per-phase budgets:
+
+    python benchmarks/suite.py --apps 1000 --taps 20 --output results.json
+
+It measures `python -X importtime` of the cli entry point, cold and warm
+latency of `uam ls`, `uam tap ls` and `uam install` with a pre-populated
+database, and the import, lookup, create and attach phases of rendered
+shims, next to an alias linked to the launcher of the launcher backend, which
+reads its options from the launcher's table. Cold runs start with an empty bytecode cache, warm runs reuse it.
+Results are written as json and the exit code is 1 when a budget of
+benchmarks/budgets.json is exceeded.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from fake_docker import API_VERSION, FakeDockerServer
+
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGETS_PATH = os.path.join(REPO_PATH, "benchmarks", "budgets.json")
+# uam itself is imported lazily, after HOME points to the benchmark's folder.
+sys.path.insert(0, REPO_PATH)
+IMPORTTIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+SHIM_PHASES = ("import", "lookup", "create", "attach")
+
+BENCH_FORMULA = """
+description: benchmark app {index}
+image: busybox:latest
+environments:
+  - [BENCH, "1"]
+  - ["@", "/^LC_/"]
+volumes:
+  - path: /data
+entrypoints:
+  bench-{index}:
+    container_entrypoint: echo
+    container_arguments: bench
+"""
+
+
+class BenchEnv:
+    """
+    A throwaway HOME with a fake docker socket, under which uam and its shims
+    are run as subprocesses.
+    """
+
+    def __init__(self, work_path):
+        self.work_path = work_path
+        self.home = os.path.join(work_path, "home")
+        os.makedirs(self.home)
+        self.docker = FakeDockerServer(os.path.join(work_path, "docker.sock")).start()
+        self.pycache = os.path.join(work_path, "pycache")
+        self.env = {
+            **os.environ,
+            "HOME": self.home,
+            "DOCKER_HOST": f"unix://{self.docker.socket_path}",
+            "PYTHONPATH": os.pathsep.join(filter(None, [REPO_PATH, os.getenv("PYTHONPATH")])),
+            "PYTHONPYCACHEPREFIX": self.pycache,
+        }
+        for name in ("UAM_VENV", "UAM_SHIM_MODE", "UAM_SHIM_PROFILE", "DOCKER_TLS_VERIFY"):
+            self.env.pop(name, None)
+        # uam.settings resolves its paths from HOME when it is imported.
+        os.environ.update({k: self.env[k] for k in ("HOME", "DOCKER_HOST")})
+
+    def clear_bytecode(self):
+        shutil.rmtree(self.pycache, ignore_errors=True)
+
+    def run(self, args, stdin=None, extra_env=None, check=True):
+        started = time.perf_counter()
+        process = subprocess.run(args, input=stdin, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE, env={**self.env, **(extra_env or {})},
+                                 cwd=self.work_path)
+        elapsed = (time.perf_counter() - started) * 1000
+        if check and process.returncode != 0:
+            raise RuntimeError(f"{' '.join(args)} failed with {process.returncode}:\n"
+                               f"{process.stderr.decode(errors='replace')}")
+        return elapsed, process
+
+    def uam(self, *args, stdin=None):
+        return self.run([sys.executable, "-m", "uam", *args], stdin=stdin)
+
+    def close(self):
+        self.docker.stop()
+
+
+def populate(bench_env, apps, taps, versions):
+    """
+    Store `apps` apps and `taps` taps into uam's database, the formulas of the
+    apps are spread over the taps with `versions` versions each.
+    """
+    from uam.settings import TAP_PATH, FORMULA_FOLDER_NAME
+    from uam.entities.app import create_app
+    from uam.usecases.tap import index_tap
+    from uam.adapters.database.gateway import DatabaseGateway
+    from uam.adapters.database.models import db
+    from uam.adapters.system.gateway import SystemGateway
+
+    DatabaseGateway.assure_tables()
+    tap_names = [f"tap{t}" for t in range(taps)]
+    for priority, tap_name in enumerate(tap_names):
+        DatabaseGateway.store_tap({"alias": tap_name, "priority": priority,
+                                   "address": f"https://example.com/{tap_name}.git"})
+        os.makedirs(os.path.join(TAP_PATH, tap_name, FORMULA_FOLDER_NAME), exist_ok=True)
+    for index in range(apps):
+        folder = os.path.join(TAP_PATH, tap_names[index % taps], FORMULA_FOLDER_NAME,
+                              f"bench{index}")
+        os.makedirs(folder)
+        for minor in range(versions):
+            with open(os.path.join(folder, f"1.{minor}.0.yml"), "w") as f_handler:
+                f_handler.write(BENCH_FORMULA.format(index=index))
+    for tap_name in tap_names:
+        index_tap(SystemGateway, DatabaseGateway, tap_name)
+
+    with db.atomic():
+        for index in range(apps):
+            app = create_app("tap", tap_names[index % taps], f"bench{index}", "1.0.0",
+                             BENCH_FORMULA.format(index=index))
+            DatabaseGateway.store_app(app)
+    db.close()
+    return tap_names
+
+
+def measure_importtime(bench_env, rounds):
+    totals, uam_totals, modules = [], [], {}
+    for _ in range(rounds):
+        _, process = bench_env.run([sys.executable, "-X", "importtime", "-m", "uam", "--help"])
+        total = uam_total = 0
+        for line in process.stderr.decode().splitlines():
+            matched = IMPORTTIME_PATTERN.match(line)
+            if not matched:
+                continue
+            cumulative, indent, name = int(matched.group(2)), matched.group(3), matched.group(4)
+            if len(indent) <= 1:
+                total += cumulative
+                if name.split(".")[0] == "uam":
+                    uam_total += cumulative
+                modules.setdefault(name, []).append(cumulative / 1000)
+        totals.append(total / 1000)
+        uam_totals.append(uam_total / 1000)
+    slowest = sorted(((statistics.median(v), k) for k, v in modules.items()), reverse=True)
+    return {
+        "total_ms": round(statistics.median(totals), 3),
+        "uam_ms": round(statistics.median(uam_totals), 3),
+        "slowest": [{"module": k, "cumulative_ms": round(v, 3)} for v, k in slowest[:10]],
+    }
+
+
+def measure_command(bench_env, rounds, args, stdin=None, cleanup=None):
+    requests = []
+
+    def timed():
+        bench_env.docker.reset_requests()
+        elapsed, _ = bench_env.uam(*args, stdin=stdin)
+        requests.append(sum(bench_env.docker.reset_requests().values()))
+        if cleanup:
+            bench_env.uam(*cleanup)
+        return elapsed
+
+    bench_env.clear_bytecode()
+    cold = timed()
+    warm = [timed() for _ in range(rounds)]
+    return {"cold_ms": round(cold, 3), "warm_ms": round(statistics.median(warm), 3),
+            "requests": max(requests[1:])}
+
+
+def measure_shim(bench_env, rounds, shim_path):
+    from uam.settings import DOCKER_API_VERSION_CACHE_PATH, DOCKER_OBJECT_CACHE_PATH
+
+    profile_path = os.path.join(bench_env.work_path, "shim-profile.jsonl")
+    walls, requests = [], []
+    for path in (profile_path, DOCKER_API_VERSION_CACHE_PATH, DOCKER_OBJECT_CACHE_PATH):
+        if os.path.exists(path):
+            os.remove(path)
+    for _ in range(rounds):
+        bench_env.docker.reset_requests()
+        elapsed, _ = bench_env.run([shim_path, "--bench"], stdin=b"",
+                                   extra_env={"UAM_SHIM_PROFILE": profile_path})
+        walls.append(elapsed)
+        requests.append(sum(bench_env.docker.reset_requests().values()))
+    with open(profile_path) as f_handler:
+        profiles = [json.loads(line) for line in f_handler if line.strip()]
+
+    result = {
+        f"{phase}_ms": round(statistics.median(p.get(phase, 0) for p in profiles), 3)
+        for phase in SHIM_PHASES
+    }
+    # what the shim can not see: interpreter startup and teardown.
+    result["total_ms"] = round(statistics.median(walls), 3)
+    # the first run negotiates the api version and looks docker objects up,
+    # later runs reuse what it cached.
+    result["cold_requests"] = requests[0]
+    result["requests"] = max(requests[1:] or requests)
+    return result
+
+
+def render_shims(bench_env):
+    from uam.entities.app import (create_app, generate_app_shims, generate_launcher,
+                                  generate_launcher_entries)
+    from uam.adapters.system.gateway import SystemGateway
+
+    bin_path = os.path.join(bench_env.work_path, "shims")
+    os.makedirs(bin_path, exist_ok=True)
+    app = create_app("local", None, "shimbench", None, BENCH_FORMULA.format(index="shim"))
+    paths = {}
+    for variant, api_version in (("compiled", API_VERSION), ("verify", None)):
+        shims = generate_app_shims(app, api_version=api_version)
+        path = os.path.join(bin_path, variant)
+        with open(path, "w") as f_handler:
+            f_handler.write(shims["bench-shim"])
+        os.chmod(path, 0o755)
+        paths[variant] = path
+
+    launcher_path = os.path.join(bin_path, "launcher")
+    SystemGateway.store_launcher_entries(
+        generate_launcher(), generate_launcher_entries(app, api_version=API_VERSION),
+        venv_path=launcher_path)
+    paths["launcher"] = os.path.join(launcher_path, "bench-shim")
+    return paths
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def check_budgets(results, budgets):
+    flat = flatten(results)
+    exceeded = []
+    for key, budget in sorted(budgets.items()):
+        if key not in flat:
+            print(f"budget {key} has no measurement.", file=sys.stderr)
+        elif flat[key] > budget:
+            exceeded.append(f"{key}: {flat[key]} > {budget}")
+    return exceeded
+
+
+def run_suite(args, bench_env):
+    results = {"scale": {"apps": args.apps, "taps": args.taps, "versions": args.versions}}
+    print(f"populating {args.apps} apps in {args.taps} taps ...", file=sys.stderr)
+    populate(bench_env, args.apps, args.taps, args.versions)
+
+    print("measuring import time ...", file=sys.stderr)
+    results["importtime"] = measure_importtime(bench_env, args.rounds)
+
+    print("measuring cli latency ...", file=sys.stderr)
+    # installed without a tap name, so every tap's formula folder is looked up.
+    target = f"bench{args.apps - 1}"
+    bench_env.uam("uninstall", target)
+    results["cli"] = {
+        "ls": measure_command(bench_env, args.rounds, ["ls"]),
+        "tap_ls": measure_command(bench_env, args.rounds, ["tap", "ls"]),
+        "install": measure_command(bench_env, args.rounds, ["install", target],
+                                   stdin=b"n\n", cleanup=["uninstall", target]),
+    }
+
+    print("measuring shim phases ...", file=sys.stderr)
+    results["shim"] = {
+        variant: measure_shim(bench_env, args.rounds, path)
+        for variant, path in render_shims(bench_env).items()
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", type=int, default=1000, help="apps stored in the database.")
+    parser.add_argument("--taps", type=int, default=20, help="taps the formulas are spread over.")
+    parser.add_argument("--versions", type=int, default=3, help="versions of every formula.")
+    parser.add_argument("--rounds", type=int, default=5, help="warm runs of every measurement.")
+    parser.add_argument("--output", default="bench-results.json")
+    parser.add_argument("--budgets", default=BUDGETS_PATH)
+    args = parser.parse_args()
+
+    work_path = tempfile.mkdtemp(prefix="uam-bench-")
+    bench_env = BenchEnv(work_path)
+    try:
+        results = run_suite(args, bench_env)
+    finally:
+        bench_env.close()
+        shutil.rmtree(work_path, ignore_errors=True)
+
+    with open(args.output, "w") as f_handler:
+        json.dump(results, f_handler, indent=2)
+    print(json.dumps(results, indent=2))
+
+    with open(args.budgets) as f_handler:
+        exceeded = check_budgets(results, json.load(f_handler))
+    for line in exceeded:
+        print(f"over budget: {line}", file=sys.stderr)
+    return 1 if exceeded else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
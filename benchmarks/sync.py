@@ -0,0 +1,89 @@
+"""
+Measure `uam sync` of a lockfile against apps stored by the benchmark suite:
+
+    python benchmarks/sync.py --apps 100 --taps 5
+
+The first sync upgrades every installed app and installs half of them again
+into another venv, the second one finds nothing to do. The exit code is 1
+when any check fails, or when the second sync takes longer than --budget ms.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+from suite import BenchEnv, populate
+
+
+def write_lockfile(path, apps, taps, version):
+    with open(path, "w") as f_handler:
+        f_handler.write("venvs:\n  - web\napps:\n")
+        for index in range(apps):
+            f_handler.write(f"  - {{name: bench{index}, tap: tap{index % taps}, "
+                            f"version: {version}}}\n")
+        for index in range(0, apps, 2):
+            f_handler.write(f"  - {{name: bench{index}, tap: tap{index % taps}, "
+                            f"version: 1.0.0, pinned: '~1.0', venv: web}}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", type=int, default=100)
+    parser.add_argument("--taps", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1000,
+                        help="slowest allowed sync of converged apps, in ms.")
+    args = parser.parse_args()
+
+    work_path = tempfile.mkdtemp(prefix="uam-sync-")
+    bench_env = BenchEnv(work_path)
+    failures = []
+
+    def check(name, ok):
+        print(f"{'ok' if ok else 'FAILED'}: {name}")
+        if not ok:
+            failures.append(name)
+
+    try:
+        populate(bench_env, args.apps, args.taps, 2)
+        lockfile = os.path.join(work_path, "uam.lock")
+        write_lockfile(lockfile, args.apps, args.taps, "1.1.0")
+
+        bench_env.docker.reset_requests()
+        elapsed, _ = bench_env.uam("sync", lockfile)
+        print(f"first sync took {elapsed:.0f}ms")
+        from uam.adapters.database.gateway import DatabaseGateway
+        from uam.adapters.database.models import db
+        apps = DatabaseGateway.list_apps()
+        check("installed apps are upgraded", len(apps) == args.apps and
+              {a["version"] for a in apps} == {"1.1.0"})
+        web_apps = DatabaseGateway.list_apps(venv="web")
+        check("locked apps are installed into their venvs",
+              len(web_apps) == (args.apps + 1) // 2 and
+              {a["pinned_version"] for a in web_apps} == {"~1.0"})
+        web_path = os.path.join(bench_env.home, ".uam", "venvs", "web")
+        check("shims of installed apps are generated",
+              os.path.exists(os.path.join(web_path, "bench-0")))
+        db.close()
+
+        bench_env.docker.reset_requests()
+        elapsed, _ = bench_env.uam("sync", lockfile)
+        requests = sum(bench_env.docker.reset_requests().values())
+        check(f"converged sync takes {elapsed:.0f}ms", elapsed <= args.budget)
+        check(f"converged sync makes no docker requests ({requests})", requests == 0)
+
+        write_lockfile(lockfile, args.apps // 2, args.taps, "1.1.0")
+        bench_env.uam("sync", "--prune", lockfile)
+        check("pruned apps are uninstalled",
+              len(DatabaseGateway.list_apps()) == args.apps // 2)
+        db.close()
+    finally:
+        bench_env.close()
+        shutil.rmtree(work_path, ignore_errors=True)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Check how `uam tap add` and `uam tap update` sync taps from file:// repos:
+
+    python benchmarks/tap_sync.py
+
+An update of an unchanged tap must not fetch, an update of a changed tap
+must leave a single commit of history, and a tap added with
+UAM_TAP_SPARSE_CHECKOUT=1 must only check out its formula folder, besides the
+files at its root. The exit code is
+1 when any check fails.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from suite import BENCH_FORMULA, BenchEnv
+
+
+def git(repo_path, *args):
+    return subprocess.run(["git", "-c", "user.name=bench", "-c", "user.email=bench@uam",
+                           *args], cwd=repo_path, check=True,
+                          stdout=subprocess.PIPE).stdout.decode().strip()
+
+
+def commit_formula(origin, app_name, version):
+    folder = os.path.join(origin, "Formula", app_name)
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, f"{version}.yml"), "w") as f_handler:
+        f_handler.write(BENCH_FORMULA.format(index=app_name))
+    git(origin, "add", "-A")
+    git(origin, "commit", "-q", "-m", f"{app_name} {version}")
+
+
+def main():
+    work_path = tempfile.mkdtemp(prefix="uam-tap-sync-")
+    bench_env = BenchEnv(work_path)
+    failures = []
+
+    def check(name, ok):
+        print(f"{'ok' if ok else 'FAILED'}: {name}")
+        if not ok:
+            failures.append(name)
+
+    try:
+        origin = os.path.join(work_path, "origin")
+        os.makedirs(origin)
+        git(origin, "init", "-q")
+        os.makedirs(os.path.join(origin, "docs"))
+        with open(os.path.join(origin, "docs", "README.md"), "w") as f_handler:
+            f_handler.write("not a formula\n")
+        commit_formula(origin, "bench", "1.0.0")
+        commit_formula(origin, "bench", "1.1.0")
+        address = f"file://{origin}"
+        taps_path = os.path.join(bench_env.home, ".uam", "taps")
+
+        bench_env.uam("tap", "add", "full", address)
+        # taps may not share an address, the trailing slash tells them apart.
+        bench_env.run([sys.executable, "-m", "uam", "tap", "add", "sparse", address + "/"],
+                      extra_env={"UAM_TAP_SPARSE_CHECKOUT": "1"})
+        full, sparse = os.path.join(taps_path, "full"), os.path.join(taps_path, "sparse")
+        check("full tap checks out every file", os.path.exists(os.path.join(full, "docs")))
+        check("sparse tap checks out formulas only",
+              not os.path.exists(os.path.join(sparse, "docs")) and
+              os.path.exists(os.path.join(sparse, "Formula", "bench", "1.1.0.yml")))
+
+        fetch_head = os.path.join(full, ".git", "FETCH_HEAD")
+        elapsed, _ = bench_env.uam("tap", "update", "full")
+        check(f"unchanged tap is not fetched ({elapsed:.0f}ms)", not os.path.exists(fetch_head))
+
+        commit_formula(origin, "bench", "2.0.0")
+        os.remove(os.path.join(origin, "Formula", "bench", "1.0.0.yml"))
+        git(origin, "commit", "-q", "-a", "-m", "drop bench 1.0.0")
+        head = git(origin, "rev-parse", "HEAD")
+        for alias, path in (("full", full), ("sparse", sparse)):
+            elapsed, _ = bench_env.uam("tap", "update", alias)
+            check(f"changed {alias} tap is at the remote's HEAD ({elapsed:.0f}ms)",
+                  git(path, "rev-parse", "HEAD") == head)
+            check(f"changed {alias} tap keeps a single commit",
+                  git(path, "rev-list", "--count", "HEAD") == "1")
+            check(f"changed {alias} tap has the new formulas",
+                  sorted(os.listdir(os.path.join(path, "Formula", "bench"))) ==
+                  ["1.1.0.yml", "2.0.0.yml"])
+        check("sparse tap still checks out formulas only",
+              not os.path.exists(os.path.join(sparse, "docs")))
+
+        from uam.adapters.database.gateway import DatabaseGateway
+        for alias in ("full", "sparse"):
+            index = DatabaseGateway.get_formula_index("bench", [alias])
+            check(f"{alias} tap's index holds the new versions",
+                  sorted(index.get(alias, {})) == ["1.1.0", "2.0.0"])
+    finally:
+        bench_env.close()
+        shutil.rmtree(work_path, ignore_errors=True)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -33,7 +33,113 @@ def test(ctx):
     status("begining to run test cases ...")
 
 
-@task(lint)
+@task
+def bench_stream(ctx, shim="", size=64):
+    """
+    Compare shim throughput of the raw streaming mode and the dockerpty path,
+    or check streaming through shims against a fake docker API without shim.
+    """
+    status(f"piping {size}MB through {shim or 'fake docker shims'} ...")
+    ctx.run(f"python benchmarks/stream.py {shim} --size {size}")
+
+
+@task
+def bench(ctx, apps=1000, taps=20, rounds=5, output="bench-results.json"):
+    """
+    Benchmark cli and shim startup against a fake docker API, failing when a
+    budget of benchmarks/budgets.json is exceeded.
+    """
+    status(f"benchmarking with {apps} apps in {taps} taps ...")
+    ctx.run(f"python benchmarks/suite.py --apps {apps} --taps {taps} "
+            f"--rounds {rounds} --output {output}")
+    status(f"benchmark results written to {output}.")
+
+
+@task
+def bench_queries(ctx, sizes="10,100,1000,5000"):
+    """
+    Check the number of sqlite queries of listing apps stays constant and the
+    hot lookups are served by indexes.
+    """
+    status(f"counting queries with {sizes} apps installed ...")
+    ctx.run(f"python benchmarks/queries.py --sizes {sizes}")
+    status("checking query plans ...")
+    ctx.run("python benchmarks/query_plans.py")
+
+
+@task
+def bench_stress(ctx, processes=32, iterations=5):
+    """
+    Run concurrent installs and uninstalls against one uam database.
+    """
+    status(f"running {processes} concurrent uam processes ...")
+    ctx.run(f"python benchmarks/stress.py --processes {processes} --iterations {iterations}")
+
+
+@task
+def bench_search(ctx, formulas=100000, taps=20):
+    """
+    Measure full-text search over the formula index of many taps.
+    """
+    status(f"searching {formulas} formulas of {taps} taps ...")
+    ctx.run(f"python benchmarks/search.py --formulas {formulas} --taps {taps}")
+
+
+@task
+def bench_tap_sync(ctx):
+    """
+    Check taps are synced with shallow fetches, skipped when unchanged.
+    """
+    status("syncing taps from file:// repos ...")
+    ctx.run("python benchmarks/tap_sync.py")
+
+
+@task
+def bench_pull(ctx, apps=40, images=8):
+    """
+    Check images shared by apps are pulled once, even by concurrent pulls.
+    """
+    status(f"pulling {images} images of {apps} apps ...")
+    ctx.run(f"python benchmarks/pull.py --apps {apps} --images {images}")
+
+
+@task
+def bench_sync(ctx, apps=100, taps=5):
+    """
+    Check `uam sync` applies a lockfile, and is fast once apps match it.
+    """
+    status(f"syncing {apps} apps of {taps} taps with a lockfile ...")
+    ctx.run(f"python benchmarks/sync.py --apps {apps} --taps {taps}")
+
+
+@task
+def bench_reinstall(ctx, entrypoints=40):
+    """
+    Check reinstalling an app only rewrites the shims which changed.
+    """
+    status(f"reinstalling an app of {entrypoints} entrypoints ...")
+    ctx.run(f"python benchmarks/reinstall.py --entrypoints {entrypoints}")
+
+
+@task
+def bench_generations(ctx, apps=100):
+    """
+    Check bulk upgrades swap the bin folder at once, and can be rolled back.
+    """
+    status(f"upgrading {apps} apps into a new bin folder generation ...")
+    ctx.run(f"python benchmarks/generations.py --apps {apps}")
+
+
+@task
+def bench_object_cache(ctx):
+    """
+    Check shims trust docker objects found before, until they are removed.
+    """
+    status("running shims against known docker objects ...")
+    ctx.run("python benchmarks/object_cache.py")
+
+
+@task(lint, bench)
 def build(ctx):
     """
     Build uam project to a single executable file using pyinstaller.
@@ -7,4 +7,12 @@ class TapAliasConflict(Exception):
 
 
 class TapAddressConflict(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class SearchUnavailable(Exception):
+    pass
+
+
+class DatabaseLocked(Exception):
+    pass
@@ -1,30 +1,96 @@
+import contextlib
+import datetime
 import logging
-from functools import reduce
+import random
+import time
+from functools import reduce, wraps
 
-from uam.settings import db
+from peewee import OperationalError
 
-from .models import Tap, App, EntryPoint, Volume, Config
+from uam.settings import DB_WRITE_RETRIES, DB_WRITE_RETRY_DELAY
+
+from .models import (db, Tap, App, EntryPoint, Volume, Config, TapIndex, Formula,
+                     FORMULA_SEARCH_TABLE, FORMULA_SEARCH_COLUMNS)
+from .migrations import migrate_database
 from .exceptions import (AppNotExist, TapAliasConflict,
-                         TapAddressConflict)
+                         TapAddressConflict, SearchUnavailable, DatabaseLocked)
 
 
 logger = logging.getLogger(__name__)
 
+FORMULA_INSERT_BATCH = 100
+# bm25 weights of formula search columns, matching app names rank first.
+FORMULA_SEARCH_WEIGHTS = (0, 10.0, 0, 1.0, 5.0, 2.0)
+
+
+def _retry_when_locked(func):
+    """
+    Retry a write with exponential backoff when other uam processes keep the
+    database locked for longer than sqlite's busy timeout. Writes inside a
+    transaction are not retried, the whole transaction is.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if db.transaction_depth():
+            return func(*args, **kwargs)
+        for attempt in range(DB_WRITE_RETRIES + 1):
+            try:
+                return func(*args, **kwargs)
+            except (OperationalError, DatabaseLocked) as error:
+                if 'locked' not in str(error) or attempt == DB_WRITE_RETRIES:
+                    raise
+                delay = DB_WRITE_RETRY_DELAY * 2 ** attempt * (1 + random.random())
+                logger.warning(f"database is locked, retrying {func.__name__} in {delay:.2f}s ...")
+                time.sleep(delay)
+    return wrapper
+
 
 class DatabaseGateway:
     AppNotExist = AppNotExist
     TapAliasConflict = TapAliasConflict
     TapAddressConflict = TapAddressConflict
+    SearchUnavailable = SearchUnavailable
+    DatabaseLocked = DatabaseLocked
 
     @staticmethod
+    @_retry_when_locked
     def assure_tables():
-        db.create_tables([Tap, App, EntryPoint, Volume, Config], safe=True)
+        migrate_database(db)
+
+    @staticmethod
+    @_retry_when_locked
+    def run_in_transaction(func):
+        """
+        Call func inside a transaction and return its result. The whole
+        transaction is run again when the database is locked, so func must
+        only write to the database.
+        """
+        with db.atomic():
+            return func()
 
     @staticmethod
+    @contextlib.contextmanager
+    def savepoint():
+        """
+        Returns a context manager rolling the writes inside it back when it
+        fails, while the transaction around it goes on. A locked database
+        raises DatabaseLocked, which fails the whole transaction instead.
+        """
+        try:
+            with db.atomic():
+                yield
+        except OperationalError as error:
+            if 'locked' in str(error):
+                raise DatabaseLocked(str(error))
+            raise
+
+    @staticmethod
+    @_retry_when_locked
     def store_tap(tap):
         Tap.create(**tap)
 
     @staticmethod
+    @_retry_when_locked
     def delete_tap(alias):
         tap = Tap.get(Tap.alias == alias)
         tap.delete_instance()
@@ -40,6 +106,129 @@ class DatabaseGateway:
             for t in Tap.select()
         ]
 
+    @staticmethod
+    @_retry_when_locked
+    def store_formula_index(alias, formulas, revision=None, search_entries=()):
+        with db.atomic():
+            Formula.delete().where(Formula.tap_alias == alias).execute()
+            TapIndex.delete().where(TapIndex.alias == alias).execute()
+            _insert_formulas(alias, formulas)
+            _store_search_entries(alias, search_entries)
+            TapIndex.create(alias=alias, revision=revision)
+
+    @staticmethod
+    @_retry_when_locked
+    def update_formula_index(alias, formulas, removed_paths, revision,
+                             search_entries=(), search_apps=()):
+        with db.atomic():
+            for i in range(0, len(removed_paths), FORMULA_INSERT_BATCH):
+                Formula.delete().where(
+                    (Formula.tap_alias == alias) &
+                    (Formula.path << removed_paths[i:i + FORMULA_INSERT_BATCH])
+                ).execute()
+            _insert_formulas(alias, formulas)
+            _store_search_entries(alias, search_entries, app_names=list(search_apps))
+            TapIndex.update(revision=revision, indexed_at=datetime.datetime.now()).where(
+                TapIndex.alias == alias).execute()
+
+    @staticmethod
+    def get_tap_revision(alias):
+        index = TapIndex.select(TapIndex.revision).where(TapIndex.alias == alias).first()
+        return index.revision if index else None
+
+    @staticmethod
+    @_retry_when_locked
+    def delete_formula_index(alias):
+        with db.atomic():
+            Formula.delete().where(Formula.tap_alias == alias).execute()
+            TapIndex.delete().where(TapIndex.alias == alias).execute()
+            _store_search_entries(alias, ())
+
+    @staticmethod
+    def get_formula_index(app_name, aliases):
+        """
+        Returns versions of app's formula mapped to their paths for every
+        indexed tap among aliases, taps which are not indexed are left out.
+        """
+        index = {
+            t.alias: {} for t in TapIndex.select().where(TapIndex.alias << aliases)
+        }
+        if not index:
+            return index
+        for f in Formula.select().where((Formula.app_name == app_name) &
+                                        (Formula.tap_alias << list(index))):
+            index[f.tap_alias][f.version] = f.path
+        return index
+
+    @staticmethod
+    def get_tap_formulas(alias, app_names):
+        """Returns indexed formulas of the named apps inside tap."""
+        app_names = list(app_names)
+        formulas = []
+        for i in range(0, len(app_names), FORMULA_INSERT_BATCH):
+            formulas.extend(Formula.select(Formula.app_name, Formula.version, Formula.path).where(
+                (Formula.tap_alias == alias) &
+                (Formula.app_name << app_names[i:i + FORMULA_INSERT_BATCH])).dicts())
+        return formulas
+
+    @staticmethod
+    def search_formulas(match_query, aliases, limit):
+        """
+        Returns formulas of taps among aliases which match the fts5 query,
+        ordered by the position of their tap in aliases and by relevance.
+        """
+        if not _search_table_exists():
+            raise SearchUnavailable()
+        if not aliases:
+            return []
+        columns = ', '.join(FORMULA_SEARCH_COLUMNS)
+        placeholders = ', '.join('?' for _ in aliases)
+        tap_order = ' '.join(f'WHEN ? THEN {i}' for i in range(len(aliases)))
+        weights = ', '.join(str(w) for w in FORMULA_SEARCH_WEIGHTS)
+        cursor = db.execute_sql(
+            f"SELECT {columns} FROM {FORMULA_SEARCH_TABLE} "
+            f"WHERE {FORMULA_SEARCH_TABLE} MATCH ? AND tap_alias IN ({placeholders}) "
+            f"ORDER BY CASE tap_alias {tap_order} END, bm25({FORMULA_SEARCH_TABLE}, {weights}) "
+            "LIMIT ?",
+            [match_query, *aliases, *aliases, limit])
+        return [dict(zip(FORMULA_SEARCH_COLUMNS, row)) for row in cursor]
+
+    @staticmethod
+    def get_formula_versions(alias):
+        """
+        Returns indexed versions of every formula inside tap which belongs to
+        an installed app, keyed by app name.
+        """
+        installed_names = App.select(App.name).where(App.tap_alias == alias)
+        versions = {}
+        for app_name, version in Formula.select(Formula.app_name, Formula.version).where(
+                (Formula.tap_alias == alias) & (Formula.app_name << installed_names)).tuples():
+            versions.setdefault(app_name, []).append(version)
+        return versions
+
+    @staticmethod
+    def get_installed_formula_versions(venv=""):
+        """
+        Returns indexed versions of the formulas of every app installed in
+        venv, keyed by tap alias and app name.
+        """
+        installed_names = App.select(App.name).where(App.venv == venv)
+        versions = {}
+        for tap_alias, app_name, version in Formula.select(
+                Formula.tap_alias, Formula.app_name, Formula.version).where(
+                    Formula.app_name << installed_names).tuples():
+            versions.setdefault(tap_alias, {}).setdefault(app_name, []).append(version)
+        return versions
+
+    @staticmethod
+    def list_tap_apps(alias):
+        return [
+            {'name': a.name, 'version': a.version, 'venv': a.venv,
+             'pinned_version': a.pinned_version}
+            for a in App.select(App.name, App.version, App.venv, App.pinned_version).where(
+                App.tap_alias == alias)
+        ]
+
     @staticmethod
     def valid_tap_conflict(alias, address):
         if Tap.select().where(Tap.alias == alias):
@@ -108,28 +297,42 @@ class DatabaseGateway:
             msg = f"app {name} not found in database: {error}"
             logger.error(msg)
             raise AppNotExist(msg)
-        return _build_app_data(app)
+        return _build_apps_data([app], App.id == app.id)[0]
 
     @staticmethod
     def retrieve_app_detail(app_id):
         app = App.get(App.id == app_id)
-        return _build_app_data(app)
+        return _build_apps_data([app], App.id == app.id)[0]
 
     @staticmethod
     def list_apps(venv=""):
+        condition = App.venv == venv
+        return _build_apps_data(App.select().where(condition), condition)
+
+    @staticmethod
+    def list_app_images(app_names=None, venv=None):
+        """
+        Returns name, venv, pin and image of the named apps, or of all apps,
+        inside venv, or inside all venvs when venv is None.
+        """
+        query = App.select(App.name, App.venv, App.pinned_version, App.image)
+        if app_names is not None:
+            query = query.where(App.name << list(app_names))
+        if venv is not None:
+            query = query.where(App.venv == venv)
         return [
-            _build_app_data(app) for app in App.select().where(
-                App.venv == venv
-            )
+            {'name': a.name, 'venv': a.venv, 'pinned_version': a.pinned_version, 'image': a.image}
+            for a in query
         ]
 
     @staticmethod
+    @_retry_when_locked
     def store_app(app):
-        entrypoints = app.pop('entrypoints')
-        volumes = app.pop('volumes')
-        configs = app.pop('configs')
+        entrypoints, volumes, configs = app['entrypoints'], app['volumes'], app['configs']
         with db.atomic():
-            app_model = App.create(**app)
+            app_model = App.create(**{
+                k: v for k, v in app.items() if k not in ('entrypoints', 'volumes', 'configs')
+            })
             if entrypoints:
                 EntryPoint.insert_many(
                     [{**e, **{'app': app_model.id}} for e in entrypoints]
@@ -144,10 +347,12 @@ class DatabaseGateway:
                 ).execute()
 
     @staticmethod
+    @_retry_when_locked
     def update_app_meta(app_id, changed_data):
         App.update(**changed_data).where(App.id == app_id).execute()
 
     @staticmethod
+    @_retry_when_locked
     def delete_app(app_id):
         App.get(App.id == app_id).delete_instance(recursive=True)
 
@@ -174,22 +379,26 @@ class DatabaseGateway:
         ]
 
     @staticmethod
+    @_retry_when_locked
     def enable_entrypoints(app_id, aliases):
         EntryPoint.update(enabled=True).where(
             (EntryPoint.alias << aliases) & (EntryPoint.app == app_id)
         ).execute()
 
     @staticmethod
+    @_retry_when_locked
     def disable_entrypoints(aliases, venv=""):
         EntryPoint.update(enabled=False).join(App).where(
            (EntryPoint.alias << aliases) & (App.venv == venv)).execute()
 
     @staticmethod
+    @_retry_when_locked
     def delete_entrypoints(app_id, aliases):
         EntryPoint.delete().where(
             (EntryPoint.app == app_id) & (EntryPoint.alias << aliases)).execute()
 
     @staticmethod
+    @_retry_when_locked
     def store_entrypoints(app_id, entrypoints):
         if not entrypoints:
             return
@@ -208,11 +417,13 @@ class DatabaseGateway:
         ]
 
     @staticmethod
+    @_retry_when_locked
     def delete_volumes(app_id, vol_names):
         Volume.delete().where(
             (Volume.name << vol_names) & (Volume.app == app_id)).execute()
 
     @staticmethod
+    @_retry_when_locked
     def store_volumes(app_id, volumes):
         if not volumes:
             return
@@ -221,6 +432,7 @@ class DatabaseGateway:
         ).execute()
 
     @staticmethod
+    @_retry_when_locked
     def delete_configs(app_id, configs):
         query = reduce(lambda x, y: x | y, [
             Config.host_path == c["host_path"] &
@@ -231,6 +443,7 @@ class DatabaseGateway:
         Config.delete().where(query).execute()
 
     @staticmethod
+    @_retry_when_locked
     def store_configs(app_id, configs):
         if not configs:
             return
@@ -239,8 +452,40 @@ class DatabaseGateway:
         ).execute()
 
 
+def _build_apps_data(apps, condition):
+    """
+    Build data of apps along with their volumes, configs and entrypoints. The
+    related rows are fetched with one query per table joined on condition,
+    which must select the same apps, and grouped by app id in python.
+    """
+    apps_data = {app.id: _build_app_data(app) for app in apps}
+
+    volumes = Volume.select(Volume.app, Volume.name, Volume.path).join(App).where(condition)
+    for app_id, name, path in volumes.tuples():
+        apps_data[app_id]['volumes'].append({'name': name, 'path': path})
+
+    configs = (Config.select(Config.app, Config.host_path, Config.container_path)
+               .join(App).where(condition))
+    for app_id, host_path, container_path in configs.tuples():
+        apps_data[app_id]['configs'].append(
+            {'host_path': host_path, 'container_path': container_path})
+
+    entrypoints = (EntryPoint.select(EntryPoint.app, EntryPoint.alias,
+                                     EntryPoint.container_entrypoint,
+                                     EntryPoint.container_arguments, EntryPoint.enabled)
+                   .join(App).where(condition).order_by(EntryPoint.id))
+    for app_id, alias, container_entrypoint, container_arguments, enabled in entrypoints.tuples():
+        apps_data[app_id]['entrypoints'].append({
+            'alias': alias,
+            'container_entrypoint': container_entrypoint,
+            'container_arguments': container_arguments,
+            'enabled': enabled,
+        })
+    return list(apps_data.values())
+
+
 def _build_app_data(app):
-    app_data = {
+    return {
         "id": app.id,
         'name': app.name,
         'source_type': app.source_type,
@@ -251,21 +496,46 @@ def _build_app_data(app):
         'shell': app.shell,
         'environments': app.environments,
         'pinned': app.pinned,
-        'pinned_version': app.pinned_version
+        'pinned_version': app.pinned_version,
+        'pool': app.pool,
+        'shim_backend': app.shim_backend,
+        'volumes': [],
+        'configs': [],
+        'entrypoints': [],
     }
-    app_data['volumes'] = [
-        {'name': v.name, 'path': v.path} for v in app.volumes
-    ]
-    app_data['configs'] = [
-        {'host_path': c.host_path, 'container_path': c.container_path}
-        for c in app.configs
-    ]
-    app_data['entrypoints'] = [
-        {
-            'alias': e.alias,
-            'container_entrypoint': e.container_entrypoint,
-            'container_arguments': e.container_arguments,
-            'enabled': e.enabled
-        } for e in app.entrypoints
-    ]
-    return app_data
\ No newline at end of file
+
+
+def _search_table_exists():
+    return FORMULA_SEARCH_TABLE in db.get_tables()
+
+
+def _store_search_entries(alias, entries, app_names=None):
+    """
+    Replace search entries of the named apps of tap, or of all its apps when
+    app_names is None, with entries.
+    """
+    if not _search_table_exists():
+        return
+    if app_names is None:
+        db.execute_sql(f"DELETE FROM {FORMULA_SEARCH_TABLE} WHERE tap_alias = ?", [alias])
+    for i in range(0, len(app_names or []), FORMULA_INSERT_BATCH):
+        batch = app_names[i:i + FORMULA_INSERT_BATCH]
+        db.execute_sql(
+            f"DELETE FROM {FORMULA_SEARCH_TABLE} WHERE tap_alias = ? "
+            f"AND app_name IN ({', '.join('?' for _ in batch)})", [alias, *batch])
+    columns = ', '.join(FORMULA_SEARCH_COLUMNS)
+    row = f"({', '.join('?' for _ in FORMULA_SEARCH_COLUMNS)})"
+    entries = list(entries)
+    for i in range(0, len(entries), FORMULA_INSERT_BATCH):
+        batch = entries[i:i + FORMULA_INSERT_BATCH]
+        db.execute_sql(
+            f"INSERT INTO {FORMULA_SEARCH_TABLE} ({columns}) VALUES {', '.join(row for _ in batch)}",
+            [v for e in batch for v in (alias, *(e[c] for c in FORMULA_SEARCH_COLUMNS[1:]))])
+
+
+def _insert_formulas(alias, formulas):
+    # stay below sqlite's limit of variables per statement.
+    for i in range(0, len(formulas), FORMULA_INSERT_BATCH):
+        Formula.insert_many([
+            {**f, 'tap_alias': alias} for f in formulas[i:i + FORMULA_INSERT_BATCH]
+        ]).execute()
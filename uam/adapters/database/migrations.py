@@ -0,0 +1,103 @@
+"""
+Schema migrations of uam.db. Migrations run in order, each inside its own
+transaction, and the number of applied migrations is kept in sqlite's
+user_version pragma, so databases of any older uam version are brought up
+to date the first time they are opened.
+"""
+import fcntl
+import logging
+
+from peewee import OperationalError
+from playhouse.migrate import SqliteMigrator
+
+from .models import (Tap, App, EntryPoint, Volume, Config, TapIndex, Formula,
+                     FORMULA_SEARCH_TABLE)
+
+
+logger = logging.getLogger(__name__)
+
+
+def _create_tables(db, migrator):
+    """create tables"""
+    db.create_tables([Tap, App, EntryPoint, Volume, Config], safe=True)
+
+
+def _add_app_pool_and_shim_backend(db, migrator):
+    """add app's pool and shim_backend columns"""
+    _add_columns(db, migrator, App, [App.pool, App.shim_backend])
+
+
+def _add_lookup_indexes(db, migrator):
+    """add indexes for app and entrypoint lookups"""
+    _add_index(db, migrator, App, ['venv', 'name', 'pinned', 'pinned_version'])
+    _add_index(db, migrator, EntryPoint, ['alias', 'enabled'])
+
+
+def _create_formula_index_tables(db, migrator):
+    """create formula index tables"""
+    db.create_tables([TapIndex, Formula], safe=True)
+
+
+def _add_tap_index_revision(db, migrator):
+    """add tap index's revision column"""
+    _add_columns(db, migrator, TapIndex, [TapIndex.revision])
+
+
+def _create_formula_search_table(db, migrator):
+    """create formula search table"""
+    try:
+        db.execute_sql(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FORMULA_SEARCH_TABLE} USING fts5("
+            "tap_alias UNINDEXED, app_name, version UNINDEXED, description, aliases, image, "
+            "prefix='2 3')")
+    except OperationalError as error:
+        logger.warning(f"sqlite has no fts5 support, uam search is disabled: {error}")
+        return
+    # make the next tap update index already indexed taps again for searching.
+    TapIndex.update(revision=None).execute()
+
+
+MIGRATIONS = [
+    _create_tables,
+    _add_app_pool_and_shim_backend,
+    _add_lookup_indexes,
+    _create_formula_index_tables,
+    _add_tap_index_revision,
+    _create_formula_search_table,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(db):
+    return db.execute_sql('PRAGMA user_version').fetchone()[0]
+
+
+def migrate_database(db):
+    if get_schema_version(db) >= SCHEMA_VERSION:
+        return
+    # other uam processes may be opening the same outdated database.
+    with open(db.database + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        version = get_schema_version(db)
+        migrator = SqliteMigrator(db)
+        for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+            logger.info(f"migrating database to version {number}, {migration.__doc__} ...")
+            with db.atomic():
+                migration(db, migrator)
+                db.execute_sql(f'PRAGMA user_version = {number}')
+
+
+def _add_columns(db, migrator, model, fields):
+    # tables created by a later migration's models already have the columns.
+    table = model._meta.db_table
+    existed_columns = {c.name for c in db.get_columns(table)}
+    for field in fields:
+        if field.db_column not in existed_columns:
+            migrator.add_column(table, field.db_column, field).run()
+
+
+def _add_index(db, migrator, model, columns, unique=False):
+    table = model._meta.db_table
+    existed_indexes = {tuple(i.columns) for i in db.get_indexes(table)}
+    if tuple(columns) not in existed_indexes:
+        migrator.add_index(table, columns, unique=unique).run()
@@ -1,9 +1,35 @@
+import datetime
 import json
+import os
 
-from peewee import (Model, ForeignKeyField, CharField,
-                    TextField, BooleanField, IntegerField)
+from peewee import (Model, ForeignKeyField, CharField, SqliteDatabase,
+                    TextField, BooleanField, IntegerField, DateTimeField)
 
-from uam.settings import db
+from uam.settings import DB_PATH, DB_PRAGMAS
+
+
+class UamDatabase(SqliteDatabase):
+    """
+    Sqlite database which creates its folder when the first connection is
+    opened instead of at import time, and migrates the schema once per
+    process.
+    """
+    migrated = False
+
+    def _connect(self, *args, **kwargs):
+        os.makedirs(os.path.dirname(self.database), exist_ok=True)
+        return super(UamDatabase, self)._connect(*args, **kwargs)
+
+    def connect(self, *args, **kwargs):
+        result = super(UamDatabase, self).connect(*args, **kwargs)
+        if not self.migrated:
+            self.migrated = True
+            from .migrations import migrate_database  # noqa, migrations import the models
+            migrate_database(self)
+        return result
+
+
+db = UamDatabase(DB_PATH, pragmas=DB_PRAGMAS)
 
 
 APP_SOURCE_TYPES = (
@@ -39,6 +65,8 @@ class App(Model):
     image = TextField()
     environments = JSONField(default='[]')
     shell = CharField(max_length=128, default='sh')
+    pool = JSONField(default=dict)
+    shim_backend = CharField(max_length=32, default='python')
     pinned = BooleanField(default=False)
     pinned_version = CharField(max_length=128)
     venv = CharField(max_length=128, default="")
@@ -82,4 +110,35 @@ class Config(Model):
         database = db
         indexes = (
             (('app', 'container_path'), True),
-        )
\ No newline at end of file
+        )
+
+
+class TapIndex(Model):
+    alias = CharField(max_length=128, unique=True)
+    revision = CharField(max_length=64, null=True)
+    indexed_at = DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        database = db
+
+
+# fts5 virtual table holding the latest formula of every app of every tap,
+# created by migrations since peewee models can not describe it.
+FORMULA_SEARCH_TABLE = 'formula_search'
+FORMULA_SEARCH_COLUMNS = ('tap_alias', 'app_name', 'version', 'description',
+                          'aliases', 'image')
+
+
+class Formula(Model):
+    tap_alias = CharField(max_length=128)
+    app_name = CharField(max_length=64)
+    version = CharField(max_length=128)
+    path = TextField()
+    content_hash = CharField(max_length=64)
+
+    class Meta:
+        database = db
+        indexes = (
+            (('app_name', 'tap_alias', 'version'), True),
+            (('tap_alias',), False),
+        )
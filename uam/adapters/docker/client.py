@@ -0,0 +1,60 @@
+import functools
+import json
+import logging
+import os
+import tempfile
+import time
+
+from uam.settings import DOCKER_API_VERSION_CACHE_PATH, DOCKER_API_VERSION_CACHE_TTL
+
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def get_docker_client():
+    """
+    The docker client shared by the adapters, created on first use so
+    commands which never talk to docker do not pay for it. Its api version
+    is negotiated once per docker host and cached on disk, shims included,
+    so later processes skip the `/version` round trip, and its connections
+    to the engine are kept alive between requests.
+    """
+    import docker  # noqa, importing docker takes longer than most commands run
+
+    api_version = read_api_version()
+    client = docker.DockerClient(version=api_version or 'auto',
+                                 **docker.utils.kwargs_from_env())
+    if not api_version:
+        store_api_version(client.api.api_version)
+    return client
+
+
+def read_api_version(path=DOCKER_API_VERSION_CACHE_PATH):
+    try:
+        with open(path) as f_handler:
+            entry = json.load(f_handler).get(os.getenv('DOCKER_HOST', ''))
+    except (OSError, ValueError):
+        return None
+    if not entry or entry['expires_at'] < time.time():
+        return None
+    return entry['version']
+
+
+def store_api_version(api_version, path=DOCKER_API_VERSION_CACHE_PATH):
+    try:
+        with open(path) as f_handler:
+            versions = json.load(f_handler)
+    except (OSError, ValueError):
+        versions = {}
+    versions[os.getenv('DOCKER_HOST', '')] = {
+        'version': api_version,
+        'expires_at': time.time() + DOCKER_API_VERSION_CACHE_TTL,
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                     prefix=f'{os.path.basename(path)}.')
+    with os.fdopen(fd, 'w') as f_handler:
+        json.dump(versions, f_handler)
+    os.replace(temp_path, path)
+    logger.info(f"docker api version {api_version} negotiated.")
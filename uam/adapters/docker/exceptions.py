@@ -0,0 +1,6 @@
+class DockerServiceUnavailable(Exception):
+    pass
+
+
+class ImagePullFailed(Exception):
+    pass
@@ -1,30 +1,48 @@
+import contextlib
 import logging
-import subprocess
 
-import docker
-
-from uam.settings import docker_client
+from .client import get_docker_client
+from .object_cache import forget_objects
+from .exceptions import DockerServiceUnavailable, ImagePullFailed
 
 
 logger = logging.getLogger(__name__)
 
 
 class DockerServiceGateway:
+    DockerServiceUnavailable = DockerServiceUnavailable
+    ImagePullFailed = ImagePullFailed
 
     @staticmethod
-    def assure_network(network_name, labels={}):
+    def get_api_version():
+        """
+        Returns the api version the shared client talks, which is only
+        negotiated with docker when it is not cached yet.
+        """
         try:
-            docker_client.networks.get(network_name)
-        except docker.errors.NotFound:
-            logger.info(f'creating docker network {network_name} ...')
-            docker_client.networks.create(network_name, driver="bridge",
-                                          labels=labels)
+            return get_docker_client().api.api_version
+        except Exception as error:
+            msg = f"docker service is not available: {error}"
+            logger.warning(msg)
+            raise DockerServiceUnavailable(msg)
+
+    @staticmethod
+    def assure_network(network_name, labels={}):
+        import docker
+        with _docker_service():
+            try:
+                get_docker_client().networks.get(network_name)
+            except docker.errors.NotFound:
+                logger.info(f'creating docker network {network_name} ...')
+                get_docker_client().networks.create(network_name, driver="bridge",
+                                                    labels=labels)
 
     @staticmethod
     def delete_volume(vol_name):
+        import docker
         logger.info(f'removing docker volume {vol_name} ...')
         try:
-            vol = docker_client.volumes.get(vol_name)
+            vol = get_docker_client().volumes.get(vol_name)
         except docker.errors.NotFound:
             logger.warning(f'volume {vol_name} not found.')
             return
@@ -33,6 +51,7 @@ class DockerServiceGateway:
 
     @staticmethod
     def delete_volumes(vol_names):
+        import docker
         for v in vol_names:
             try:
                 DockerServiceGateway.delete_volume(v)
@@ -40,15 +59,26 @@ class DockerServiceGateway:
                 logger.info(f"volume {v} not found, skipping it ...")
             except docker.errors.APIError as err:
                 logger.warning(f"volume {v} delete error: {err}")
+        forget_objects('volume', vol_names)
+
+    @staticmethod
+    def assure_volume(vol_name, labels={}):
+        import docker
+        with _docker_service():
+            try:
+                get_docker_client().volumes.get(vol_name)
+            except docker.errors.NotFound:
+                DockerServiceGateway.create_volume(vol_name, labels)
 
     @staticmethod
     def create_volume(vol_name, labels={}):
         logger.info(f"creating docker volume {vol_name} ...")
-        docker_client.volumes.create(vol_name, labels=labels)
+        get_docker_client().volumes.create(vol_name, labels=labels)
         logger.info(f"volume {vol_name} created.")
 
     @staticmethod
     def create_volumes(vol_names, labels={}):
+        import docker
         for v in vol_names:
             try:
                 DockerServiceGateway.create_volume(v, labels)
@@ -56,6 +86,73 @@ class DockerServiceGateway:
                 logger.warning(f"volume {v} create error: {err}")
 
     @staticmethod
-    def pull_image(image_name):
+    def list_containers(labels):
+        with _docker_service():
+            containers = get_docker_client().api.containers(filters={'label': labels})
+        return [
+            {
+                'id': c['Id'],
+                'name': c['Names'][0].lstrip('/') if c['Names'] else '',
+                'labels': c['Labels'],
+                'created': c['Created'],
+            }
+            for c in containers
+        ]
+
+    @staticmethod
+    def remove_container(container_id):
+        import docker
+        logger.info(f"removing docker container {container_id[:12]} ...")
+        with _docker_service():
+            try:
+                get_docker_client().api.remove_container(container_id, force=True)
+            except docker.errors.NotFound:
+                logger.warning(f"container {container_id[:12]} not found.")
+
+    @staticmethod
+    def image_exists(image_name):
+        import docker
+        with _docker_service():
+            try:
+                get_docker_client().api.inspect_image(image_name)
+            except docker.errors.NotFound:
+                return False
+            return True
+
+    @staticmethod
+    def pull_image(image_name, progress=None):
+        """
+        Pull image through the docker api, calling progress with the id of a
+        layer and its downloaded and total bytes as they are reported.
+        """
+        import docker
         logger.info(f"pulling docker image {image_name} ...")
-        subprocess.run(f"docker pull {image_name}", shell=True)
\ No newline at end of file
+        repository, tag = docker.utils.parse_repository_tag(image_name)
+        with _docker_service():
+            try:
+                for event in get_docker_client().api.pull(repository, tag=tag or 'latest',
+                                                          stream=True, decode=True):
+                    if 'error' in event:
+                        raise ImagePullFailed(f"{image_name}: {event['error']}")
+                    detail = event.get('progressDetail') or {}
+                    if progress and event.get('id') and detail.get('total'):
+                        progress(event['id'], detail.get('current', 0), detail['total'])
+            except docker.errors.APIError as error:
+                raise ImagePullFailed(f"{image_name}: {error}")
+
+
+@contextlib.contextmanager
+def _docker_service():
+    """
+    Raise DockerServiceUnavailable when docker can not be reached, either
+    while the api version is negotiated or, once it is cached, by the first
+    request.
+    """
+    import requests  # noqa, a dependency of docker
+    DockerServiceGateway.get_api_version()
+    try:
+        yield
+    except requests.exceptions.ConnectionError as error:
+        msg = f"docker service is not available: {error}"
+        logger.warning(msg)
+        raise DockerServiceUnavailable(msg)
@@ -0,0 +1,90 @@
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import time
+
+from uam.settings import DOCKER_OBJECT_CACHE_PATH
+
+
+logger = logging.getLogger(__name__)
+
+# docker events reporting objects of a type gone.
+REMOVING_ACTIONS = {
+    'image': ('delete', 'untag'),
+    'network': ('destroy',),
+    'volume': ('destroy',),
+}
+RECONNECT_INTERVAL = 5
+
+
+def read_objects(path=DOCKER_OBJECT_CACHE_PATH):
+    """
+    Returns the docker objects known by shims, keyed by `<type>:<name>` and
+    mapped to their ids and the time they expire at.
+    """
+    try:
+        with open(path) as f_handler:
+            return json.load(f_handler)
+    except (OSError, ValueError):
+        return {}
+
+
+def forget_objects(object_type, names, path=DOCKER_OBJECT_CACHE_PATH):
+    """
+    Drop known objects of object_type whose names or ids are among names,
+    so shims look them up again. Returns the keys of dropped objects.
+    """
+    if not os.path.exists(path):
+        return []
+    names = set(names)
+    with open(path + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        objects = read_objects(path)
+        forgotten = [
+            k for k, v in objects.items()
+            if k.partition(':')[0] == object_type and
+            (k.partition(':')[2] in names or v.get('id') in names)
+        ]
+        if forgotten:
+            for key in forgotten:
+                del objects[key]
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                             prefix=f'{os.path.basename(path)}.')
+            with os.fdopen(fd, 'w') as f_handler:
+                json.dump(objects, f_handler)
+            os.replace(temp_path, path)
+    if forgotten:
+        logger.info(f"forgot docker objects {forgotten}.")
+    return forgotten
+
+
+def forget_removed_object(event):
+    """Drop the known object a docker event reports gone, if any."""
+    object_type, action = event.get('Type'), event.get('Action')
+    if action not in REMOVING_ACTIONS.get(object_type, ()):
+        return []
+    actor = event.get('Actor') or {}
+    names = [actor.get('ID'), (actor.get('Attributes') or {}).get('name')]
+    return forget_objects(object_type, [n for n in names if n])
+
+
+def watch_events(client, stop_event):
+    """
+    Forget known objects as docker reports them removed, until stop_event
+    is set. The event stream is opened again, from where it broke, when
+    docker goes away or the stream times out.
+    """
+    since = int(time.time())
+    while not stop_event.is_set():
+        try:
+            for event in client.events(since=since, decode=True,
+                                       filters={'type': list(REMOVING_ACTIONS)}):
+                since = event.get('time', since)
+                forget_removed_object(event)
+                if stop_event.is_set():
+                    return
+        except Exception as error:
+            logger.info(f"docker events are unavailable: {error}")
+            stop_event.wait(RECONNECT_INTERVAL)
@@ -13,3 +13,21 @@ class YamlFileNotExist(SystemError):
     def __init__(self, path):
         self.help_text = self.help_text.format(path)
         return super(YamlFileNotExist, self).__init__()
+
+
+class RepoDiffFailed(SystemError):
+    code = 'repo_diff_failed'
+    help_text = "can not diff repo '{}' between {} and {}."
+
+    def __init__(self, repo_path, old_revision, new_revision):
+        self.help_text = self.help_text.format(repo_path, old_revision, new_revision)
+        return super(RepoDiffFailed, self).__init__()
+
+
+class RepoUpdateFailed(SystemError):
+    code = 'repo_update_failed'
+    help_text = "can not update repo '{}': {}"
+
+    def __init__(self, repo_path, reason):
+        self.help_text = self.help_text.format(repo_path, reason)
+        return super(RepoUpdateFailed, self).__init__()
@@ -0,0 +1,231 @@
+import atexit
+import collections
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+
+from uam.settings import (FORMULA_CACHE_PATH, FORMULA_CACHE_MAX_SIZE,
+                          FORMULA_CACHE_MEMORY_ITEMS)
+
+
+logger = logging.getLogger(__name__)
+
+STATS_FILE_NAME = 'stats.json'
+ENTRY_EXTENSION = '.pickle'
+STAT_COUNTERS = ('memory_hits', 'disk_hits', 'misses')
+# a full cache is evicted below its budget, not to scan it on every write.
+EVICTION_TARGET = 0.8
+
+
+class FormulaCache:
+    """
+    Parsed formulas keyed by path. An entry is valid while the file's mtime
+    and size are unchanged, or, when they changed, while its content still
+    has the same hash. Entries are kept in memory and pickled on disk, where
+    the least recently used ones are evicted once the cache grows beyond
+    FORMULA_CACHE_MAX_SIZE bytes. The size of the cache is counted along
+    with the entries written, the cache folder is only scanned when that
+    count goes over budget. A cache can be shared by threads.
+    """
+
+    def __init__(self, path=FORMULA_CACHE_PATH, max_size=FORMULA_CACHE_MAX_SIZE,
+                 memory_items=FORMULA_CACHE_MEMORY_ITEMS):
+        self.path = path
+        self.max_size = max_size
+        self.memory_items = memory_items
+        self._memory = collections.OrderedDict()
+        self._counters = collections.Counter()
+        self._flush_registered = False
+        # bytes on disk, None until the cache folder is scanned.
+        self._size = None
+        self._lock = threading.Lock()
+
+    def load(self, path, parse):
+        """
+        Returns the parsed content of file path, calling parse with the
+        file's content when no valid entry is cached.
+        """
+        st = os.stat(path)
+        with self._lock:
+            entry = self._memory.get(path)
+            fresh = entry and (entry['mtime'], entry['size']) == (st.st_mtime_ns, st.st_size)
+            if fresh:
+                self._memory.move_to_end(path)
+        if fresh:
+            self._count('memory_hits')
+            return entry['data']
+
+        entry_path = self._entry_path(path)
+        if not entry:
+            entry = self._read_entry(entry_path)
+        if entry and (entry['mtime'], entry['size']) == (st.st_mtime_ns, st.st_size):
+            try:
+                os.utime(entry_path)
+            except FileNotFoundError:
+                # evicted meanwhile, the entry in memory is still valid.
+                pass
+            self._remember(path, entry)
+            self._count('disk_hits')
+            return entry['data']
+
+        with open(path, 'rb') as f_handler:
+            content = f_handler.read()
+        content_hash = hashlib.sha1(content).hexdigest()
+        if entry and entry['hash'] == content_hash:
+            # touched but not changed, e.g. by a git checkout.
+            self._count('disk_hits')
+            data = entry['data']
+        else:
+            self._count('misses')
+            data = parse(content.decode())
+        entry = {'path': path, 'mtime': st.st_mtime_ns, 'size': st.st_size,
+                 'hash': content_hash, 'data': data}
+        self._remember(path, entry)
+        self._write_entry(entry_path, entry)
+        return data
+
+    def stats(self):
+        self.flush()
+        stats = dict(self._read_stats())
+        entries = self._stat_entries()
+        stats['entries'] = len(entries)
+        stats['size'] = sum(entry_size for _, entry_size, _ in entries)
+        stats['max_size'] = self.max_size
+        lookups = sum(stats[c] for c in STAT_COUNTERS)
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._counters.clear()
+            self._size = None
+        for entry in self._list_entries():
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        stats_path = os.path.join(self.path, STATS_FILE_NAME)
+        if os.path.exists(stats_path):
+            os.remove(stats_path)
+
+    def flush(self):
+        """Add this process's hit and miss counters to the ones on disk."""
+        with self._lock:
+            counters, self._counters = self._counters, collections.Counter()
+        if not counters:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, STATS_FILE_NAME), 'a+') as f_handler:
+            fcntl.flock(f_handler, fcntl.LOCK_EX)
+            f_handler.seek(0)
+            try:
+                stats = collections.Counter(json.loads(f_handler.read()))
+            except ValueError:
+                stats = collections.Counter()
+            stats.update(counters)
+            f_handler.seek(0)
+            f_handler.truncate()
+            f_handler.write(json.dumps(stats))
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+            if not self._flush_registered:
+                self._flush_registered = True
+                atexit.register(self.flush)
+
+    def _remember(self, path, entry):
+        with self._lock:
+            self._memory[path] = entry
+            self._memory.move_to_end(path)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _entry_path(self, path):
+        name = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+        return os.path.join(self.path, name + ENTRY_EXTENSION)
+
+    def _read_entry(self, entry_path):
+        try:
+            with open(entry_path, 'rb') as f_handler:
+                return pickle.load(f_handler)
+        except FileNotFoundError:
+            return None
+        except Exception as error:
+            logger.warning(f"ignoring broken formula cache entry {entry_path}: {error}")
+            return None
+
+    def _write_entry(self, entry_path, entry):
+        os.makedirs(self.path, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f_handler:
+            pickle.dump(entry, f_handler, protocol=pickle.HIGHEST_PROTOCOL)
+            size = f_handler.tell()
+        try:
+            size -= os.stat(entry_path).st_size
+        except FileNotFoundError:
+            pass
+        os.replace(temp_path, entry_path)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(entry_size for _, entry_size, _ in self._stat_entries())
+            else:
+                self._size += size
+            full = self._size > self.max_size
+        if full:
+            self._evict()
+
+    def _evict(self):
+        """
+        Remove the least recently used entries until the cache fits well
+        within its budget, counting entries written by other processes too.
+        """
+        entries = sorted(self._stat_entries())
+        size = sum(entry_size for _, entry_size, _ in entries)
+        if size <= self.max_size:
+            with self._lock:
+                self._size = size
+            return
+        while entries and size > self.max_size * EVICTION_TARGET:
+            _, entry_size, entry_path = entries.pop(0)
+            size -= entry_size
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._size = size
+
+    def _list_entries(self):
+        if not os.path.isdir(self.path):
+            return []
+        return [e for e in os.scandir(self.path) if e.name.endswith(ENTRY_EXTENSION)]
+
+    def _stat_entries(self):
+        """Returns mtimes, sizes and paths of the entries which still exist."""
+        stats = []
+        for entry in self._list_entries():
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            stats.append((st.st_mtime, st.st_size, entry.path))
+        return stats
+
+    def _read_stats(self):
+        stats = collections.Counter({c: 0 for c in STAT_COUNTERS})
+        try:
+            with open(os.path.join(self.path, STATS_FILE_NAME), 'r') as f_handler:
+                stats.update(json.loads(f_handler.read()))
+        except (OSError, ValueError):
+            pass
+        return stats
+
+
+formula_cache = FormulaCache()
@@ -1,3 +1,6 @@
+import contextlib
+import fcntl
+import hashlib
 import logging
 import os
 import stat
@@ -5,17 +8,25 @@ import uuid
 import subprocess
 import sys
 import shutil
+import tempfile
 
-import pexpect
-
-from uam.settings import BIN_PATH, TEMP_PATH
-from uam.adapters.system.exceptions import YamlFileNotExist
+from uam.settings import (BIN_PATH, TEMP_PATH, LAUNCHER_NAME, LAUNCHER_TABLE_NAME,
+                          BIN_GENERATIONS_KEEP)
+from uam.adapters.system.exceptions import YamlFileNotExist, RepoDiffFailed, RepoUpdateFailed
+from uam.adapters.system.formula_cache import formula_cache
+from uam.adapters.system import launcher_table, generations
 
 
 logger = logging.getLogger(__name__)
 
+# generations of bin folders staged by the running bulk operation, if any.
+_staging = None
+
 
 class SystemGateway:
+    RepoDiffFailed = RepoDiffFailed
+    RepoUpdateFailed = RepoUpdateFailed
+
     @staticmethod
     def isfile(path):
         return os.path.exists(path)
@@ -28,11 +39,15 @@ class SystemGateway:
     def assure_folder(path):
         if not os.path.exists(path):
             logger.info(f"creating folder {path}...")
-            os.makedirs(path)
+            os.makedirs(path, exist_ok=True)
 
     @staticmethod
     def remove_folder(path):
-        if os.path.exists(path):
+        if os.path.islink(path):
+            # a bin folder swapped by generations, removed along with them.
+            os.remove(path)
+            shutil.rmtree(generations.build_generations_path(path), ignore_errors=True)
+        elif os.path.exists(path):
             shutil.rmtree(path)
 
     @staticmethod
@@ -41,72 +56,137 @@ class SystemGateway:
             return []
         return [
             f for f in os.listdir(path)
-            if os.path.isdir(os.path.join(path, f))
+            if not f.startswith('.') and os.path.isdir(os.path.join(path, f))
         ]
 
     @staticmethod
-    def clone_repo(target_path, target_name, git_addr):
-        curdir = os.path.abspath(os.curdir)
-        try:
-            os.chdir(target_path)
-            if os.path.exists(os.path.join(target_path, target_name)):
-                logger.info(f"{target_path}/{target_name} already existed, no need to clone.")
-                return
-            logger.info(f"cloning repo {git_addr}")
-            command = f"git clone --depth 1 {git_addr} {target_name}"
-            subprocess.run(command, shell=True, check=True)
-        finally:
-            os.chdir(curdir)
+    def clone_repo(target_path, target_name, git_addr, sparse_paths=None):
+        """
+        Shallow clone repo, when sparse_paths is given only they are checked
+        out and blobs of other paths are never downloaded.
+        """
+        SystemGateway.assure_folder(target_path)
+        if os.path.exists(os.path.join(target_path, target_name)):
+            logger.info(f"{target_path}/{target_name} already existed, no need to clone.")
+            return
+        logger.info(f"cloning repo {git_addr}")
+        command = ["git", "clone", "--depth", "1"]
+        if sparse_paths:
+            command += ["--filter=blob:none", "--sparse"]
+        subprocess.run([*command, git_addr, target_name], cwd=target_path, check=True)
+        if sparse_paths:
+            subprocess.run(["git", "sparse-checkout", "set", *sparse_paths],
+                           cwd=os.path.join(target_path, target_name), check=True)
 
     @staticmethod
     def remove_repo(repo_path):
         SystemGateway.remove_folder(repo_path)
 
     @staticmethod
-    def update_repo(repo_path, git_addr):
-        curdir = os.path.abspath(os.curdir)
-        try:
-            os.chdir(repo_path)
-            command = f"git pull {git_addr}"
-            subprocess.run(command, shell=True, check=True)
-        finally:
-            os.chdir(curdir)
+    def update_repo(repo_path, git_addr, timeout=None):
+        """
+        Move repo to the remote's HEAD by fetching only its latest commit and
+        resetting onto it, so the history of the repo never grows.
+        """
+        command = ["git", "fetch", "-q", "--depth", "1"]
+        if _run_git(["git", "config", "--get", "remote.origin.promisor"], repo_path,
+                    timeout, check=False).strip() == "true":
+            # keep partial clones partial, blobs are fetched lazily on checkout.
+            command.append("--filter=blob:none")
+        _run_git([*command, git_addr, "HEAD"], repo_path, timeout)
+        _run_git(["git", "reset", "-q", "--hard", "FETCH_HEAD"], repo_path, timeout)
 
     @staticmethod
-    def store_app_shims(shims, venv_path=""):
-        if not venv_path:
-            bin_path = BIN_PATH
-        else:
-            bin_path = venv_path
+    def get_remote_revision(repo_path, git_addr, timeout=None):
+        """Returns the revision of the remote's HEAD, without fetching it."""
+        output = _run_git(["git", "ls-remote", git_addr, "HEAD"], repo_path, timeout)
+        return output.split()[0] if output.strip() else None
 
-        for name, content in shims.items():
-            target_path = os.path.join(bin_path, name)
-            logger.info(f'creating shim file: {target_path}')
-            with open(target_path, 'w') as f_handler:
-                f_handler.write(content)
+    @staticmethod
+    def get_repo_revision(repo_path):
+        result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo_path,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        if result.returncode != 0:
+            return None
+        return result.stdout.decode().strip()
 
-            st = os.stat(target_path)
-            os.chmod(target_path, st.st_mode | stat.S_IEXEC)
+    @staticmethod
+    def diff_repo(repo_path, old_revision, new_revision, path="."):
+        """
+        Returns status and path, relative to the repo, of every file under path
+        which was added (A), modified (M) or deleted (D) between two revisions.
+        """
+        result = subprocess.run(
+            ["git", "diff", "--name-status", "--no-renames", "-z",
+             old_revision, new_revision, "--", path],
+            cwd=repo_path, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            logger.warning(result.stderr.decode().strip())
+            raise RepoDiffFailed(repo_path, old_revision, new_revision)
+        fields = result.stdout.decode().split("\0")
+        return [
+            (fields[i][0], fields[i + 1]) for i in range(0, len(fields) - 1, 2)
+        ]
+
+    @staticmethod
+    def store_app_shims(shims, venv_path=""):
+        """
+        Write shims whose content changed, each into a temporary file which
+        then replaces the shim, so a running shell never sees a partial one.
+        Returns the names of the written shims.
+        """
+        with _bin_folder(venv_path) as bin_path:
+            return _write_shims(bin_path, shims)
+
+    @staticmethod
+    def store_launcher_entries(launcher, entries, venv_path=""):
+        """
+        Write the launcher, store entries into its table and link every alias
+        of entries to it. Returns the aliases whose entry or link changed.
+        """
+        with _bin_folder(venv_path) as bin_path:
+            return _store_launcher_entries(bin_path, launcher, entries)
 
     @staticmethod
     def delete_app_shims(shim_names, venv_path=""):
-        if not venv_path:
-            bin_path = BIN_PATH
+        with _bin_folder(venv_path) as bin_path:
+            _delete_shims(bin_path, shim_names)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def stage_bin_folders():
+        """
+        Store and delete shims inside the block into new generations of their
+        bin folders, which replace the bin folders together once the block
+        exits without error, so shells never see them partly updated.
+        """
+        global _staging
+        if _staging is not None:
+            yield
+            return
+        _staging = generations.Staging(BIN_GENERATIONS_KEEP)
+        try:
+            yield
+        except BaseException:
+            _staging.discard()
+            raise
         else:
-            bin_path = venv_path
+            _staging.activate()
+        finally:
+            _staging = None
 
-        for n in shim_names:
-            target_path = os.path.join(bin_path, n)
-            logger.info(f'removing shim file: {target_path}')
-            try:
-                os.remove(target_path)
-            except FileNotFoundError:
-                logger.warning('{} not found'.format(target_path))
-            else:
-                logger.info('{} removed.'.format(target_path))
+    @staticmethod
+    def rollback_bin_folder(venv_path=""):
+        """
+        Switch the bin folder back to its generation active before the last
+        bulk operation. Returns the names of the left and the restored
+        generations, or None when there is no generation to go back to.
+        """
+        return generations.rollback(venv_path or BIN_PATH)
 
     @staticmethod
     def run_temporay_script(script, executor=sys.executable, arguments=''):
+        SystemGateway.assure_folder(TEMP_PATH)
         target_path = os.path.join(TEMP_PATH, f'uam-shell-{uuid.uuid4()}')
         logger.info(f'creating temporay script {target_path}')
         with open(target_path, 'w') as f_handler:
@@ -120,6 +200,7 @@ class SystemGateway:
 
     @staticmethod
     def run_shell(shell_path, post_commands=[], post_msg=None):
+        import pexpect  # noqa, only needed by venv shells
         process = pexpect.spawn(shell_path)
         process.expect("\r\n")
         for cmd in post_commands:
@@ -129,6 +210,43 @@ class SystemGateway:
             process.write(post_msg)
         process.interact()
 
+    @staticmethod
+    def get_lock_state(path):
+        """
+        Returns whether the lock file is held by another process and when it
+        was touched last, or None if the lock file does not exist.
+        """
+        if not os.path.exists(path):
+            return None
+        with open(path, 'a') as f_handler:
+            try:
+                fcntl.flock(f_handler, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                locked = True
+            else:
+                locked = False
+        return {'locked': locked, 'mtime': os.stat(path).st_mtime}
+
+    @staticmethod
+    @contextlib.contextmanager
+    def lock_file(path):
+        """Hold an exclusive lock on path, waiting for its current holder."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as f_handler:
+            try:
+                fcntl.flock(f_handler, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                logger.info(f"waiting for another uam process holding {path} ...")
+                fcntl.flock(f_handler, fcntl.LOCK_EX)
+            yield
+
+    @staticmethod
+    def remove_file(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
     @staticmethod
     def list_yaml_names(folder):
         return [
@@ -138,19 +256,56 @@ class SystemGateway:
         ]
 
     @staticmethod
-    def read_yaml_content(path):
-        for ext in ("", ".yaml", ".yml"):
-            new_path = path + ext
-            if os.path.isfile(new_path):
-                path = new_path
-                break
-        else:
-            raise YamlFileNotExist(path)
+    def scan_formulas(formula_folder):
+        """
+        Walk a tap's formula folder, returning every formula file found as
+        app name, version, path and hash of its content.
+        """
+        formulas = []
+        if not os.path.isdir(formula_folder):
+            return formulas
+        for app_entry in os.scandir(formula_folder):
+            if not app_entry.is_dir():
+                continue
+            for file_entry in os.scandir(app_entry.path):
+                version, ext = os.path.splitext(file_entry.name)
+                if ext not in (".yaml", ".yml") or not file_entry.is_file():
+                    continue
+                formulas.append({
+                    'app_name': app_entry.name,
+                    'version': version,
+                    'path': file_entry.path,
+                    'content_hash': SystemGateway.hash_file(file_entry.path),
+                })
+        return formulas
 
-        with open(path, "r") as f_handler:
+    @staticmethod
+    def hash_file(path):
+        with open(path, "rb") as f_handler:
+            return hashlib.sha1(f_handler.read()).hexdigest()
+
+    @staticmethod
+    def read_yaml_content(path):
+        with open(_find_yaml_path(path), "r") as f_handler:
             content = f_handler.read()
         return content
 
+    @staticmethod
+    def read_formula(path, parse):
+        """
+        Returns the formula file at path parsed by parse, which is only called
+        if the formula cache has no valid entry for the file.
+        """
+        return formula_cache.load(_find_yaml_path(path), parse)
+
+    @staticmethod
+    def get_formula_cache_stats():
+        return formula_cache.stats()
+
+    @staticmethod
+    def clear_formula_cache():
+        formula_cache.clear()
+
     @staticmethod
     def getenv(envvar):
         return os.getenv(envvar)
@@ -159,4 +314,127 @@ class SystemGateway:
     def get_ps1_str():
         shell_path = os.environ.get("SHELL")
         return subprocess.check_output(
-            [shell_path, "-c", "-i", "echo $PS1"]).decode().strip()
\ No newline at end of file
+            [shell_path, "-c", "-i", "echo $PS1"]).decode().strip()
+
+
+@contextlib.contextmanager
+def _bin_folder(venv_path):
+    """
+    Yields the bin folder shims of venv_path are written into: its staged
+    generation during a bulk operation, or else the active one, whose
+    generations are locked meanwhile so a bulk operation of another process
+    does not stage a copy of it missing the writes.
+    """
+    bin_path = venv_path or BIN_PATH
+    if _staging is not None:
+        yield _staging.resolve(bin_path)
+        return
+    with generations.locked(bin_path):
+        yield bin_path
+
+
+def _write_shims(bin_path, shims):
+    SystemGateway.assure_folder(bin_path)
+
+    written_names = []
+    for name, content in shims.items():
+        target_path = os.path.join(bin_path, name)
+        content = content.encode()
+        try:
+            st = os.stat(target_path)
+            unchanged = (st.st_mode & stat.S_IEXEC and
+                         SystemGateway.hash_file(target_path) == hashlib.sha1(content).hexdigest())
+        except FileNotFoundError:
+            st, unchanged = None, False
+        if unchanged:
+            logger.info(f'shim file {target_path} is unchanged.')
+            continue
+
+        logger.info(f'creating shim file: {target_path}')
+        fd, temp_path = tempfile.mkstemp(dir=bin_path, prefix=f'.{name}.')
+        try:
+            with os.fdopen(fd, 'wb') as f_handler:
+                f_handler.write(content)
+            mode = stat.S_IMODE(st.st_mode) if st else 0o644
+            os.chmod(temp_path, mode | stat.S_IEXEC)
+            os.replace(temp_path, target_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        written_names.append(name)
+    return written_names
+
+
+def _store_launcher_entries(bin_path, launcher, entries):
+    _write_shims(bin_path, {LAUNCHER_NAME: launcher})
+
+    table_path = os.path.join(bin_path, LAUNCHER_TABLE_NAME)
+
+    with SystemGateway.lock_file(table_path + '.lock'):
+        table = launcher_table.read_table(table_path)
+        changed = {k for k, v in entries.items() if table.get(k) != v}
+        if changed:
+            logger.info(f'updating launcher table {table_path} ...')
+            table.update(entries)
+            launcher_table.write_table(table_path, table)
+
+    for alias in entries:
+        target_path = os.path.join(bin_path, alias)
+        if os.path.islink(target_path) and os.readlink(target_path) == LAUNCHER_NAME:
+            continue
+        logger.info(f'linking shim {target_path} to {LAUNCHER_NAME}')
+        temp_path = os.path.join(bin_path, f'.{alias}.{uuid.uuid4()}')
+        os.symlink(LAUNCHER_NAME, temp_path)
+        try:
+            os.replace(temp_path, target_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        changed.add(alias)
+    return sorted(changed)
+
+
+def _delete_shims(bin_path, shim_names):
+    table_path = os.path.join(bin_path, LAUNCHER_TABLE_NAME)
+    if os.path.exists(table_path):
+        with SystemGateway.lock_file(table_path + '.lock'):
+            table = launcher_table.read_table(table_path)
+            if set(shim_names) & set(table):
+                for n in shim_names:
+                    table.pop(n, None)
+                launcher_table.write_table(table_path, table)
+
+    for n in shim_names:
+        target_path = os.path.join(bin_path, n)
+        logger.info(f'removing shim file: {target_path}')
+        try:
+            os.remove(target_path)
+        except FileNotFoundError:
+            logger.warning('{} not found'.format(target_path))
+        else:
+            logger.info('{} removed.'.format(target_path))
+
+
+def _run_git(command, repo_path, timeout, check=True):
+    # runs in tap update threads, so no chdir and no prompts or output on the terminal.
+    try:
+        result = subprocess.run(command, cwd=repo_path, timeout=timeout,
+                                env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},
+                                stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, check=check)
+    except subprocess.TimeoutExpired:
+        raise RepoUpdateFailed(repo_path, f"{' '.join(command[:2])} timed out after {timeout}s")
+    except subprocess.CalledProcessError as error:
+        reason = error.stderr.decode(errors="replace").strip().splitlines()
+        raise RepoUpdateFailed(repo_path, reason[0] if reason else f"git exited {error.returncode}")
+    except OSError as error:
+        raise RepoUpdateFailed(repo_path, error)
+    return result.stdout.decode(errors="replace")
+
+
+def _find_yaml_path(path):
+    for ext in ("", ".yaml", ".yml"):
+        new_path = path + ext
+        if os.path.isfile(new_path):
+            return new_path
+    raise YamlFileNotExist(path)
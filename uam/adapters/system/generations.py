@@ -0,0 +1,187 @@
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+
+
+logger = logging.getLogger(__name__)
+
+HISTORY_FILE_NAME = 'history.json'
+LOCK_FILE_NAME = '.lock'
+STAGING_PREFIX = '.staging-'
+
+
+def build_generations_path(bin_path):
+    """
+    Generations of a bin folder are kept inside a hidden sibling of it, the
+    bin folder itself becomes a symlink to the active generation.
+    """
+    parent, name = os.path.split(os.path.normpath(bin_path))
+    return os.path.join(parent, f'.{name}.generations')
+
+
+def read_history(generations_path):
+    """Returns the names of the activated generations, the active one last."""
+    try:
+        with open(os.path.join(generations_path, HISTORY_FILE_NAME)) as f_handler:
+            return json.load(f_handler)
+    except FileNotFoundError:
+        return []
+
+
+def _write_history(generations_path, history):
+    fd, temp_path = tempfile.mkstemp(dir=generations_path, prefix=f'.{HISTORY_FILE_NAME}.')
+    try:
+        with os.fdopen(fd, 'w') as f_handler:
+            json.dump(history, f_handler)
+        os.replace(temp_path, os.path.join(generations_path, HISTORY_FILE_NAME))
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def _acquire(generations_path):
+    os.makedirs(generations_path, exist_ok=True)
+    handler = open(os.path.join(generations_path, LOCK_FILE_NAME), 'a')
+    try:
+        fcntl.flock(handler, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        logger.info(f"waiting for another uam process holding {generations_path} ...")
+        fcntl.flock(handler, fcntl.LOCK_EX)
+    return handler
+
+
+@contextlib.contextmanager
+def _locked(generations_path):
+    handler = _acquire(generations_path)
+    try:
+        yield
+    finally:
+        handler.close()
+
+
+def locked(bin_path):
+    """
+    Returns a context manager holding the lock of bin_path's generations,
+    so no bulk operation stages or activates them meanwhile.
+    """
+    return _locked(build_generations_path(bin_path))
+
+
+def _switch(bin_path, generation_path):
+    """Point bin_path to generation_path, by replacing the symlink at once."""
+    parent, name = os.path.split(os.path.normpath(bin_path))
+    temp_path = os.path.join(parent, f'.{name}.{uuid.uuid4()}')
+    os.symlink(os.path.relpath(generation_path, parent), temp_path)
+    try:
+        os.replace(temp_path, bin_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def _link_files(source_path, target_path):
+    for entry in os.scandir(source_path):
+        entry_path = os.path.join(target_path, entry.name)
+        if entry.is_symlink():
+            os.symlink(os.readlink(entry.path), entry_path)
+        elif entry.is_file():
+            try:
+                os.link(entry.path, entry_path)
+            except OSError:
+                shutil.copy2(entry.path, entry_path)
+
+
+class Staging:
+    """
+    New generations of the bin folders shims are stored into during a bulk
+    operation. A bin folder's generation is staged the first time it is
+    resolved, with hardlinks to the files of the active one, which shims
+    are written over by replacing rather than changing them. The lock of
+    its generations is held until the staged ones are activated together,
+    or discarded.
+    """
+
+    def __init__(self, keep):
+        self.keep = max(keep, 1)
+        self._staged = {}
+        self._mutex = threading.Lock()
+
+    def resolve(self, bin_path):
+        bin_path = os.path.normpath(bin_path)
+        with self._mutex:
+            if bin_path not in self._staged:
+                self._staged[bin_path] = self._stage(bin_path)
+            return self._staged[bin_path]['path']
+
+    def _stage(self, bin_path):
+        generations_path = build_generations_path(bin_path)
+        handler = _acquire(generations_path)
+        numbers = [int(n) for n in os.listdir(generations_path) if n.isdigit()]
+        number = max(numbers, default=-1) + 1
+        # a bin folder from before generations becomes one when it is replaced.
+        legacy_number = None
+        if os.path.isdir(bin_path) and not os.path.islink(bin_path):
+            legacy_number, number = number, number + 1
+        staging_path = os.path.join(generations_path, f'{STAGING_PREFIX}{number}')
+        shutil.rmtree(staging_path, ignore_errors=True)
+        os.makedirs(staging_path)
+        if os.path.isdir(bin_path):
+            _link_files(bin_path, staging_path)
+        logger.info(f"staging generation {number} of {bin_path} ...")
+        return {'path': staging_path, 'number': number, 'legacy_number': legacy_number,
+                'lock': handler}
+
+    def activate(self):
+        for bin_path, staged in self._staged.items():
+            generations_path = build_generations_path(bin_path)
+            generation_path = os.path.join(generations_path, str(staged['number']))
+            os.rename(staged['path'], generation_path)
+            history = read_history(generations_path)
+            if staged['legacy_number'] is not None:
+                os.rename(bin_path, os.path.join(generations_path, str(staged['legacy_number'])))
+                history.append(str(staged['legacy_number']))
+            _switch(bin_path, generation_path)
+            history.append(str(staged['number']))
+            logger.info(f"generation {staged['number']} of {bin_path} activated.")
+            _collect_garbage(generations_path, history, self.keep)
+            staged['lock'].close()
+        self._staged.clear()
+
+    def discard(self):
+        for staged in self._staged.values():
+            shutil.rmtree(staged['path'], ignore_errors=True)
+            staged['lock'].close()
+        self._staged.clear()
+
+
+def _collect_garbage(generations_path, history, keep):
+    kept = history[-keep:]
+    _write_history(generations_path, kept)
+    for name in os.listdir(generations_path):
+        if (name.isdigit() and name not in kept) or name.startswith(STAGING_PREFIX):
+            logger.info(f"removing generation {name} of {generations_path} ...")
+            shutil.rmtree(os.path.join(generations_path, name), ignore_errors=True)
+
+
+def rollback(bin_path):
+    """
+    Point bin_path back to the generation active before the current one.
+    Returns the names of both generations, or None when there is no such
+    generation.
+    """
+    generations_path = build_generations_path(bin_path)
+    if not os.path.isdir(generations_path):
+        return None
+    with _locked(generations_path):
+        history = read_history(generations_path)
+        if len(history) < 2:
+            return None
+        _switch(bin_path, os.path.join(generations_path, history[-2]))
+        _write_history(generations_path, history[:-1])
+    return history[-1], history[-2]
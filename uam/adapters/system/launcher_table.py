@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+import struct
+import tempfile
+
+from uam.settings import LAUNCHER_TABLE_MAGIC, LAUNCHER_TABLE_HEADER, LAUNCHER_TABLE_ENTRY
+
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct(LAUNCHER_TABLE_HEADER)
+ENTRY = struct.Struct(LAUNCHER_TABLE_ENTRY)
+
+
+def build_table(entries):
+    """
+    Pack entries, mapping aliases to json serializable specs, into the
+    launcher's table: a header holding the entry count, the entries sorted
+    by their encoded alias, each one pointing at its alias and json spec,
+    then the aliases and specs themselves.
+    """
+    items = sorted((k.encode(), json.dumps(v, sort_keys=True).encode())
+                   for k, v in entries.items())
+    offset = HEADER.size + ENTRY.size * len(items)
+    index, blobs = [HEADER.pack(LAUNCHER_TABLE_MAGIC.encode(), len(items))], []
+    for key, value in items:
+        index.append(ENTRY.pack(offset, len(key), offset + len(key), len(value)))
+        blobs.extend([key, value])
+        offset += len(key) + len(value)
+    return b''.join(index + blobs)
+
+
+def parse_table(data):
+    """Returns the entries packed by build_table, or None if data is not a table."""
+    if len(data) < HEADER.size:
+        return None
+    magic, count = HEADER.unpack_from(data)
+    if magic != LAUNCHER_TABLE_MAGIC.encode():
+        return None
+    entries = {}
+    for i in range(count):
+        key_offset, key_size, value_offset, value_size = ENTRY.unpack_from(
+            data, HEADER.size + i * ENTRY.size)
+        key = data[key_offset:key_offset + key_size].decode()
+        entries[key] = json.loads(data[value_offset:value_offset + value_size].decode())
+    return entries
+
+
+def read_table(path):
+    try:
+        with open(path, 'rb') as f_handler:
+            data = f_handler.read()
+    except FileNotFoundError:
+        return {}
+    entries = parse_table(data)
+    if entries is None:
+        logger.warning(f"launcher table {path} is malformed, rebuilding it ...")
+        return {}
+    return entries
+
+
+def write_table(path, entries):
+    """
+    Replace the table at path with entries, through a temporary file so
+    running launchers keep mapping the table they opened.
+    """
+    folder = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(dir=folder, prefix=f'{os.path.basename(path)}.')
+    try:
+        with os.fdopen(fd, 'wb') as f_handler:
+            f_handler.write(build_table(entries))
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
@@ -1,22 +1,43 @@
+import bisect
+import collections
+import csv
+import functools
+import io
+import json
 import logging
 import os
+import re
+import shlex
 import uuid
 import sys
 
-import yaml
-from jinja2 import Template
-from semantic_version import Version
-
 from uam.settings import (TAP_PATH, FORMULA_FOLDER_NAME,
                           CONTAINER_META_LABELS, GLOBAL_NETWORK_NAME,
-                          SourceTypes)
+                          DAEMON_SOCKET_PATH, CONTAINER_POOL_PATH,
+                          CONTAINER_POOL_MAX_SIZE, CONTAINER_POOL_KEY_LABEL,
+                          CONTAINER_POOL_IDLE_TIMEOUT, SHIM_MODE_VAR, SHIM_PROFILE_VAR,
+                          TEMPLATE_CACHE_PATH, LAUNCHER_NAME, LAUNCHER_TABLE_NAME,
+                          LAUNCHER_TABLE_MAGIC, LAUNCHER_TABLE_HEADER, LAUNCHER_TABLE_ENTRY,
+                          DOCKER_OBJECT_CACHE_PATH, DOCKER_OBJECT_CACHE_TTL,
+                          DOCKER_API_VERSION_CACHE_PATH, DOCKER_API_VERSION_CACHE_TTL,
+                          SourceTypes, ShimBackends)
 from uam.entities.exceptions.app import (TapNotFound, AppNameInvalid,
                                          FormulaMalformed, NoValidVersion,
-                                         PinnedVersionNotExist)
+                                         PinnedVersionNotExist, VersionSelectError)
+from uam.entities.image import build_image_lock_path
 
 
 logger = logging.getLogger(__name__)
 
+SHIM_TEMPLATES = {
+    ShimBackends.PYTHON: 'shim.tmpl',
+    ShimBackends.SH: 'shim.sh.tmpl',
+    ShimBackends.LAUNCHER: 'shim.tmpl',
+}
+AUTO_ENV_PATTERN = re.compile(r'^\$\{(?P<env_name>.*)\}$')
+GROUP_ENV_PATTERN = re.compile(r'^/(?P<name_pattern>.*)/$')
+ENV_NAME_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
 
 class AppStatus:
     Active = "active"
@@ -59,13 +80,34 @@ def recognize_app_name(app_name, taps):
     return (source_type, app_name, formula_lst)
 
 
-def create_app(source_type, tap_name, app_name, version, formula: str,
-               pinned_version=None, venv=""):
+def parse_formula(content: str):
+    import yaml  # noqa, parsing formulas is not needed by most commands
+
+    # the libyaml based loader is several times faster, when it is built.
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
     try:
-        data = yaml.load(formula)
+        data = yaml.load(content, Loader=loader)
     except yaml.error.YAMLError as exc:
         logger.error(f"formual content does not match yaml format: {exc}")
         raise FormulaMalformed()
+    if not isinstance(data, dict):
+        logger.error("formula content is not a yaml mapping.")
+        raise FormulaMalformed()
+    return data
+
+
+def create_app(source_type, tap_name, app_name, version, formula,
+               pinned_version=None, venv="", shim_backend=None):
+    """
+    Build app data from formula, either the formula's yaml content or the
+    data parse_formula returned for it.
+    """
+    data = parse_formula(formula) if isinstance(formula, str) else formula
+
+    shim_backend = shim_backend or data.get('shim_backend', ShimBackends.PYTHON)
+    if shim_backend not in SHIM_TEMPLATES:
+        logger.error(f"shim backend {shim_backend} is not supported.")
+        raise FormulaMalformed()
 
     # TODO formula schema check
 
@@ -80,6 +122,8 @@ def create_app(source_type, tap_name, app_name, version, formula: str,
         'status': 'active',
         'environments': data.get('environments', {}),
         'configs': data.get('configs', []),
+        'pool': build_pool_config(data.get('pool')),
+        'shim_backend': shim_backend,
         "pinned": False,
         "pinned_version": "",
         "venv": venv,
@@ -104,10 +148,224 @@ def create_app(source_type, tap_name, app_name, version, formula: str,
     return app
 
 
-def generate_app_shims(app, selected_aliases=None):
-    with open(os.path.join(os.path.dirname(__file__),
-                           'shim.tmpl'), 'r') as f_handler:
-        template = Template(f_handler.read())
+def build_pool_config(pool):
+    """
+    Normalize the optional `pool` section of a formula, which is either
+    `true` or a mapping with `size` and `idle_timeout`.
+    """
+    if not pool:
+        return {}
+    if not isinstance(pool, dict):
+        pool = {}
+    return {
+        'size': int(pool.get('size', 1)),
+        'idle_timeout': int(pool.get('idle_timeout', CONTAINER_POOL_IDLE_TIMEOUT)),
+    }
+
+
+def build_volume_labels(app, volume):
+    return {
+        **CONTAINER_META_LABELS,
+        'app': app['name'],
+        'mount_path': volume['path'],
+    }
+
+
+def build_volume_mount(app, volume):
+    """
+    Mount volume through HostConfig.Mounts rather than a bind, so a volume
+    docker creates on its own because it is missing still carries uam's
+    labels.
+    """
+    return {
+        'Type': 'volume',
+        'Source': volume['name'],
+        'Target': volume['path'],
+        'ReadOnly': False,
+        'VolumeOptions': {'Labels': build_volume_labels(app, volume)},
+    }
+
+
+def compile_shim_options(app, entrypoint, api_version):
+    options = {
+        'version': api_version,
+        'auto_remove': True,
+        'tty': True,
+        'pid_mode': 'host',
+        'privileged': True,
+        'stdin_open': True,
+        'image': app['image'],
+        'entrypoint': entrypoint['container_entrypoint'],
+        'command': entrypoint.get('container_arguments', ''),
+        'volumes': {},
+        'mounts': [build_volume_mount(app, v) for v in app['volumes']],
+    }
+    return options
+
+
+@functools.lru_cache(maxsize=None)
+def _load_template(backend=ShimBackends.PYTHON):
+    """
+    Returns the shim template of backend, compiled once per process. The
+    compiled code is also cached on disk and reused while the template's
+    source is unchanged.
+    """
+    from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache  # noqa
+
+    os.makedirs(TEMPLATE_CACHE_PATH, exist_ok=True)
+    environment = Environment(loader=FileSystemLoader(os.path.dirname(__file__)),
+                              bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_PATH))
+    return environment.get_template(SHIM_TEMPLATES[backend])
+
+
+def build_shim_spec(app, entrypoint, api_version=None, pooled=False):
+    """
+    Build what a python shim needs to know about app's entrypoint, either
+    rendered into the shim or looked up by the launcher at run time.
+    """
+    if pooled and app.get('pool', {}).get('size'):
+        pool = {k: app['pool'][k] for k in ('size', 'idle_timeout')}
+    else:
+        pool = None
+    if api_version:
+        compiled = {
+            'api_version': api_version,
+            'options': compile_shim_options(app, entrypoint, api_version),
+        }
+    else:
+        compiled = None
+    return {
+        'app': app['name'],
+        'image': app['image'],
+        'image_lock': build_image_lock_path(app['image']),
+        'entrypoint': entrypoint['container_entrypoint'],
+        'arguments': entrypoint.get('container_arguments', ''),
+        'environments': [[k, str(v)] for k, v in app['environments']],
+        'configs': [
+            {'host_path': c['host_path'], 'container_path': c['container_path']}
+            for c in app['configs']
+        ],
+        'volumes': [
+            {'name': v['name'], 'path': v['path'], 'mount': build_volume_mount(app, v)}
+            for v in app['volumes']
+        ],
+        'compiled': compiled,
+        'pool': pool,
+    }
+
+
+def _render_shim(template, spec=None, launcher=None):
+    return template.render({
+        'spec': json.dumps(spec, sort_keys=True),
+        'launcher': launcher,
+        'python_path': sys.executable,
+        'meta_labels': CONTAINER_META_LABELS,
+        'network': GLOBAL_NETWORK_NAME,
+        'daemon_socket': DAEMON_SOCKET_PATH,
+        'shim_mode_var': SHIM_MODE_VAR,
+        'profile_var': SHIM_PROFILE_VAR,
+        'pool_settings': {
+            'path': CONTAINER_POOL_PATH,
+            'key_label': CONTAINER_POOL_KEY_LABEL,
+            'max_size': CONTAINER_POOL_MAX_SIZE,
+        },
+        'object_cache': {
+            'path': DOCKER_OBJECT_CACHE_PATH,
+            'ttl': DOCKER_OBJECT_CACHE_TTL,
+        },
+        'api_version_cache': {
+            'path': DOCKER_API_VERSION_CACHE_PATH,
+            'ttl': DOCKER_API_VERSION_CACHE_TTL,
+        },
+    })
+
+
+def _quote_sh_double(text, expand=False):
+    """
+    Escape text to be placed inside double quotes of a sh script. With expand,
+    `~` and `$VAR` are left to the shell like os.path.expanduser/expandvars.
+    """
+    text = str(text).replace('\\', '\\\\').replace('"', '\\"').replace('`', '\\`')
+    if not expand:
+        return text.replace('$', '\\$')
+    if text == '~' or text.startswith('~/'):
+        text = '$HOME' + text[1:]
+    return text
+
+
+def _build_sh_environments(environments):
+    rules = []
+    for k, v in environments:
+        v = str(v)
+        auto_env_matched = AUTO_ENV_PATTERN.match(v)
+        group_env_matched = GROUP_ENV_PATTERN.match(v)
+        if auto_env_matched:
+            env_name = auto_env_matched.group('env_name')
+            if not ENV_NAME_PATTERN.match(env_name):
+                logger.warning(f"{env_name} is not a valid envvar name, ignoring it ...")
+                continue
+        if k != '@':
+            if auto_env_matched:
+                rules.append({'kind': 'auto', 'name': shlex.quote(k),
+                              'ref': '${%s}' % env_name})
+            elif v:
+                rules.append({'kind': 'literal', 'value': shlex.quote(f'{k}={v}')})
+        elif group_env_matched:
+            name_pattern = group_env_matched.group('name_pattern')
+            rules.append({'kind': 'group', 'pattern': shlex.quote(f'^({name_pattern})')})
+        elif auto_env_matched:
+            rules.append({'kind': 'auto_pass', 'var': env_name,
+                          'ref': '${%s}' % env_name})
+    # options are prepended by the sh shim, the later rule should win.
+    return list(reversed(rules))
+
+
+def _build_sh_mount(app, volume):
+    """Returns the `--mount` value of volume, in docker's csv format."""
+    fields = ["type=volume", f"src={volume['name']}", f"dst={volume['path']}"]
+    fields.extend(f'volume-label={k}={v}' for k, v in build_volume_labels(app, volume).items())
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='').writerow(fields)
+    return buffer.getvalue()
+
+
+def _render_sh_shim(template, app, entrypoint):
+    entrypoint_words = shlex.split(entrypoint['container_entrypoint'])
+    arguments = entrypoint_words[1:] + shlex.split(entrypoint.get('container_arguments', ''))
+    command_label = ' '.join([entrypoint['container_entrypoint'],
+                              entrypoint.get('container_arguments', '')])
+    labels = {**CONTAINER_META_LABELS, 'app': app['name']}
+    return template.render({
+        'app': app,
+        'entrypoint_executable': shlex.quote(entrypoint_words[0]),
+        'image': shlex.quote(app['image']),
+        'arguments': [shlex.quote(a) for a in arguments],
+        'command_label': _quote_sh_double(command_label),
+        'environments': _build_sh_environments(app['environments']),
+        'volumes': [shlex.quote(_build_sh_mount(app, v)) for v in app['volumes']],
+        'configs': [
+            {
+                'host_path': _quote_sh_double(c['host_path'], expand=True),
+                'container_path': shlex.quote(c['container_path']),
+            }
+            for c in app['configs']
+        ],
+        'labels': [shlex.quote(f'{k}={v}') for k, v in labels.items()],
+        'network': shlex.quote(GLOBAL_NETWORK_NAME),
+    })
+
+
+def generate_app_shims(app, selected_aliases=None, api_version=None):
+    """
+    Render shims for app's enabled entrypoints using app's shim backend. For
+    the python backend, when api_version is given, the container options are
+    compiled into the shim and docker lookups are only done if creating the
+    container fails, otherwise the shim verifies image, network and volumes
+    on every invocation. The sh backend execs `docker run` directly, and the
+    launcher backend has its shims generated by generate_launcher_entries.
+    """
+    backend = app.get('shim_backend') or ShimBackends.PYTHON
+    template = _load_template(backend)
 
     shims = {}
     for entry in app['entrypoints']:
@@ -116,35 +374,49 @@ def generate_app_shims(app, selected_aliases=None):
         if not entry["enabled"]:
             continue
         logger.info(f"generating app shim {entry['alias']} ...")
-        shim = template.render({
-            'app': app,
-            'entrypoint': entry,
-            'volumes': app['volumes'],
-            'configs': app['configs'],
-            'python_path': sys.executable,
-            'meta_labels': CONTAINER_META_LABELS,
-            'network': GLOBAL_NETWORK_NAME,
-        })
-        shims[entry['alias']] = shim
+        if backend == ShimBackends.SH:
+            shims[entry['alias']] = _render_sh_shim(template, app, entry)
+        else:
+            spec = build_shim_spec(app, entry, api_version=api_version, pooled=True)
+            shims[entry['alias']] = _render_shim(template, spec)
     return shims
 
 
-def generate_shell_shim(app):
-    with open(os.path.join(os.path.dirname(__file__),
-                           'shim.tmpl'), 'r') as f_handler:
-        template = Template(f_handler.read())
-
-    return template.render({
-        "app": app,
-        "entrypoint": {"container_entrypoint": app["shell"]},
-        "volumes": app["volumes"],
-        "configs": app["configs"],
-        "python_path": sys.executable,
-        "meta_labels": CONTAINER_META_LABELS,
-        "network": GLOBAL_NETWORK_NAME,
+def generate_launcher():
+    """
+    Render the launcher every alias of the launcher backend links to, which
+    dispatches on the name it is run as.
+    """
+    return _render_shim(_load_template(ShimBackends.LAUNCHER), launcher={
+        'name': LAUNCHER_NAME,
+        'table_name': LAUNCHER_TABLE_NAME,
+        'magic': LAUNCHER_TABLE_MAGIC,
+        'header_format': LAUNCHER_TABLE_HEADER,
+        'entry_format': LAUNCHER_TABLE_ENTRY,
     })
 
 
+def generate_launcher_entries(app, selected_aliases=None, api_version=None):
+    """
+    Build the launcher table's entries of app's enabled entrypoints, mapping
+    aliases to the specs python shims are rendered from.
+    """
+    entries = {}
+    for entry in app['entrypoints']:
+        if selected_aliases and entry["alias"] not in selected_aliases:
+            continue
+        if not entry["enabled"]:
+            continue
+        entries[entry['alias']] = build_shim_spec(app, entry, api_version=api_version,
+                                                  pooled=True)
+    return entries
+
+
+def generate_shell_shim(app):
+    return _render_shim(_load_template(),
+                        build_shim_spec(app, {"container_entrypoint": app["shell"]}))
+
+
 def filter_disabled_aliases(entrypoints):
     return [e["alias"] for e in entrypoints if not e["enabled"]]
 
@@ -159,32 +431,97 @@ def deactive_entrypoints(entrypoints, aliases=None):
         ]
 
 
-def select_proper_version(versions, pinned_version=None):
-    # format versions
-    versions_lst = []
+VersionIndex = collections.namedtuple('VersionIndex', ['keys', 'versions'])
+
+
+@functools.lru_cache(maxsize=1024)
+def build_version_index(versions):
+    """
+    Parse and sort a tuple of version names once, so that the versions of an
+    app can be resolved against many pins with binary searches.
+    """
+    from semantic_version import Version  # noqa, only needed when resolving versions
+
+    parsed = []
     for v in versions:
         try:
-            versions_lst.append([Version(v, partial=True), v])
+            Version(v, partial=True)
         except ValueError:
             logger.warning(f"{v} is not a valid semantic version, "
                            "ignoring it ...")
-    if not versions_lst:
+            continue
+        parsed.append((Version.coerce(v), v))
+    parsed.sort(key=lambda p: p[0])
+    return VersionIndex(tuple(p[0] for p in parsed), tuple(p[1] for p in parsed))
+
+
+def resolve_version(version_index, pinned_version=None):
+    """
+    Returns the latest version of version_index, or the latest one matching
+    pinned_version, which is either a version or a range like `>=1.4,<2`
+    or `~1.2`.
+    """
+    from semantic_version import Spec  # noqa, only needed when resolving versions
+
+    keys, versions = version_index
+    if not keys:
         logger.error("all versions are not valid semantic version format.")
         raise NoValidVersion()
+    if not pinned_version:
+        return versions[-1]
 
-    # select the pinned version
-    if pinned_version:
-        pinned = Version(pinned_version, partial=True)
-        for v in versions_lst:
-            if pinned == v[0]:
-                return v[1]
-        else:
-            logger.error(f"{pinned_version} is not in avaiable versions list.")
-            raise PinnedVersionNotExist()
+    try:
+        spec = Spec(pinned_version)
+    except ValueError:
+        logger.error(f"{pinned_version} is neither a version nor a version range.")
+        raise PinnedVersionNotExist()
+    # narrow the candidates down by the bounds of the range, then look for
+    # the latest match from the upper bound.
+    low, high = 0, len(keys)
+    for item in spec.specs:
+        if item.kind == item.KIND_LT:
+            high = min(high, bisect.bisect_left(keys, item.spec))
+        elif item.kind in (item.KIND_LTE, item.KIND_EQUAL):
+            high = min(high, bisect.bisect_right(keys, item.spec))
+        if item.kind in (item.KIND_GTE, item.KIND_EQUAL):
+            low = max(low, bisect.bisect_left(keys, item.spec))
+        elif item.kind == item.KIND_GT:
+            low = max(low, bisect.bisect_right(keys, item.spec))
+    for i in range(high - 1, low - 1, -1):
+        if spec.match(keys[i]):
+            return versions[i]
+    logger.error(f"{pinned_version} is not in avaiable versions list.")
+    raise PinnedVersionNotExist()
 
-    # select the latest version
-    latest = sorted(versions_lst, key=lambda v: v[0], reverse=True)[0]
-    return latest[1]
+
+def select_proper_version(versions, pinned_version=None):
+    return resolve_version(build_version_index(tuple(sorted(versions))), pinned_version)
+
+
+def build_upgradable_apps(apps, formula_versions):
+    """
+    Returns the apps for which formula_versions, keyed by app name, hold a
+    version newer than the installed one, along with the latest version.
+    Apps pinned to a version range are offered the latest version inside it.
+    """
+    from semantic_version import Version  # noqa, only needed when resolving versions
+
+    upgradable_apps = []
+    for app in apps:
+        versions = formula_versions.get(app['name'])
+        if not versions:
+            continue
+        try:
+            latest_version = select_proper_version(versions, app.get('pinned_version'))
+        except VersionSelectError:
+            continue
+        try:
+            is_newer = Version.coerce(latest_version) > Version.coerce(app['version'])
+        except (TypeError, ValueError):
+            is_newer = latest_version != app['version']
+        if is_newer:
+            upgradable_apps.append({**app, 'latest_version': latest_version})
+    return upgradable_apps
 
 
 def build_formula_folder_path(tap_name, app_name):
@@ -197,6 +534,12 @@ def build_formula_path(tap_name, app_name, version):
                         app_name, version)
 
 
+def build_app_label(app):
+    """Returns a label telling app apart from the apps of other venvs and pins."""
+    label = f"{app['name']}📌 {app['pinned_version']}" if app.get('pinned_version') else app['name']
+    return f"{app['venv']}/{label}" if app.get('venv') else label
+
+
 def get_app_status(app_data):
     entrypoints_enabled_status_lst = [e["enabled"] for e in app_data["entrypoints"]]
     if all(entrypoints_enabled_status_lst):
@@ -244,29 +587,40 @@ def diff_app_data(old_app, new_app):
     change_set["changed_meta_data"] = {
         field: new_app[field]
         for field in ("version", "description", "image", "environments",
-                      "shell")
+                      "shell", "pool", "shim_backend")
         if new_app[field] != old_app[field]
     }
 
     return change_set
 
 
-def _diff_lst(old_lst, new_lst, keys):
-    old_set = {tuple(i[k] for k in keys) for i in old_lst}
-    new_set = {tuple(i[k] for k in keys) for i in new_lst}
-    deleted_items = [
-        item
-        for key in old_set - new_set
-        for item in old_lst if key == tuple(item[k] for k in keys)
-    ]
-    added_items = [
-        item
-        for key in new_set - old_set
-        for item in new_lst if key == tuple(item[k] for k in keys)
+def diff_installed_apps(installed_apps, locked_apps):
+    """
+    Diff installed tap apps against locked apps, which are told apart by
+    venv, name and pin. Returns locked apps to install, pairs of installed
+    and locked apps whose tap or version differ, installed apps which are not
+    locked and installed apps already matching their locks.
+    """
+    keys = ('venv', 'name', 'pinned_version')
+    deleted_apps, added_apps, unchanged_apps = _diff_lst(
+        installed_apps, locked_apps, keys + ('tap_alias', 'version'))
+    added_apps = {tuple(a[k] for k in keys): a for a in added_apps}
+    changed_apps = [
+        (a, added_apps.pop(tuple(a[k] for k in keys)))
+        for a in deleted_apps if tuple(a[k] for k in keys) in added_apps
     ]
-    unchanged_items = [
-        item
-        for key in old_set & new_set
-        for item in old_lst if key == tuple(item[k] for k in keys)
-    ]
-    return deleted_items, added_items, unchanged_items
\ No newline at end of file
+    changed_ids = {a['id'] for a, _ in changed_apps}
+    deleted_apps = [a for a in deleted_apps if a['id'] not in changed_ids]
+    return list(added_apps.values()), changed_apps, deleted_apps, unchanged_apps
+
+
+def _diff_lst(old_lst, new_lst, keys):
+    def key_of(item):
+        return tuple(item[k] for k in keys)
+
+    old_set = {key_of(i) for i in old_lst}
+    new_set = {key_of(i) for i in new_lst}
+    deleted_items = [i for i in old_lst if key_of(i) not in new_set]
+    added_items = [i for i in new_lst if key_of(i) not in old_set]
+    unchanged_items = [i for i in old_lst if key_of(i) in new_set]
+    return deleted_items, added_items, unchanged_items
@@ -1,2 +1,3 @@
 from uam.entities.exceptions.app import *
-from uam.entities.exceptions.tap import *
\ No newline at end of file
+from uam.entities.exceptions.tap import *
+from uam.entities.exceptions.lock import *
\ No newline at end of file
@@ -0,0 +1,7 @@
+class LockfileMalformed(Exception):
+    message = "lockfile is malformed, {}."
+
+    def __init__(self, reason):
+        self.reason = reason
+        self.message = self.message.format(reason)
+        super(LockfileMalformed, self).__init__(self.message)
@@ -0,0 +1,28 @@
+import hashlib
+import os
+
+from uam.settings import IMAGE_PULL_LOCK_PATH
+
+
+def normalize_image_reference(image):
+    """
+    Add the implicit latest tag to an image reference, so that `alpine` and
+    `alpine:latest` are known to be the same image.
+    """
+    if '@' in image:
+        return image
+    name = image.rsplit('/', 1)[-1]
+    return image if ':' in name else f'{image}:latest'
+
+
+def build_image_lock_path(image):
+    digest = hashlib.sha1(normalize_image_reference(image).encode()).hexdigest()
+    return os.path.join(IMAGE_PULL_LOCK_PATH, f"{digest}.lock")
+
+
+def group_apps_by_image(apps):
+    """Returns apps grouped by the normalized image they run."""
+    images = {}
+    for a in apps:
+        images.setdefault(normalize_image_reference(a['image']), []).append(a)
+    return images
@@ -0,0 +1,67 @@
+import logging
+
+from uam.entities.exceptions.lock import LockfileMalformed
+
+
+logger = logging.getLogger(__name__)
+
+
+def parse_lockfile(content: str):
+    """
+    Parse a lockfile locking taps, venvs and apps, e.g.
+
+        taps:
+          mytap: me/uam-tap
+        venvs:
+          - web
+        apps:
+          - {name: jq, tap: core, version: 1.6.0}
+          - {name: node, tap: mytap, version: 8.9.4, pinned: "8", venv: web}
+
+    Apps are installed into the default venv unless venv is given. Versions
+    which yaml reads as numbers, like 1.10, must be quoted.
+    """
+    import yaml  # noqa, parsing lockfiles is not needed by most commands
+
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    try:
+        data = yaml.load(content, Loader=loader) or {}
+    except yaml.error.YAMLError as exc:
+        raise LockfileMalformed(f"it does not match yaml format: {exc}")
+    if not isinstance(data, dict):
+        raise LockfileMalformed("it is not a yaml mapping")
+
+    taps = data.get('taps') or {}
+    if not isinstance(taps, dict):
+        raise LockfileMalformed("taps should map tap names to addresses")
+    venvs = data.get('venvs') or []
+    if not isinstance(venvs, list):
+        raise LockfileMalformed("venvs should be a list of venv names")
+    apps = data.get('apps') or []
+    if not isinstance(apps, list):
+        raise LockfileMalformed("apps should be a list")
+
+    locked_apps, locked_keys = [], set()
+    for a in apps:
+        if not isinstance(a, dict) or not all(a.get(k) for k in ('name', 'tap', 'version')):
+            raise LockfileMalformed(f"app {a} should have a name, a tap and a version")
+        if isinstance(a['version'], float):
+            raise LockfileMalformed(f"version {a['version']} of {a['name']} should be quoted")
+        app = {
+            'name': str(a['name']),
+            'tap_alias': str(a['tap']),
+            'version': str(a['version']),
+            'pinned_version': str(a.get('pinned') or ''),
+            'venv': str(a.get('venv') or ''),
+        }
+        key = (app['venv'], app['name'], app['pinned_version'])
+        if key in locked_keys:
+            raise LockfileMalformed(f"app {app['name']} is locked twice")
+        locked_keys.add(key)
+        locked_apps.append(app)
+
+    return {
+        'taps': [{'alias': str(k), 'address': str(v)} for k, v in taps.items()],
+        'venvs': sorted({str(v) for v in venvs} | {a['venv'] for a in locked_apps if a['venv']}),
+        'apps': locked_apps,
+    }
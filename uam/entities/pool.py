@@ -0,0 +1,37 @@
+import os
+
+from uam.settings import (CONTAINER_META_LABELS, CONTAINER_POOL_PATH,
+                          CONTAINER_POOL_KEY_LABEL, CONTAINER_POOL_IDLE_TIMEOUT)
+
+
+def build_pool_labels():
+    return [
+        f"provider={CONTAINER_META_LABELS['provider']}",
+        CONTAINER_POOL_KEY_LABEL,
+    ]
+
+
+def build_pool_lock_path(container_id):
+    return os.path.join(CONTAINER_POOL_PATH, f"{container_id}.lock")
+
+
+def build_pool_status(containers, lock_states, now):
+    status = []
+    for c in containers:
+        labels = c["labels"]
+        lock_state = lock_states.get(c["id"])
+        idle_timeout = int(labels.get("pool_idle_timeout", CONTAINER_POOL_IDLE_TIMEOUT))
+        busy = bool(lock_state and lock_state["locked"])
+        last_used = lock_state["mtime"] if lock_state else c["created"]
+        idle_seconds = 0 if busy else max(int(now - last_used), 0)
+        status.append({
+            "container_id": c["id"],
+            "name": c["name"],
+            "app": labels.get("app", ""),
+            "cwd": labels.get("pool_cwd", ""),
+            "busy": busy,
+            "idle_seconds": idle_seconds,
+            "idle_timeout": idle_timeout,
+            "expired": not busy and idle_seconds > idle_timeout,
+        })
+    return sorted(status, key=lambda s: (s["app"], s["cwd"], s["idle_seconds"]))
@@ -0,0 +1,43 @@
+import re
+
+
+def _version_key(version):
+    from semantic_version import Version  # noqa, only needed when resolving versions
+
+    try:
+        return (1, Version(version, partial=True), version)
+    except ValueError:
+        return (0, None, version)
+
+
+def select_latest_formulas(formulas):
+    """
+    Returns the formula of the latest version of every app among formulas,
+    versions which are not semantic are considered older than the others.
+    """
+    latest = {}
+    for f in formulas:
+        current = latest.get(f['app_name'])
+        if not current or _version_key(f['version']) > _version_key(current['version']):
+            latest[f['app_name']] = f
+    return list(latest.values())
+
+
+def build_search_entry(formula, data):
+    entrypoints = data.get('entrypoints') or {}
+    return {
+        'app_name': formula['app_name'],
+        'version': formula['version'],
+        'description': str(data.get('description') or ''),
+        'aliases': ' '.join(str(a) for a in entrypoints) if isinstance(entrypoints, dict) else '',
+        'image': str(data.get('image') or ''),
+    }
+
+
+def build_search_query(query):
+    """
+    Turn user's query into an fts5 query matching every word of it as a
+    prefix, or an empty string when there is no word to search for.
+    """
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{w}"*' for w in words)
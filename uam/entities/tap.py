@@ -1,9 +1,11 @@
+import os
 import re
 import logging
 
 from uam.entities.exceptions import AliasConflict, AddressConflict
 
-from uam.settings import BUILTIN_TAPS
+from uam.settings import (BUILTIN_TAPS, TAP_PATH, FORMULA_FOLDER_NAME, FORMULA_EXTENSIONS,
+                          TAP_SPARSE_CHECKOUT)
 
 
 logger = logging.getLogger(__name__)
@@ -44,4 +46,27 @@ def is_tap_builtin(alias):
     for t in BUILTIN_TAPS:
         if alias == t["alias"]:
             return True
-    return False
\ No newline at end of file
+    return False
+
+
+def build_tap_formula_folder_path(alias):
+    return os.path.join(TAP_PATH, alias, FORMULA_FOLDER_NAME)
+
+
+def build_tap_sparse_paths():
+    """Returns paths of a tap to check out, or None to check out all of it."""
+    return [FORMULA_FOLDER_NAME] if TAP_SPARSE_CHECKOUT else None
+
+
+def parse_formula_path(path):
+    """
+    Returns app name and version of a formula file given by its path inside
+    a tap, or None if the path is not a formula.
+    """
+    parts = path.split('/')
+    if len(parts) != 3 or parts[0] != FORMULA_FOLDER_NAME:
+        return None
+    version, ext = os.path.splitext(parts[2])
+    if ext.lstrip('.') not in FORMULA_EXTENSIONS:
+        return None
+    return parts[1], version
@@ -1,21 +1,34 @@
 import click
 
+from uam.settings import ShimBackends, setup_logging
+
 from . import tap
 from . import app
 from . import system
 from . import venv
+from . import daemon
+from . import pool
+from . import cache
+from . import search
+from . import sync
 
 
 @click.group()
 def uam():
-    pass
+    setup_logging()
 
 
 @click.command()
 @click.argument("app_name")
-@click.option("--pinned", default="")
+@click.option("--pinned", default="",
+              help="version to install, or a range like '>=1.4,<2' or '~1.2'.")
+@click.option("--verify", is_flag=True,
+              help="check docker image, network and volumes on every run.")
+@click.option("--backend", type=click.Choice([ShimBackends.PYTHON, ShimBackends.SH,
+                                              ShimBackends.LAUNCHER]),
+              default=None, help="shim backend, overrides the formula's shim_backend.")
 @click.pass_context
-def install(ctx, app_name, pinned):
+def install(ctx, app_name, pinned, verify, backend):
     ctx.forward(app.install)
 
 
@@ -42,12 +55,34 @@ def ls(ctx):
 
 
 @click.command()
-@click.argument("app_name")
+@click.argument("app_name", required=False)
+@click.option("--pinned", default="")
+@click.option("--all", "upgrade_all", is_flag=True,
+              help="upgrade every outdated app.")
+@click.option("--verify", is_flag=True,
+              help="check docker image, network and volumes on every run.")
 @click.pass_context
-def upgrade(ctx, app_name):
+def upgrade(ctx, app_name, pinned, upgrade_all, verify):
     ctx.forward(app.upgrade_app)
 
 
+@click.command()
+@click.pass_context
+def outdated(ctx):
+    ctx.forward(app.outdated)
+
+
+@click.command()
+@click.argument("app_names", nargs=-1)
+@click.option("--all", "pull_all", is_flag=True,
+              help="pull images of every app of every venv.")
+@click.option("--concurrency", type=int, default=None,
+              help="number of images pulled at the same time.")
+@click.pass_context
+def pull(ctx, app_names, pull_all, concurrency):
+    ctx.forward(app.pull)
+
+
 @click.command()
 @click.pass_context
 def init(ctx):
@@ -66,9 +101,16 @@ uam.add_command(uninstall)
 uam.add_command(shell)
 uam.add_command(ls)
 uam.add_command(upgrade)
+uam.add_command(outdated)
+uam.add_command(pull)
 uam.add_command(init)
 uam.add_command(workon)
 uam.add_command(tap.tap)
 uam.add_command(app.app)
 uam.add_command(system.system)
-uam.add_command(venv.venv)
\ No newline at end of file
+uam.add_command(venv.venv)
+uam.add_command(daemon.daemon)
+uam.add_command(pool.pool)
+uam.add_command(cache.cache)
+uam.add_command(search.search)
+uam.add_command(sync.sync)
\ No newline at end of file
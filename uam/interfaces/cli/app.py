@@ -1,13 +1,7 @@
 import click
-import crayons
 
-from uam.settings import CURRENT_VENV
-from uam.usecases import app as app_usecases
+from uam.settings import CURRENT_VENV, ShimBackends
 from uam.usecases.exceptions import app as app_excs
-from uam.entities.app import AppStatus
-from uam.adapters.database.gateway import DatabaseGateway
-from uam.adapters.docker.gateway import DockerServiceGateway
-from uam.adapters.system.gateway import SystemGateway
 
 from .helper import ClickHelper as helper
 
@@ -19,25 +13,41 @@ def app():
 
 @click.command()
 @click.argument("app_name")
-@click.option("--pinned", default="")
+@click.option("--pinned", default="",
+              help="version to install, or a range like '>=1.4,<2' or '~1.2'.")
+@click.option("--verify", is_flag=True,
+              help="check docker image, network and volumes on every run.")
+@click.option("--backend", type=click.Choice([ShimBackends.PYTHON, ShimBackends.SH,
+                                              ShimBackends.LAUNCHER]),
+              default=None, help="shim backend, overrides the formula's shim_backend.")
 @helper.handle_errors()
-def install(app_name, pinned):
+def install(app_name, pinned, verify, backend):
+    from uam.usecases import app as app_usecases
+    from uam.adapters.database.gateway import DatabaseGateway
+    from uam.adapters.docker.gateway import DockerServiceGateway
+    from uam.adapters.system.gateway import SystemGateway
+
     try:
         app = app_usecases.install_app(DatabaseGateway, SystemGateway,
-                                       app_name, pinned_version=pinned,
-                                       venv=CURRENT_VENV)
+                                       DockerServiceGateway, app_name,
+                                       pinned_version=pinned, venv=CURRENT_VENV,
+                                       verify=verify, shim_backend=backend)
     except app_excs.AppEntryPointsConflicted as exc:
         if helper.confirm("Commands '{}' already exist, do you want to override them? "
                           .format(', '.join(exc.conflicted_aliases))):
             app = app_usecases.install_app(DatabaseGateway, SystemGateway,
-                                           app_name, override_entrypoints=True,
-                                           pinned_version=pinned, venv=CURRENT_VENV)
+                                           DockerServiceGateway, app_name,
+                                           override_entrypoints=True,
+                                           pinned_version=pinned, venv=CURRENT_VENV,
+                                           verify=verify, shim_backend=backend)
         else:
             app = app_usecases.install_app(DatabaseGateway, SystemGateway,
-                                           app_name, override_entrypoints=False,
-                                           pinned_version=pinned, venv=CURRENT_VENV)
+                                           DockerServiceGateway, app_name,
+                                           override_entrypoints=False,
+                                           pinned_version=pinned, venv=CURRENT_VENV,
+                                           verify=verify, shim_backend=backend)
     if helper.confirm(f"Do you want to download image {app['image']} now?"):
-        app_usecases.download_app_image(DatabaseGateway, DockerServiceGateway,
+        app_usecases.download_app_image(DatabaseGateway, SystemGateway, DockerServiceGateway,
                                         app["name"], pinned_version=pinned,
                                         venv=CURRENT_VENV)
     helper.echo_success(f"{app['name']} installed.")
@@ -48,6 +58,11 @@ def install(app_name, pinned):
 @click.option("--pinned", default="")
 @helper.handle_errors()
 def uninstall(app_name, pinned):
+    from uam.usecases import app as app_usecases
+    from uam.adapters.database.gateway import DatabaseGateway
+    from uam.adapters.docker.gateway import DockerServiceGateway
+    from uam.adapters.system.gateway import SystemGateway
+
     app_usecases.uninstall_app(DatabaseGateway, SystemGateway,
                                DockerServiceGateway, app_name, pinned_version=pinned,
                                venv=CURRENT_VENV)
@@ -59,24 +74,103 @@ def uninstall(app_name, pinned):
 @click.option("--pinned", default="")
 @helper.handle_errors()
 def exec_app(app_name, pinned):
+    from uam.usecases import app as app_usecases
+    from uam.adapters.database.gateway import DatabaseGateway
+    from uam.adapters.system.gateway import SystemGateway
+
     app_usecases.exec_app(DatabaseGateway, SystemGateway, app_name,
                           pinned_version=pinned, venv=CURRENT_VENV)
 
 
 @click.command("ls")
 def list_apps():
+    from uam.usecases import app as app_usecases
+    from uam.adapters.database.gateway import DatabaseGateway
+
     app_lst = app_usecases.list_apps(DatabaseGateway, venv=CURRENT_VENV)
     click.echo(display_app_list(app_lst))
 
 
 @click.command("upgrade")
-@click.argument("app_name")
+@click.argument("app_name", required=False)
+@click.option("--pinned", default="")
+@click.option("--all", "upgrade_all", is_flag=True,
+              help="upgrade every outdated app.")
+@click.option("--verify", is_flag=True,
+              help="check docker image, network and volumes on every run.")
 @helper.handle_errors()
-def upgrade_app(app_name):
-    click.echo(f"upgrading app {app_name} ...")
+def upgrade_app(app_name, pinned, upgrade_all, verify):
+    from uam.usecases import app as app_usecases
+    from uam.usecases.exceptions import AppsUpgradeFailed
+    from uam.adapters.database.gateway import DatabaseGateway
+    from uam.adapters.docker.gateway import DockerServiceGateway
+    from uam.adapters.system.gateway import SystemGateway
+
+    if upgrade_all:
+        click.echo("upgrading all outdated apps ...")
+        upgraded_apps, failures = app_usecases.upgrade_all_apps(
+            DatabaseGateway, SystemGateway, DockerServiceGateway,
+            venv=CURRENT_VENV, verify=verify)
+        if failures:
+            click.echo(display_failures(failures, "app"))
+            helper.echo_errors(AppsUpgradeFailed(list(failures)))
+        helper.echo_success(f"{len(upgraded_apps)} apps upgraded.")
+        return
+    if not app_name:
+        raise click.UsageError("missing argument app_name, or use --all.")
+
+    click.echo(f"upgrading app {format_name(app_name, pinned)} ...")
     app_usecases.update_app(DatabaseGateway, SystemGateway, DockerServiceGateway,
-                            app_name, venv=CURRENT_VENV)
-    helper.echo_success(f"{app_name} upgraded.")
+                            app_name, pinned_version=pinned, venv=CURRENT_VENV,
+                            verify=verify)
+    helper.echo_success(f"{format_name(app_name, pinned)} upgraded.")
+
+
+@click.command("outdated")
+@helper.handle_errors()
+def outdated():
+    from uam.usecases import app as app_usecases
+    from uam.adapters.database.gateway import DatabaseGateway
+    from .tap import display_upgradable_apps
+
+    outdated_apps = app_usecases.list_outdated_apps(DatabaseGateway, venv=CURRENT_VENV)
+    if not outdated_apps:
+        helper.echo_success("all apps are up to date.")
+        return
+    click.echo(display_upgradable_apps(outdated_apps))
+
+
+@click.command("pull")
+@click.argument("app_names", nargs=-1)
+@click.option("--all", "pull_all", is_flag=True,
+              help="pull images of every app of every venv.")
+@click.option("--concurrency", type=int, default=None,
+              help="number of images pulled at the same time.")
+@helper.handle_errors()
+def pull(app_names, pull_all, concurrency):
+    from uam.usecases import app as app_usecases
+    from uam.usecases.exceptions import ImagesPullFailed
+    from uam.adapters.database.gateway import DatabaseGateway
+    from uam.adapters.docker.gateway import DockerServiceGateway
+    from uam.adapters.system.gateway import SystemGateway
+    from uam.settings import IMAGE_PULL_CONCURRENCY
+
+    if not app_names and not pull_all:
+        raise click.UsageError("missing argument app_names, or use --all.")
+
+    def echo_progress(done, total, current_bytes, total_bytes):
+        click.echo(f"\rpulled {done}/{total} images, "
+                   f"{current_bytes / 2 ** 20:.1f}/{total_bytes / 2 ** 20:.1f} MiB", nl=False)
+
+    images, failures = app_usecases.pull_app_images(
+        DatabaseGateway, SystemGateway, DockerServiceGateway,
+        app_names=None if pull_all else list(app_names), venv=CURRENT_VENV,
+        concurrency=concurrency or IMAGE_PULL_CONCURRENCY, on_progress=echo_progress)
+    click.echo()
+    if failures:
+        click.echo(display_failures(failures, "image"))
+        helper.echo_errors(ImagesPullFailed(list(failures)))
+    helper.echo_success(f"{len(images) - len(failures)} images pulled.")
 
 
 @click.command("active")
@@ -84,9 +178,14 @@ def upgrade_app(app_name):
 @click.option("--pinned", default="")
 @helper.handle_errors()
 def active(app_name, pinned):
+    from uam.usecases import app as app_usecases
+    from uam.adapters.database.gateway import DatabaseGateway
+    from uam.adapters.docker.gateway import DockerServiceGateway
+    from uam.adapters.system.gateway import SystemGateway
+
     click.echo(f"activing app {format_name(app_name, pinned)} ...")
-    app_usecases.active_app(DatabaseGateway, SystemGateway, app_name, pinned,
-                            venv=CURRENT_VENV)
+    app_usecases.active_app(DatabaseGateway, SystemGateway, DockerServiceGateway,
+                            app_name, pinned, venv=CURRENT_VENV)
     helper.echo_success(f"{format_name(app_name, pinned)} actived.")
 
 
@@ -94,11 +193,19 @@ def active(app_name, pinned):
 @click.argument("app_name")
 @click.argument("formula_path", default="")
 @click.option("--pinned", default="")
+@click.option("--verify", is_flag=True,
+              help="check docker image, network and volumes on every run.")
 @helper.handle_errors()
-def reinstall(app_name, formula_path, pinned):
+def reinstall(app_name, formula_path, pinned, verify):
+    from uam.usecases import app as app_usecases
+    from uam.adapters.database.gateway import DatabaseGateway
+    from uam.adapters.docker.gateway import DockerServiceGateway
+    from uam.adapters.system.gateway import SystemGateway
+
     click.echo(f"reinstalling app {format_name(app_name, pinned)} ...")
     app_usecases.reinstall_app(DatabaseGateway, SystemGateway, DockerServiceGateway,
-                               app_name, pinned, venv=CURRENT_VENV, formula_path=formula_path)
+                               app_name, pinned, venv=CURRENT_VENV, formula_path=formula_path,
+                               verify=verify)
     helper.echo_success(f"{format_name(app_name, pinned)} reinstalled.")
 
 
@@ -107,6 +214,8 @@ app.add_command(uninstall)
 app.add_command(exec_app)
 app.add_command(list_apps)
 app.add_command(upgrade_app)
+app.add_command(outdated)
+app.add_command(pull)
 app.add_command(active)
 app.add_command(reinstall)
 
@@ -119,6 +228,9 @@ def format_name(app_name, pinned=None):
 
 
 def display_app_list(app_lst):
+    import crayons
+    from uam.entities.app import AppStatus
+
     app_display_lst = []
     for name, versions in app_lst.items():
         sorted_versions = sorted(versions, key=lambda v: (v["pinned"], v["version"]))
@@ -137,4 +249,11 @@ def display_app_list(app_lst):
         versions_display_text = ", ".join(version_display_lst)
         app_display_text = f"{name}({versions_display_text})"
         app_display_lst.append(app_display_text)
-    return "    ".join(app_display_lst)
\ No newline at end of file
+    return "    ".join(app_display_lst)
+
+
+def display_failures(failures, header):
+    from tabulate import tabulate
+
+    table = [[name, reason] for name, reason in failures.items()]
+    return tabulate(table, [header, 'error'], tablefmt="rst")
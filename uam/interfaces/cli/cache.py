@@ -0,0 +1,44 @@
+import click
+
+from .helper import ClickHelper as helper
+
+
+@click.group()
+def cache():
+    pass
+
+
+@click.command()
+@helper.handle_errors()
+def stats():
+    from uam.usecases import cache as cache_usecases
+    from uam.adapters.system.gateway import SystemGateway
+
+    click.echo(display_cache_stats(
+        cache_usecases.get_formula_cache_stats(SystemGateway)))
+
+
+@click.command()
+@helper.handle_errors()
+def clear():
+    from uam.usecases import cache as cache_usecases
+    from uam.adapters.system.gateway import SystemGateway
+
+    cache_usecases.clear_formula_cache(SystemGateway)
+    helper.echo_success("formula cache cleared.")
+
+
+cache.add_command(stats)
+cache.add_command(clear)
+
+
+def display_cache_stats(stats):
+    from tabulate import tabulate
+
+    table = [[
+        stats['memory_hits'], stats['disk_hits'], stats['misses'],
+        f"{stats['hit_rate']:.1%}", stats['entries'],
+        f"{stats['size'] / 1024:.1f}K/{stats['max_size'] / 1024:.0f}K",
+    ]]
+    headers = ['memory hits', 'disk hits', 'misses', 'hit rate', 'entries', 'size']
+    return tabulate(table, headers, tablefmt="rst")
@@ -0,0 +1,68 @@
+import os
+import sys
+
+import click
+
+from uam.settings import DAEMON_SOCKET_PATH, DAEMON_LOG_PATH
+
+from .helper import ClickHelper as helper
+
+
+@click.group()
+def daemon():
+    pass
+
+
+@click.command()
+@click.option("--foreground", is_flag=True, help="do not detach from the terminal.")
+@helper.handle_errors()
+def start(foreground):
+    from uam.interfaces.daemon import server
+
+    if server.is_running():
+        helper.echo_success(f"uam daemon is already running on {DAEMON_SOCKET_PATH}.")
+        return
+    if not foreground:
+        click.echo(f"starting uam daemon, logs are written to {DAEMON_LOG_PATH} ...")
+        if os.fork():
+            return
+        os.setsid()
+        if os.fork():
+            os._exit(0)
+        os.makedirs(os.path.dirname(DAEMON_LOG_PATH), exist_ok=True)
+        log_fd = os.open(DAEMON_LOG_PATH, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        null_fd = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(null_fd, 0)
+        os.dup2(log_fd, 1)
+        os.dup2(log_fd, 2)
+    server.serve()
+    if not foreground:
+        os._exit(0)
+
+
+@click.command()
+@helper.handle_errors()
+def stop():
+    from uam.interfaces.daemon import server
+
+    if server.stop():
+        helper.echo_success("uam daemon stopped.")
+    else:
+        click.echo("uam daemon is not running.")
+
+
+@click.command()
+@helper.handle_errors()
+def status():
+    from uam.interfaces.daemon import server
+
+    if server.is_running():
+        click.echo(f"uam daemon is running (pid {server.read_pid()}) on {DAEMON_SOCKET_PATH}.")
+    else:
+        click.echo("uam daemon is not running.")
+        sys.exit(1)
+
+
+daemon.add_command(start)
+daemon.add_command(stop)
+daemon.add_command(status)
@@ -0,0 +1,54 @@
+import click
+
+from uam.adapters.docker.exceptions import DockerServiceUnavailable
+
+from .helper import ClickHelper as helper
+
+
+@click.group()
+def pool():
+    pass
+
+
+@click.command()
+@helper.handle_errors(resource_errors=[DockerServiceUnavailable])
+def status():
+    from uam.usecases import pool as pool_usecases
+    from uam.adapters.docker.gateway import DockerServiceGateway
+    from uam.adapters.system.gateway import SystemGateway
+
+    click.echo(display_pool_status(
+        pool_usecases.list_pool(DockerServiceGateway, SystemGateway)))
+
+
+@click.command()
+@click.option("--all", "prune_all", is_flag=True,
+              help="remove idle pooled containers even if they are not expired.")
+@helper.handle_errors(resource_errors=[DockerServiceUnavailable])
+def prune(prune_all):
+    from uam.usecases import pool as pool_usecases
+    from uam.adapters.docker.gateway import DockerServiceGateway
+    from uam.adapters.system.gateway import SystemGateway
+
+    pruned = pool_usecases.prune_pool(DockerServiceGateway, SystemGateway,
+                                      prune_all=prune_all)
+    helper.echo_success(f"{len(pruned)} pooled containers removed.")
+
+
+pool.add_command(status)
+pool.add_command(prune)
+
+
+def display_pool_status(pool_status):
+    from tabulate import tabulate
+
+    table = [
+        [
+            s['app'], s['container_id'][:12], s['cwd'],
+            'busy' if s['busy'] else 'idle',
+            f"{s['idle_seconds']}s/{s['idle_timeout']}s",
+        ]
+        for s in pool_status
+    ]
+    headers = ['app', 'container', 'cwd', 'state', 'idle']
+    return tabulate(table, headers, tablefmt="rst")
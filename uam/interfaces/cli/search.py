@@ -0,0 +1,29 @@
+import click
+
+from .helper import ClickHelper as helper
+
+
+@click.command()
+@click.argument("query", nargs=-1, required=True)
+@click.option("--limit", default=20, help="maximum number of apps to show.")
+@helper.handle_errors()
+def search(query, limit):
+    from uam.usecases import search as search_usecases
+    from uam.adapters.database.gateway import DatabaseGateway
+
+    results = search_usecases.search_formulas(DatabaseGateway, " ".join(query), limit=limit)
+    if not results:
+        click.echo("no formulas matched.")
+        return
+    click.echo(display_search_results(results))
+
+
+def display_search_results(results):
+    from tabulate import tabulate
+
+    table = [
+        [r['app_name'], r['tap_alias'], r['version'], r['description']]
+        for r in results
+    ]
+    headers = ['app', 'tap', 'version', 'description']
+    return tabulate(table, headers, tablefmt="rst", disable_numparse=True)
@@ -0,0 +1,34 @@
+import click
+
+from .helper import ClickHelper as helper
+from .app import display_failures
+
+
+@click.command()
+@click.argument("lockfile", default="uam.lock")
+@click.option("--prune", is_flag=True,
+              help="uninstall tap apps of the locked venvs which are not locked.")
+@click.option("--verify", is_flag=True,
+              help="check docker image, network and volumes on every run.")
+@click.option("--concurrency", type=int, default=None,
+              help="number of apps synced at the same time.")
+@helper.handle_errors()
+def sync(lockfile, prune, verify, concurrency):
+    from uam.usecases import sync as sync_usecases
+    from uam.usecases.exceptions import AppsSyncFailed
+    from uam.adapters.database.gateway import DatabaseGateway
+    from uam.adapters.docker.gateway import DockerServiceGateway
+    from uam.adapters.system.gateway import SystemGateway
+    from uam.settings import UPGRADE_CONCURRENCY
+
+    click.echo(f"syncing apps with {lockfile} ...")
+    synced, failures = sync_usecases.sync_lockfile(
+        DatabaseGateway, SystemGateway, DockerServiceGateway, lockfile, prune=prune,
+        verify=verify, concurrency=concurrency or UPGRADE_CONCURRENCY)
+    if failures:
+        click.echo(display_failures(failures, "app"))
+        helper.echo_errors(AppsSyncFailed(list(failures)))
+    helper.echo_success(
+        f"{len(synced['taps'])} taps added, {len(synced['installed'])} apps installed, "
+        f"{len(synced['changed'])} changed, {len(synced['uninstalled'])} uninstalled, "
+        f"{len(synced['unchanged'])} unchanged.")
@@ -1,10 +1,5 @@
 import click
 
-from uam.adapters.database.gateway import DatabaseGateway
-from uam.adapters.docker.gateway import DockerServiceGateway
-from uam.adapters.system.gateway import SystemGateway
-from uam.usecases import system as system_usecases
-
 from .helper import ClickHelper as helper
 
 
@@ -16,10 +11,28 @@ def system():
 @click.command()
 @helper.handle_exception()
 def init():
+    from uam.usecases import system as system_usecases
+    from uam.adapters.database.gateway import DatabaseGateway
+    from uam.adapters.docker.gateway import DockerServiceGateway
+    from uam.adapters.system.gateway import SystemGateway
+
     click.echo("initializing uam environment")
     system_usecases.initialize(SystemGateway, DatabaseGateway,
                                DockerServiceGateway)
     helper.echo_success("uam environment setup.")
 
 
-system.add_command(init)
\ No newline at end of file
+@click.command()
+@click.option("--venv", "venv_name", default="",
+              help="venv whose shims are rolled back, the default venv if not given.")
+@helper.handle_errors()
+def rollback(venv_name):
+    from uam.usecases import system as system_usecases
+    from uam.adapters.system.gateway import SystemGateway
+
+    _, generation = system_usecases.rollback_shims(SystemGateway, venv=venv_name)
+    helper.echo_success(f"shims are rolled back to generation {generation}.")
+
+
+system.add_command(init)
+system.add_command(rollback)
\ No newline at end of file
@@ -1,9 +1,5 @@
 import click
-from tabulate import tabulate
 
-from uam.adapters.system.gateway import SystemGateway
-from uam.adapters.database.gateway import DatabaseGateway
-from uam.usecases import tap as tap_usecases
 from uam.usecases.exceptions import tap as tap_excs
 
 from .helper import ClickHelper as helper
@@ -20,6 +16,10 @@ def tap():
 @click.option("--priority", default=0)
 @helper.handle_exception(tap_excs.TapAddError)
 def add(alias, address, priority):
+    from uam.usecases import tap as tap_usecases
+    from uam.adapters.database.gateway import DatabaseGateway
+    from uam.adapters.system.gateway import SystemGateway
+
     click.echo(f"adding tap {alias} using address {address} ...")
     tap_usecases.add_tap(SystemGateway, DatabaseGateway,
                          alias, address, priority=priority)
@@ -30,6 +30,10 @@ def add(alias, address, priority):
 @click.argument("alias")
 @helper.handle_exception(tap_excs.TapRemoveError)
 def rm(alias):
+    from uam.usecases import tap as tap_usecases
+    from uam.adapters.database.gateway import DatabaseGateway
+    from uam.adapters.system.gateway import SystemGateway
+
     click.echo(f"removing tap {alias} ...")
     tap_usecases.remove_tap(SystemGateway, DatabaseGateway, alias)
     helper.echo_success(f'{alias} removed!')
@@ -37,6 +41,9 @@ def rm(alias):
 
 @click.command()
 def ls():
+    from uam.usecases import tap as tap_usecases
+    from uam.adapters.database.gateway import DatabaseGateway
+
     click.echo(f"listing all added taps ...")
     click.echo(
         display_tap_list(
@@ -45,10 +52,29 @@ def ls():
 
 @click.command()
 @click.argument("alias", default='')
-def update(alias):
+@click.option("--concurrency", type=int, default=None,
+              help="number of taps pulled at the same time.")
+@click.option("--timeout", type=int, default=None,
+              help="seconds to wait for pulling a single tap.")
+@helper.handle_errors()
+def update(alias, concurrency, timeout):
+    from uam.usecases import tap as tap_usecases
+    from uam.usecases.exceptions import TapUpdateFailed
+    from uam.adapters.database.gateway import DatabaseGateway
+    from uam.adapters.system.gateway import SystemGateway
+
     click.echo(f"updateing tap {alias} ...")
-    tap_usecases.update_tap(SystemGateway, DatabaseGateway, alias)
-    helper.echo_success('all taps updated!')
+    options = {k: v for k, v in (("concurrency", concurrency), ("timeout", timeout)) if v}
+    upgradable_apps, failures = tap_usecases.update_tap(SystemGateway, DatabaseGateway,
+                                                        alias, **options)
+    if failures:
+        click.echo(display_tap_failures(failures))
+        helper.echo_errors(TapUpdateFailed(list(failures)))
+    else:
+        helper.echo_success('all taps updated!')
+    if upgradable_apps:
+        click.echo("newer versions of installed apps are available:")
+        click.echo(display_upgradable_apps(upgradable_apps))
 
 
 tap.add_command(add)
@@ -58,8 +84,33 @@ tap.add_command(update)
 
 
 def display_tap_list(tap_list):
+    from tabulate import tabulate
+
     table = [
         [t['alias'], t['address'], t['priority']] for t in tap_list
     ]
     headers = ['alias', 'address', 'priority']
     return tabulate(table, headers, tablefmt="rst")
+
+
+def display_upgradable_apps(apps):
+    from tabulate import tabulate
+
+    table = [
+        [
+            f"{a['name']}📌 {a['pinned_version']}" if a.get('pinned_version') else a['name'],
+            a['venv'] or '-', a['version'], a['latest_version'],
+        ]
+        for a in apps
+    ]
+    headers = ['app', 'venv', 'installed', 'latest']
+    # keep versions like 1.10 as they are instead of parsing them as numbers.
+    return tabulate(table, headers, tablefmt="rst", disable_numparse=True)
+
+
+def display_tap_failures(failures):
+    from tabulate import tabulate
+
+    table = [[alias, reason] for alias, reason in failures.items()]
+    headers = ['tap', 'error']
+    return tabulate(table, headers, tablefmt="rst")
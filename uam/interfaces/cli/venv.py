@@ -1,10 +1,6 @@
 import click
 
 from uam.settings import CURRENT_VENV
-from uam.usecases import venv as venv_usecases
-from uam.adapters.system.gateway import SystemGateway
-from uam.adapters.docker.gateway import DockerServiceGateway
-from uam.adapters.database.gateway import DatabaseGateway
 
 from .helper import ClickHelper as helper
 
@@ -18,6 +14,9 @@ def venv():
 @click.argument("venv_name")
 @helper.handle_errors()
 def create(venv_name):
+    from uam.usecases import venv as venv_usecases
+    from uam.adapters.system.gateway import SystemGateway
+
     venv_usecases.create_venv(SystemGateway, venv_name)
     helper.echo_success(f"venv {venv_name} created.")
 
@@ -26,6 +25,11 @@ def create(venv_name):
 @click.argument("venv_name")
 @helper.handle_errors()
 def delete(venv_name):
+    from uam.usecases import venv as venv_usecases
+    from uam.adapters.system.gateway import SystemGateway
+    from uam.adapters.docker.gateway import DockerServiceGateway
+    from uam.adapters.database.gateway import DatabaseGateway
+
     venv_usecases.delete_venv(DatabaseGateway, SystemGateway, DockerServiceGateway,
                               venv_name)
     helper.echo_success(f"venv {venv_name} deleted.")
@@ -34,6 +38,9 @@ def delete(venv_name):
 @click.command()
 @helper.handle_errors()
 def ls():
+    from uam.usecases import venv as venv_usecases
+    from uam.adapters.system.gateway import SystemGateway
+
     venvs = venv_usecases.list_venvs(SystemGateway)
     click.echo("  ".join(venvs))
 
@@ -42,6 +49,9 @@ def ls():
 @click.argument("venv_name")
 @helper.handle_errors()
 def active(venv_name):
+    from uam.usecases import venv as venv_usecases
+    from uam.adapters.system.gateway import SystemGateway
+
     venv_usecases.active_venv(SystemGateway, venv_name,
                               current_venv=CURRENT_VENV)
     click.echo(f"{venv_name} deactived.")
@@ -0,0 +1,272 @@
+import array
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+import traceback
+
+from uam.settings import (BIN_PATH, VENVS_PATH, TEMP_PATH, DAEMON_SOCKET_PATH,
+                          DAEMON_PID_PATH)
+
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('!I')
+STDIO_FDS = (0, 1, 2)
+CACHE_REFRESH_INTERVAL = 5
+
+
+class ShimCodeCache:
+    """
+    Compiled code of every shim inside uam's bin, venv and temp folders, keyed by
+    path and checked against the file's mtime. Forked workers inherit it, so
+    a shim is only read and compiled when it has changed.
+    """
+
+    def __init__(self):
+        self._codes = {}
+        self._refreshed_at = 0
+
+    def shim_folders(self):
+        folders = [BIN_PATH, TEMP_PATH]
+        if os.path.isdir(VENVS_PATH):
+            folders.extend(os.path.join(VENVS_PATH, v) for v in os.listdir(VENVS_PATH)
+                           if not v.startswith('.'))
+        return [f for f in folders if os.path.isdir(f)]
+
+    def refresh(self, force=False):
+        if not force and time.time() - self._refreshed_at < CACHE_REFRESH_INTERVAL:
+            return
+        self._refreshed_at = time.time()
+        paths = set()
+        for folder in self.shim_folders():
+            for name in os.listdir(folder):
+                # launcher tables and shims being written are dotfiles.
+                if name.startswith('.'):
+                    continue
+                path = os.path.join(folder, name)
+                paths.add(path)
+                try:
+                    self.get(path)
+                except (OSError, SyntaxError, ValueError) as error:
+                    logger.warning(f"can not compile shim {path}: {error}")
+        for path in set(self._codes) - paths:
+            del self._codes[path]
+
+    def is_shim(self, path):
+        return os.path.dirname(path) in self.shim_folders()
+
+    def get(self, path):
+        mtime = os.stat(path).st_mtime
+        cached = self._codes.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, 'r') as f_handler:
+            source = f_handler.read()
+        # shims of the sh backend do not go through the daemon.
+        if source.startswith('#!') and 'python' in source.splitlines()[0]:
+            code = compile(source, path, 'exec')
+        else:
+            code = None
+        self._codes[path] = (mtime, code)
+        return code
+
+    def __len__(self):
+        return len(self._codes)
+
+
+class ShimRequestHandler(socketserver.BaseRequestHandler):
+    """
+    Runs one shim invocation inside a forked worker. The client sends its
+    stdio file descriptors along with argv, cwd and environment, the worker
+    takes them over and executes the shim with docker modules already
+    imported, then reports the exit code back.
+    """
+
+    def handle(self):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        try:
+            request, fds = self.receive_request()
+        except (OSError, ValueError) as error:
+            logger.warning(f"bad shim request: {error}")
+            return
+        if request is None:
+            return
+        self.take_over_stdio(fds, request)
+        threading.Thread(target=self.forward_signals, daemon=True).start()
+        exit_code = self.run_shim(request)
+        for stream in (sys.stdout, sys.stderr):
+            stream.flush()
+        self.request.sendall(f"exit {exit_code}\n".encode())
+
+    def receive_request(self):
+        fds = array.array('i')
+        msg, ancdata, _, _ = self.request.recvmsg(
+            HEADER.size, socket.CMSG_LEN(len(STDIO_FDS) * fds.itemsize))
+        if not msg:
+            # a connection probe from is_running, nothing to run.
+            return None, []
+        for level, type_, data in ancdata:
+            if level == socket.SOL_SOCKET and type_ == socket.SCM_RIGHTS:
+                fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+        if len(msg) != HEADER.size or len(fds) != len(STDIO_FDS):
+            raise ValueError("request header or stdio descriptors missing")
+        length, = HEADER.unpack(msg)
+        payload = b''
+        while len(payload) < length:
+            chunk = self.request.recv(length - len(payload))
+            if not chunk:
+                raise ValueError("request closed before payload was received")
+            payload += chunk
+        return json.loads(payload.decode()), list(fds)
+
+    def take_over_stdio(self, fds, request):
+        for target, fd in zip(STDIO_FDS, fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        sys.stdin = io.open(0, 'r', closefd=False)
+        sys.stdout = io.open(1, 'w', buffering=1, closefd=False)
+        sys.stderr = io.open(2, 'w', buffering=1, closefd=False)
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        sys.argv = request['argv']
+
+    def forward_signals(self):
+        while True:
+            data = self.request.recv(16)
+            if not data:
+                return
+            for signum in data:
+                os.kill(os.getpid(), signum)
+
+    def run_shim(self, request):
+        path = request['path']
+        if not self.server.codes.is_shim(path):
+            print(f"uam daemon: {path} is not a uam shim.", file=sys.stderr)
+            return 1
+        try:
+            code = self.server.codes.get(path)
+            if code is None:
+                print(f"uam daemon: {path} is not a python shim.", file=sys.stderr)
+                return 1
+            exec(code, {'__name__': '__main__', '__file__': path,
+                        '__uam_daemon__': True})
+        except KeyboardInterrupt:
+            return 130
+        except SystemExit as exc:
+            if exc.code is None or isinstance(exc.code, int):
+                return exc.code or 0
+            print(exc.code, file=sys.stderr)
+            return 1
+        except Exception:
+            traceback.print_exc()
+            return 1
+        return 0
+
+
+class ShimServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+
+    def __init__(self, socket_path, codes):
+        self.codes = codes
+        super(ShimServer, self).__init__(socket_path, ShimRequestHandler)
+        os.chmod(socket_path, 0o600)
+
+    def service_actions(self):
+        super(ShimServer, self).service_actions()
+        self.codes.refresh()
+
+
+def warm_up():
+    logger.info("importing docker modules ...")
+    import docker  # noqa
+    import dockerpty  # noqa
+    import netifaces  # noqa
+    codes = ShimCodeCache()
+    codes.refresh(force=True)
+    logger.info(f"{len(codes)} shims compiled.")
+    return codes
+
+
+def watch_docker_objects(stop_event):
+    """
+    Keep the docker objects known by shims in line with docker, dropping the
+    ones docker reports removed.
+    """
+    from uam.adapters.docker.client import get_docker_client
+    from uam.adapters.docker.object_cache import watch_events
+
+    watch_events(get_docker_client(), stop_event)
+
+
+def is_running(socket_path=DAEMON_SOCKET_PATH):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        return False
+    finally:
+        sock.close()
+    return True
+
+
+def read_pid(pid_path=DAEMON_PID_PATH):
+    try:
+        with open(pid_path, 'r') as f_handler:
+            return int(f_handler.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def serve(socket_path=DAEMON_SOCKET_PATH, pid_path=DAEMON_PID_PATH):
+    if is_running(socket_path):
+        logger.warning(f"uam daemon is already listening on {socket_path}.")
+        return
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+
+    codes = warm_up()
+    server = ShimServer(socket_path, codes)
+    stop_watching = threading.Event()
+    threading.Thread(target=watch_docker_objects, args=(stop_watching,), daemon=True).start()
+    with open(pid_path, 'w') as f_handler:
+        f_handler.write(str(os.getpid()))
+
+    def shutdown(signum, frame):
+        # server.shutdown blocks until serve_forever returns, so it can not
+        # be called from the serving thread itself.
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    logger.info(f"uam daemon listening on {socket_path} ...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info("uam daemon stopping ...")
+        stop_watching.set()
+        server.server_close()
+        for path in (socket_path, pid_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def stop(pid_path=DAEMON_PID_PATH):
+    pid = read_pid(pid_path)
+    if not pid:
+        return False
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        os.remove(pid_path)
+        return False
+    return True
@@ -1,11 +1,7 @@
 # -*- coding: utf-8 -*-
-import logging.config
+import logging
 import os
 
-import docker
-from colorlog import ColoredFormatter
-from peewee import SqliteDatabase
-
 
 def str2bool(v):
     return v and v.lower() in ('yes', 'true', 't', '1')
@@ -13,35 +9,35 @@ def str2bool(v):
 
 HOME_DIR = os.path.expanduser('~')
 UAM_PATH = os.path.join(HOME_DIR, '.uam')
-if not os.path.isdir(UAM_PATH):
-    os.mkdir(UAM_PATH)
 
+# folders are created on demand by the adapters which write into them.
 DB_PATH = os.path.join(UAM_PATH, "uam.db")
-db = SqliteDatabase(DB_PATH)
-
 TAP_PATH = os.path.join(UAM_PATH, 'taps')
-if not os.path.exists(TAP_PATH):
-    os.makedirs(TAP_PATH)
-
 BIN_PATH = os.path.join(UAM_PATH, 'bin')
-if not os.path.exists(BIN_PATH):
-    os.makedirs(BIN_PATH)
-
 TEMP_PATH = os.path.join(UAM_PATH, '.temp')
-if not os.path.exists(TEMP_PATH):
-    os.makedirs(TEMP_PATH)
-
 VENVS_PATH = os.path.join(UAM_PATH, "venvs")
-if not os.path.exists(VENVS_PATH):
-    os.makedirs(VENVS_PATH)
+
+DAEMON_SOCKET_PATH = os.path.join(UAM_PATH, 'uam.sock')
+DAEMON_PID_PATH = os.path.join(UAM_PATH, 'uam.pid')
+DAEMON_LOG_PATH = os.path.join(UAM_PATH, 'daemon.log')
+
+# sqlite pragmas applied to every connection of uam.db, WAL lets readers run
+# alongside a writer, writers wait for each other up to the busy timeout.
+DB_PRAGMAS = (
+    ('busy_timeout', int(os.getenv('UAM_DB_BUSY_TIMEOUT', '10000'))),
+    ('journal_mode', os.getenv('UAM_DB_JOURNAL_MODE', 'wal')),
+    ('synchronous', os.getenv('UAM_DB_SYNCHRONOUS', 'normal')),
+    ('mmap_size', int(os.getenv('UAM_DB_MMAP_SIZE', str(64 * 1024 * 1024)))),
+    ('cache_size', int(os.getenv('UAM_DB_CACHE_SIZE', '-8000'))),
+)
+DB_WRITE_RETRIES = int(os.getenv('UAM_DB_WRITE_RETRIES', '5'))
+DB_WRITE_RETRY_DELAY = 0.05
 
 UAM_VENV_VAR = "UAM_VENV"
 CURRENT_VENV = os.getenv(UAM_VENV_VAR, "")
 
 UAM_DISABLE_VENV_PROMPT_VAR = "UAM_DISABLE_VENV_PROMPT"
 
-docker_client = docker.from_env()
-
 
 DEBUG = str2bool(os.getenv('UAM_DEBUG', 'false'))
 
@@ -57,6 +53,15 @@ FORMULA_FOLDER_NAME = 'Formula'
 
 FORMULA_EXTENSIONS = ['yaml', 'yml']
 
+# taps are pulled concurrently by `uam tap update`, each within the timeout.
+TAP_UPDATE_CONCURRENCY = int(os.getenv('UAM_TAP_UPDATE_CONCURRENCY', '8'))
+TAP_UPDATE_TIMEOUT = int(os.getenv('UAM_TAP_UPDATE_TIMEOUT', '120'))
+# clone taps partially, checking out and downloading only their formulas.
+TAP_SPARSE_CHECKOUT = str2bool(os.getenv('UAM_TAP_SPARSE_CHECKOUT', 'false'))
+
+# outdated apps are upgraded by `uam upgrade --all` in this many threads.
+UPGRADE_CONCURRENCY = int(os.getenv('UAM_UPGRADE_CONCURRENCY', '4'))
+
 
 CONTAINER_META_LABELS = {
     'provider': 'uam',
@@ -65,6 +70,44 @@ CONTAINER_META_LABELS = {
 
 GLOBAL_NETWORK_NAME = 'uam_global_network'
 
+SHIM_MODE_VAR = 'UAM_SHIM_MODE'
+SHIM_PROFILE_VAR = 'UAM_SHIM_PROFILE'
+
+# aliases of the launcher shim backend are symlinks to a single launcher per
+# venv, which looks its alias up inside a table of `<count>` sorted entries,
+# pointing at an alias and its json spec, following a header.
+LAUNCHER_NAME = 'uam-run'
+LAUNCHER_TABLE_NAME = '.uam-run.table'
+LAUNCHER_TABLE_MAGIC = 'UAMRUN01'
+LAUNCHER_TABLE_HEADER = '<8sI'
+LAUNCHER_TABLE_ENTRY = '<IHII'
+
+# bulk operations swap bin folders to new generations of them at once, this
+# many generations are kept for rollbacks.
+BIN_GENERATIONS_KEEP = int(os.getenv('UAM_BIN_GENERATIONS_KEEP', '3'))
+
+CONTAINER_POOL_PATH = os.path.join(UAM_PATH, 'pool')
+CONTAINER_POOL_MAX_SIZE = int(os.getenv('UAM_POOL_MAX_SIZE', '16'))
+CONTAINER_POOL_IDLE_TIMEOUT = 600
+CONTAINER_POOL_KEY_LABEL = 'pool_key'
+
+# images are pulled by `uam pull` in this many threads, while a lock file per
+# image makes uam processes and shims wait for a pull already in flight.
+IMAGE_PULL_LOCK_PATH = os.path.join(UAM_PATH, 'pulls')
+IMAGE_PULL_CONCURRENCY = int(os.getenv('UAM_PULL_CONCURRENCY', '4'))
+
+FORMULA_CACHE_PATH = os.path.join(UAM_PATH, 'cache', 'formulas')
+FORMULA_CACHE_MAX_SIZE = int(os.getenv('UAM_FORMULA_CACHE_MAX_SIZE', str(32 * 1024 * 1024)))
+FORMULA_CACHE_MEMORY_ITEMS = 256
+# compiled shim templates, reused by later uam processes.
+TEMPLATE_CACHE_PATH = os.path.join(UAM_PATH, 'cache', 'templates')
+# images, networks and volumes shims found, trusted for a while by later shims.
+DOCKER_OBJECT_CACHE_PATH = os.path.join(UAM_PATH, 'cache', 'docker-objects.json')
+DOCKER_OBJECT_CACHE_TTL = int(os.getenv('UAM_DOCKER_OBJECT_CACHE_TTL', '3600'))
+# docker api versions negotiated with engines, by DOCKER_HOST.
+DOCKER_API_VERSION_CACHE_PATH = os.path.join(UAM_PATH, 'cache', 'docker-api-versions.json')
+DOCKER_API_VERSION_CACHE_TTL = 24 * 3600
+
 
 class ErrorTypes:
     USER_ERROR = "user_error"
@@ -77,6 +120,12 @@ class SourceTypes:
     TAP = 'tap'
 
 
+class ShimBackends:
+    PYTHON = 'python'
+    SH = 'sh'
+    LAUNCHER = 'launcher'
+
+
 class UamBaseException(Exception):
     code = ''
     type = ''
@@ -124,24 +173,29 @@ LOG_PREFIXS = {
 }
 
 
-class CustomedFormatter(ColoredFormatter):
+def build_formatter(fmt, log_colors):
+    from colorlog import ColoredFormatter  # noqa, only needed once logging is set up
 
-    def format(self, record):
-        message = super(CustomedFormatter, self).format(record)
-        prefix = LOG_PREFIXS.get(record.levelname)
-        return f'  {prefix}   {message}'
+    class CustomedFormatter(ColoredFormatter):
+
+        def format(self, record):
+            message = super(CustomedFormatter, self).format(record)
+            prefix = LOG_PREFIXS.get(record.levelname)
+            return f'  {prefix}   {message}'
+
+    return CustomedFormatter(fmt, log_colors=log_colors)
 
 
 LOGGING = {
     'version': 1,
     'formatters': {
         'prod': {
-            '()': CustomedFormatter,
+            '()': build_formatter,
             'format': '%(log_color)s%(message)s',
             'log_colors': LOG_COLORS
         },
         'dev': {
-            '()': CustomedFormatter,
+            '()': build_formatter,
             'format': ('%(log_color)s|%(levelname)-8s|%(asctime)-25s'
                        '|%(threadName)-11s|%(name)s:%(lineno)d %(message)s'),
             'log_colors': LOG_COLORS
@@ -177,4 +231,8 @@ LOGGING = {
     }
 }
 
-logging.config.dictConfig(LOGGING)
\ No newline at end of file
+
+def setup_logging():
+    import logging.config  # noqa, keeps importing settings cheap
+
+    logging.config.dictConfig(LOGGING)
@@ -1,6 +1,9 @@
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from uam.settings import SourceTypes
+from uam.settings import (SourceTypes, GLOBAL_NETWORK_NAME, CONTAINER_META_LABELS,
+                          UPGRADE_CONCURRENCY, IMAGE_PULL_CONCURRENCY, ShimBackends)
 from uam.usecases.tap import list_taps
 from uam.usecases.venv import get_venv_path
 from uam.usecases.exceptions.app import (AppNameFormatInvalid, AppTapNotFound,
@@ -8,21 +11,26 @@ from uam.usecases.exceptions.app import (AppNameFormatInvalid, AppTapNotFound,
                                          NoValidVersion, AppFormulaNotFound,
                                          AppFormulaMalformed, AppEntryPointsConflicted,
                                          AppNotInstalled, UpdateLocalTapApp,
-                                         NoNewVersionFound)
-from uam.entities.app import (AppStatus, recognize_app_name, create_app,
+                                         NoNewVersionFound, LockedFormulaNotFound)
+from uam.entities.app import (AppStatus, recognize_app_name, create_app, parse_formula,
                               deactive_entrypoints, generate_app_shims,
                               generate_shell_shim, select_proper_version,
                               build_formula_path, build_app_list,
                               build_formula_folder_path, diff_app_data,
-                              get_app_status, filter_disabled_aliases)
+                              get_app_status, filter_disabled_aliases,
+                              build_volume_labels, build_upgradable_apps,
+                              diff_installed_apps, build_app_label,
+                              generate_launcher, generate_launcher_entries)
+from uam.entities.image import group_apps_by_image, build_image_lock_path
 from uam.entities.exceptions import app as app_excs
 
 
 logger = logging.getLogger(__name__)
 
 
-def install_app(DatabaseGateway, SystemGateway, app_name,
-                override_entrypoints=None, pinned_version=None, venv=""):
+def install_app(DatabaseGateway, SystemGateway, DockerServiceGateway, app_name,
+                override_entrypoints=None, pinned_version=None, venv="",
+                verify=False, shim_backend=None):
     try:
         source_type, app_name, formula_lst = recognize_app_name(
             app_name, list_taps(DatabaseGateway))
@@ -38,33 +46,29 @@ def install_app(DatabaseGateway, SystemGateway, app_name,
 
     # get the formula content
     if source_type == SourceTypes.LOCAL:
-        formula_content = SystemGateway.read_yaml_content(formula_lst[0]['path'])
+        formula_path = formula_lst[0]['path']
         tap_name = None
         version = None
     else:
-        for formula in formula_lst:
-            if SystemGateway.isfolder(formula['path']):
-                tap_name, formula_folder = formula['tap_name'], formula['path']
-                break
-        else:
-            raise AppFormulaNotFound(app_name)
-
+        tap_name, formula_paths = _find_formula_versions(DatabaseGateway, SystemGateway,
+                                                         app_name, formula_lst)
         logger.info(f"{app_name}'s formula found in tap {tap_name}.")
-        versions = SystemGateway.list_yaml_names(formula_folder)
         try:
-            version = select_proper_version(versions, pinned_version=pinned_version)
+            version = select_proper_version(list(formula_paths),
+                                            pinned_version=pinned_version)
         except app_excs.NoValidVersion:
             raise NoValidVersion(tap_name)
         except app_excs.PinnedVersionNotExist:
             raise NoProperVersionMatched(pinned_version)
         logger.info(f"version {version} will be installed.")
-        formula_path = build_formula_path(tap_name, app_name, version)
-        formula_content = SystemGateway.read_yaml_content(formula_path)
+        formula_path = formula_paths[version]
 
     # create app data structure using formula content and metadata
     try:
-        app = create_app(source_type, tap_name, app_name, version, formula_content,
-                         pinned_version=pinned_version, venv=venv)
+        formula = SystemGateway.read_formula(formula_path, parse_formula)
+        app = create_app(source_type, tap_name, app_name, version, formula,
+                         pinned_version=pinned_version, venv=venv,
+                         shim_backend=shim_backend)
     except app_excs.FormulaMalformed as error:
         raise AppFormulaMalformed(app_name, tap_name)
 
@@ -80,9 +84,8 @@ def install_app(DatabaseGateway, SystemGateway, app_name,
         logger.info("disabling conflicted aliases ...")
         DatabaseGateway.disable_entrypoints(conflicted_aliases, venv=venv)
 
-    shims = generate_app_shims(app)
-
-    SystemGateway.store_app_shims(shims, venv_path=get_venv_path(SystemGateway, venv))
+    api_version = _compile_app(DockerServiceGateway, app, verify=verify)
+    _store_shims(SystemGateway, app, api_version, venv=venv)
     DatabaseGateway.store_app(app)
     return app
 
@@ -126,8 +129,9 @@ def list_apps(DatabaseGateway, venv=""):
 
 
 def update_app(DatabaseGateway, SystemGateway, DockerServiceGateway, app_name,
-               venv=""):
-    app = _get_app_from_db(DatabaseGateway, app_name, venv=venv)
+               pinned_version=None, venv="", verify=False):
+    app = _get_app_from_db(DatabaseGateway, app_name, pinned_version=pinned_version,
+                           venv=venv)
     if app["source_type"] == SourceTypes.LOCAL:
         logger.warning("local type app is not updatable.")
         raise UpdateLocalTapApp(app_name)
@@ -135,25 +139,31 @@ def update_app(DatabaseGateway, SystemGateway, DockerServiceGateway, app_name,
     logger.info(f"checking if new version of {app_name} ready ...")
     tap_name = app["tap_alias"]
     formula_folder_path = build_formula_folder_path(tap_name, app_name)
-    versions = SystemGateway.list_yaml_names(formula_folder_path)
+    _, formula_paths = _find_formula_versions(
+        DatabaseGateway, SystemGateway, app_name,
+        [{'tap_name': tap_name, 'path': formula_folder_path}])
     try:
-        version = select_proper_version(versions)
+        # apps pinned to a range are upgraded to the latest version inside it.
+        version = select_proper_version(list(formula_paths), pinned_version=pinned_version)
     except app_excs.NoValidVersion:
         logger.warning(f"no yaml files inside {formula_folder_path} "
                        "matches version naming format.")
         raise NoValidVersion(tap_name)
+    except app_excs.PinnedVersionNotExist:
+        raise NoProperVersionMatched(pinned_version)
     if version == app["version"]:
         logger.info("current app's version is already the latest.")
         raise NoNewVersionFound(version)
     logger.info(f"{app_name} will be upgraded to vresion {version}.")
-    formula_path = build_formula_path(tap_name, app_name, version)
-    formula_content = SystemGateway.read_yaml_content(formula_path)
+    formula_path = formula_paths[version]
 
     logger.info("building new app data using the new version's formula ...")
     try:
+        formula = SystemGateway.read_formula(formula_path, parse_formula)
         new_app = create_app(app["source_type"], tap_name, app_name, version,
-                             formula_content, venv=venv)
-    except app.app_excs.FormulaMalformed as error:
+                             formula, pinned_version=pinned_version, venv=venv,
+                             shim_backend=app["shim_backend"])
+    except app_excs.FormulaMalformed as error:
         logger.error(f"app's formula is not a valid yaml file: {error}")
         raise AppFormulaMalformed(app_name, tap_name)
 
@@ -162,24 +172,219 @@ def update_app(DatabaseGateway, SystemGateway, DockerServiceGateway, app_name,
     logger.info("changeset of the two versions are generated. ")
 
     _apply_change_set(DatabaseGateway, SystemGateway, DockerServiceGateway,
-                      app["id"], change_set, venv=venv)
+                      app["id"], change_set, venv=venv, verify=verify)
+
+
+def list_outdated_apps(DatabaseGateway, venv=""):
+    """
+    Returns installed tap apps of venv which have newer versions in the
+    formula indexes of their taps, along with the latest versions.
+    """
+    logger.info("querying installed apps and the versions of their formulas ...")
+    apps = [a for a in DatabaseGateway.list_apps(venv=venv) if a["source_type"] == SourceTypes.TAP]
+    formula_versions = DatabaseGateway.get_installed_formula_versions(venv=venv)
+    tap_apps = {}
+    for a in apps:
+        tap_apps.setdefault(a["tap_alias"], []).append({**a, "venv": venv})
+    return sorted((
+        a
+        for tap_alias, tap_app_lst in tap_apps.items()
+        for a in build_upgradable_apps(tap_app_lst, formula_versions.get(tap_alias, {}))
+    ), key=lambda a: (a["name"], a["pinned_version"]))
+
+
+def upgrade_all_apps(DatabaseGateway, SystemGateway, DockerServiceGateway, venv="",
+                     verify=False, concurrency=UPGRADE_CONCURRENCY):
+    """
+    Upgrade every outdated app of venv. Change sets are built and docker
+    volumes and shims are handled by up to concurrency threads, while the
+    database changes of all apps are stored in one transaction, each app in
+    a savepoint of its own. Docker volumes are only created and removed, and
+    shims only removed, once their apps' changes are stored. Returns the
+    upgraded apps and the errors of apps failed to upgrade, keyed by their
+    labels.
+    """
+    outdated_apps = list_outdated_apps(DatabaseGateway, venv=venv)
+    if not outdated_apps:
+        return [], {}
+    logger.info(f"upgrading {len(outdated_apps)} apps ...")
+    failures = {}
+
+    def collect(func, apps):
+        return _map_concurrently(func, apps, concurrency, failures, key=build_app_label)
+
+    def plan(app):
+        formula_path = build_formula_path(app["tap_alias"], app["name"], app["latest_version"])
+        try:
+            formula = SystemGateway.read_formula(formula_path, parse_formula)
+            new_app = create_app(app["source_type"], app["tap_alias"], app["name"],
+                                 app["latest_version"], formula,
+                                 pinned_version=app["pinned_version"], venv=venv,
+                                 shim_backend=app["shim_backend"])
+        except app_excs.FormulaMalformed:
+            raise AppFormulaMalformed(app["name"], app["tap_alias"])
+        return diff_app_data(app, new_app)
+
+    planned = collect(plan, outdated_apps)
+
+    # shells see the shims of all upgraded apps changing at once.
+    with SystemGateway.stage_bin_folders():
+        logger.info(f"storing changes of {len(planned)} apps into database ...")
+        planned = _store_each(
+            DatabaseGateway, lambda p: _store_change_set(DatabaseGateway, p[0]["id"], p[1]),
+            planned, failures, key=lambda p: build_app_label(p[0]))
+        _map_concurrently(
+            lambda p: _finish_change_set(SystemGateway, DockerServiceGateway, p[1], venv=venv),
+            planned, concurrency, failures, key=lambda p: build_app_label(p[0]))
+
+        logger.info("regenerating shims of upgraded apps ...")
+        upgraded_ids = {app["id"] for app, _ in planned}
+        upgraded_apps = [
+            {**a, "venv": venv}
+            for a in DatabaseGateway.list_apps(venv=venv) if a["id"] in upgraded_ids
+        ]
+        collect(lambda a: _regenerate_shims(SystemGateway, DockerServiceGateway, a,
+                                            venv=venv, verify=verify), upgraded_apps)
+    return upgraded_apps, failures
+
+
+def sync_apps(DatabaseGateway, SystemGateway, DockerServiceGateway, locked_apps, venvs,
+              prune=False, verify=False, concurrency=UPGRADE_CONCURRENCY):
+    """
+    Install tap apps of locked_apps, and change the taps and versions of the
+    installed ones to their locked ones. With prune, tap apps of venvs which
+    are not locked are uninstalled. Only apps differing from their locks are
+    touched, their formulas, docker volumes and shims are handled by up to
+    concurrency threads, and all database changes are stored in one
+    transaction, each app in a savepoint of its own. Docker volumes are only
+    created and removed, and shims only removed, once their apps' changes
+    are stored. Returns the installed, changed, uninstalled and unchanged
+    apps, and the errors of apps failed to sync keyed by their labels.
+    """
+    installed_apps = [
+        {**a, "venv": venv}
+        for venv in venvs
+        for a in DatabaseGateway.list_apps(venv=venv)
+    ]
+    added_apps, changed_apps, deleted_apps, unchanged_apps = diff_installed_apps(
+        [a for a in installed_apps if a["source_type"] == SourceTypes.TAP], locked_apps)
+    if not prune:
+        deleted_apps = []
+    synced = {"installed": [], "changed": [], "uninstalled": [], "unchanged": unchanged_apps}
+    if not (added_apps or changed_apps or deleted_apps):
+        logger.info("all apps already match the lockfile.")
+        return synced, {}
+    logger.info(f"installing {len(added_apps)}, changing {len(changed_apps)} "
+                f"and uninstalling {len(deleted_apps)} apps ...")
+    failures = {}
+
+    def plan_change(pair):
+        app, locked_app = pair
+        new_app = _build_locked_app(DatabaseGateway, SystemGateway, locked_app,
+                                    shim_backend=app["shim_backend"])
+        change_set = diff_app_data(app, new_app)
+        if new_app["tap_alias"] != app["tap_alias"]:
+            change_set["changed_meta_data"]["tap_alias"] = new_app["tap_alias"]
+        return change_set
+
+    def clean_deleted(app):
+        SystemGateway.delete_app_shims([
+            e["alias"] for e in app["entrypoints"] if e["enabled"]
+        ], venv_path=get_venv_path(SystemGateway, app["venv"]))
+        DockerServiceGateway.delete_volumes([v["name"] for v in app["volumes"]])
+
+    new_apps = [new_app for _, new_app in _map_concurrently(
+        lambda a: _build_locked_app(DatabaseGateway, SystemGateway, a),
+        added_apps, concurrency, failures, key=build_app_label)]
+    change_sets = _map_concurrently(plan_change, changed_apps, concurrency, failures,
+                                    key=lambda pair: build_app_label(pair[1]))
+
+    # aliases of new apps already taken by other apps of their venvs are disabled.
+    deleted_ids = {a["id"] for a in deleted_apps}
+    active_aliases = {}
+    for a in installed_apps:
+        if a["id"] not in deleted_ids:
+            active_aliases.setdefault(a["venv"], set()).update(
+                e["alias"] for e in a["entrypoints"] if e["enabled"])
+    for new_app in new_apps:
+        aliases = active_aliases.setdefault(new_app["venv"], set())
+        conflicted_aliases = [e["alias"] for e in new_app["entrypoints"] if e["alias"] in aliases]
+        if conflicted_aliases:
+            logger.warning(f"aliases {conflicted_aliases} of {build_app_label(new_app)} "
+                           "are conflicted, disabling them ...")
+            new_app["entrypoints"] = deactive_entrypoints(new_app["entrypoints"],
+                                                          conflicted_aliases)
+        aliases.update(e["alias"] for e in new_app["entrypoints"] if e["enabled"])
+
+    logger.info("storing changes of synced apps into database ...")
+
+    def store(write):
+        kind, item = write
+        if kind == "uninstalled":
+            DatabaseGateway.delete_app(item["id"])
+        elif kind == "installed":
+            DatabaseGateway.store_app(item)
+        else:
+            (app, _), change_set = item
+            _store_change_set(DatabaseGateway, app["id"], change_set)
+
+    def label(write):
+        kind, item = write
+        return build_app_label(item[0][1] if kind == "changed" else item)
+
+    stored = _store_each(DatabaseGateway, store, [
+        *(("uninstalled", a) for a in deleted_apps),
+        *(("installed", a) for a in new_apps),
+        *(("changed", c) for c in change_sets),
+    ], failures, key=label)
+    deleted_apps = [item for kind, item in stored if kind == "uninstalled"]
+    new_apps = [item for kind, item in stored if kind == "installed"]
+    change_sets = [item for kind, item in stored if kind == "changed"]
+
+    _map_concurrently(clean_deleted, deleted_apps, concurrency, failures, key=build_app_label)
+    _map_concurrently(
+        lambda c: _finish_change_set(SystemGateway, DockerServiceGateway, c[1], venv=c[0][0]["venv"]),
+        change_sets, concurrency, failures, key=lambda c: build_app_label(c[0][1]))
+
+    logger.info("regenerating shims of synced apps ...")
+    synced_labels = {build_app_label(a) for a in new_apps}
+    synced_labels.update(build_app_label(locked_app) for (_, locked_app), _ in change_sets)
+    synced_venvs = {a["venv"] for a in new_apps} | {app["venv"] for (app, _), _ in change_sets}
+    synced_apps = [
+        {**a, "venv": venv}
+        for venv in synced_venvs
+        for a in DatabaseGateway.list_apps(venv=venv)
+        if build_app_label({**a, "venv": venv}) in synced_labels
+    ]
+    _map_concurrently(lambda a: _regenerate_shims(SystemGateway, DockerServiceGateway, a,
+                                                  venv=a["venv"], verify=verify),
+                      synced_apps, concurrency, failures, key=build_app_label)
+
+    synced["installed"] = new_apps
+    synced["changed"] = [locked_app for (_, locked_app), _ in change_sets]
+    synced["uninstalled"] = deleted_apps
+    return synced, failures
 
 
 def reinstall_app(DatabaseGateway, SystemGateway, DockerServiceGateway, app_name,
-                  pinned_version=None, venv="", formula_path=""):
+                  pinned_version=None, venv="", formula_path="", verify=False):
     app = _get_app_from_db(DatabaseGateway, app_name, pinned_version=pinned_version,
                            venv=venv)
 
     logger.info(f"reading {app_name}'s formula ...")
     if app["source_type"] == SourceTypes.TAP:
-        formula_path = build_formula_path(app["tap_alias"], app_name, app["version"])
-    formula_content = SystemGateway.read_yaml_content(formula_path)
+        index = DatabaseGateway.get_formula_index(app_name, [app["tap_alias"]])
+        formula_path = index.get(app["tap_alias"], {}).get(app["version"])
+        if not formula_path:
+            formula_path = build_formula_path(app["tap_alias"], app_name, app["version"])
 
     logger.info("rebuilding app data from formula ...")
     try:
+        formula = SystemGateway.read_formula(formula_path, parse_formula)
         new_app = create_app(app["source_type"], app["tap_alias"], app_name,
-                             app["version"], formula_content, venv=venv)
-    except app.app_excs.FormulaMalformed as error:
+                             app["version"], formula, venv=venv,
+                             shim_backend=app["shim_backend"])
+    except app_excs.FormulaMalformed as error:
         logger.error(f"app's formula is not a valid yaml file: {error}")
         raise AppFormulaMalformed(app_name, app["tap_alias"])
 
@@ -188,11 +393,11 @@ def reinstall_app(DatabaseGateway, SystemGateway, DockerServiceGateway, app_name
     logger.info("changeset are generated. ")
 
     _apply_change_set(DatabaseGateway, SystemGateway, DockerServiceGateway,
-                      app["id"], change_set, venv=venv)
+                      app["id"], change_set, venv=venv, verify=verify)
 
 
-def active_app(DatabaseGateway, SystemGateway, app_name, pinned_version=None,
-               venv=""):
+def active_app(DatabaseGateway, SystemGateway, DockerServiceGateway, app_name,
+               pinned_version=None, venv=""):
     logger.info("searching app inside database ...")
     try:
         app = DatabaseGateway.get_app_detail(app_name,
@@ -219,9 +424,70 @@ def active_app(DatabaseGateway, SystemGateway, app_name, pinned_version=None,
     DatabaseGateway.enable_entrypoints(app["id"], disabled_aliases)
 
     logger.info("regenerating app's shims ...")
-    app = DatabaseGateway.retrieve_app_detail(app["id"], venv=venv)
-    shims = generate_app_shims(app)
-    SystemGateway.store_app_shims(shims, venv_path=get_venv_path(SystemGateway, venv))
+    app = DatabaseGateway.retrieve_app_detail(app["id"])
+    api_version = _compile_app(DockerServiceGateway, app)
+    _store_shims(SystemGateway, app, api_version, venv=venv)
+
+
+def _find_formula_versions(DatabaseGateway, SystemGateway, app_name, formula_lst):
+    """
+    Find the first tap among formula_lst holding app's formula, returning the
+    tap's name and the formula's versions mapped to their paths. Indexed taps
+    are resolved through the formula index, others by scanning their folders.
+    """
+    index = DatabaseGateway.get_formula_index(app_name, [f['tap_name'] for f in formula_lst])
+    for formula in formula_lst:
+        tap_name = formula['tap_name']
+        if tap_name in index:
+            if index[tap_name]:
+                return tap_name, index[tap_name]
+        elif SystemGateway.isfolder(formula['path']):
+            logger.info(f"tap {tap_name} is not indexed, scanning its formula folder ...")
+            return tap_name, {
+                v: build_formula_path(tap_name, app_name, v)
+                for v in SystemGateway.list_yaml_names(formula['path'])
+            }
+    raise AppFormulaNotFound(app_name)
+
+
+def _build_locked_app(DatabaseGateway, SystemGateway, locked_app, shim_backend=None):
+    app_name, tap_name, version = (locked_app["name"], locked_app["tap_alias"],
+                                   locked_app["version"])
+    try:
+        _, formula_paths = _find_formula_versions(
+            DatabaseGateway, SystemGateway, app_name,
+            [{'tap_name': tap_name, 'path': build_formula_folder_path(tap_name, app_name)}])
+    except AppFormulaNotFound:
+        formula_paths = {}
+    if version not in formula_paths:
+        raise LockedFormulaNotFound(app_name, tap_name, version)
+    try:
+        formula = SystemGateway.read_formula(formula_paths[version], parse_formula)
+        return create_app(SourceTypes.TAP, tap_name, app_name, version, formula,
+                          pinned_version=locked_app["pinned_version"],
+                          venv=locked_app["venv"], shim_backend=shim_backend)
+    except app_excs.FormulaMalformed:
+        raise AppFormulaMalformed(app_name, tap_name)
+
+
+def _map_concurrently(func, items, concurrency, failures, key):
+    """
+    Call func with every item in up to concurrency threads, returning pairs
+    of items and their results. Errors are logged and stored into failures
+    by the key of their items, and their items are left out.
+    """
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(items)))) as executor:
+        futures = [(i, executor.submit(func, i)) for i in items]
+    results = []
+    for item, future in futures:
+        try:
+            results.append((item, future.result()))
+        except Exception as error:
+            logger.error(f"failed to handle {key(item)}: {error}")
+            failures[key(item)] = str(error)
+    return results
 
 
 def _get_app_from_db(DatabaseGateway, app_name, pinned_version=None, venv=""):
@@ -235,33 +501,109 @@ def _get_app_from_db(DatabaseGateway, app_name, pinned_version=None, venv=""):
     return app
 
 
+def _compile_app(DockerServiceGateway, app, verify=False):
+    """
+    Resolve app's docker network and volumes once, returning the docker api
+    version which shims should be compiled against. None means shims should
+    verify docker assets on every invocation.
+    """
+    if verify:
+        logger.info("verify mode enabled, shims will check docker assets every time.")
+        return None
+
+    logger.info(f"compiling {app['name']}'s docker assets ...")
+    try:
+        api_version = DockerServiceGateway.get_api_version()
+        DockerServiceGateway.assure_network(GLOBAL_NETWORK_NAME,
+                                            labels=CONTAINER_META_LABELS)
+        for v in app["volumes"]:
+            DockerServiceGateway.assure_volume(v["name"],
+                                               labels=build_volume_labels(app, v))
+    except DockerServiceGateway.DockerServiceUnavailable:
+        logger.warning("docker service is unavailable, falling back to verify mode.")
+        return None
+    return api_version
+
+
 def _apply_change_set(DatabaseGateway, SystemGateway, DockerServiceGateway,
-                      app_id, change_set, venv=""):
+                      app_id, change_set, venv="", verify=False):
+    _store_change_set(DatabaseGateway, app_id, change_set)
+    _finish_change_set(SystemGateway, DockerServiceGateway, change_set, venv=venv)
+    logger.info("regenerating all shims ...")
+    app_data = DatabaseGateway.retrieve_app_detail(app_id)
+    _regenerate_shims(SystemGateway, DockerServiceGateway, app_data, venv=venv, verify=verify)
+
+
+def _create_docker_volumes(DockerServiceGateway, change_set):
+    if change_set["added_volumes"]:
+        logger.info(f"creating docker volumes {change_set['added_volumes']} ...")
+        DockerServiceGateway.create_volumes([
+            v["name"] for v in change_set["added_volumes"]
+        ])
+
+
+def _delete_docker_volumes(DockerServiceGateway, change_set):
     if change_set["deleted_volumes"]:
-        logger.info(f"cleaning deleted volumes {change_set['deleted_volumes']} ...")
-        logger.info("deleting docker volumes ...")
+        logger.info(f"deleting docker volumes {change_set['deleted_volumes']} ...")
         DockerServiceGateway.delete_volumes([
             v["name"] for v in change_set["deleted_volumes"]
         ])
+
+
+def _delete_removed_shims(SystemGateway, change_set, venv=""):
+    if change_set["deleted_entrypoints"]:
+        logger.info(f"deleting shims of {change_set['deleted_entrypoints']} ...")
+        SystemGateway.delete_app_shims([
+            e["alias"] for e in change_set["deleted_entrypoints"] if e["enabled"]
+        ], venv_path=get_venv_path(SystemGateway, venv))
+
+
+def _finish_change_set(SystemGateway, DockerServiceGateway, change_set, venv=""):
+    """Apply the docker volumes and shims of a stored change set."""
+    _create_docker_volumes(DockerServiceGateway, change_set)
+    _delete_docker_volumes(DockerServiceGateway, change_set)
+    _delete_removed_shims(SystemGateway, change_set, venv=venv)
+
+
+def _store_each(DatabaseGateway, func, items, failures, key):
+    """
+    Call func with every item inside one transaction, each item in a
+    savepoint of its own so a failing item is rolled back alone. Returns the
+    stored items, errors of the others are logged and stored into failures
+    by the key of their items once the transaction is committed.
+    """
+    def store():
+        stored, errors = [], {}
+        for item in items:
+            try:
+                with DatabaseGateway.savepoint():
+                    func(item)
+            except DatabaseGateway.DatabaseLocked:
+                raise
+            except Exception as error:
+                errors[key(item)] = str(error)
+            else:
+                stored.append(item)
+        return stored, errors
+
+    stored, errors = DatabaseGateway.run_in_transaction(store)
+    for item_key, error in errors.items():
+        logger.error(f"failed to store {item_key}: {error}")
+    failures.update(errors)
+    return stored
+
+
+def _store_change_set(DatabaseGateway, app_id, change_set):
+    if change_set["deleted_volumes"]:
         logger.info("deleting database volumes ...")
         DatabaseGateway.delete_volumes(app_id, [
             v["name"] for v in change_set["deleted_volumes"]
         ])
     if change_set["added_volumes"]:
-        logger.info(f"adding new volumes {change_set['added_volumes']} ...")
-        logger.info("creating docker volumes ...")
-        DockerServiceGateway.create_volumes([
-            v["name"] for v in change_set["added_volumes"]
-        ])
         logger.info("storing volumes into database ...")
         DatabaseGateway.store_volumes(app_id, change_set["added_volumes"])
 
     if change_set["deleted_entrypoints"]:
-        logger.info(f"cleanning deleted entrypoints {change_set['deleted_entrypoints']} ...")
-        logger.info("deleting shims ...")
-        SystemGateway.delete_app_shims([
-            e["alias"] for e in change_set["deleted_entrypoints"] if e["enabled"]
-        ], venv_path=get_venv_path(venv))
         logger.info("deleting entrypoints from database ...")
         DatabaseGateway.delete_entrypoints(app_id, [
             e["alias"] for e in change_set["deleted_entrypoints"]
@@ -281,13 +623,31 @@ def _apply_change_set(DatabaseGateway, SystemGateway, DockerServiceGateway,
         logger.info("updating the app meta data into database ...")
         DatabaseGateway.update_app_meta(app_id, change_set["changed_meta_data"])
 
-    logger.info("regenerating all shims ...")
-    app_data = DatabaseGateway.retrieve_app_detail(app_id)
-    shims = generate_app_shims(app_data)
-    SystemGateway.store_app_shims(shims, venv_path=get_venv_path(SystemGateway, venv))
+
+def _regenerate_shims(SystemGateway, DockerServiceGateway, app_data, venv="", verify=False):
+    api_version = _compile_app(DockerServiceGateway, app_data, verify=verify)
+    written_names, shim_names = _store_shims(SystemGateway, app_data, api_version, venv=venv)
+    logger.info(f"{len(written_names)} of {len(shim_names)} shims of {app_data['name']} changed.")
 
 
-def download_app_image(DatabaseGateway, DockerServiceGateway, app_name, pinned_version=None, venv=""):
+def _store_shims(SystemGateway, app, api_version, venv=""):
+    """
+    Store shims of app's enabled entrypoints, as scripts or, for the launcher
+    backend, as links to the venv's launcher along with its table entries.
+    Returns the changed shims' names and the names of every stored shim.
+    """
+    venv_path = get_venv_path(SystemGateway, venv)
+    if app.get('shim_backend') == ShimBackends.LAUNCHER:
+        entries = generate_launcher_entries(app, api_version=api_version)
+        written_names = SystemGateway.store_launcher_entries(
+            generate_launcher(), entries, venv_path=venv_path)
+        return written_names, list(entries)
+    shims = generate_app_shims(app, api_version=api_version)
+    return SystemGateway.store_app_shims(shims, venv_path=venv_path), list(shims)
+
+
+def download_app_image(DatabaseGateway, SystemGateway, DockerServiceGateway, app_name,
+                       pinned_version=None, venv=""):
     logger.info("searching app inside database ...")
     try:
         app = DatabaseGateway.get_app_detail(app_name,
@@ -297,4 +657,63 @@ def download_app_image(DatabaseGateway, DockerServiceGateway, app_name, pinned_v
                        "not found in database.")
         raise AppNotInstalled(app_name, pinned_version)
     logger.info(f"downloding {app_name}'s image ...")
-    DockerServiceGateway.pull_image(app["image"])
\ No newline at end of file
+    _pull_image(SystemGateway, DockerServiceGateway, app["image"])
+
+
+def pull_app_images(DatabaseGateway, SystemGateway, DockerServiceGateway, app_names=None,
+                    venv="", concurrency=IMAGE_PULL_CONCURRENCY, on_progress=None):
+    """
+    Pull the missing images of the named apps of venv, or of all apps of all
+    venvs when app_names is None. An image shared by several apps is pulled
+    once, and up to concurrency images are pulled at the same time.
+    on_progress is called with the numbers of pulled and all images and of
+    downloaded and known bytes. Returns apps grouped by their images, and
+    the errors of images failed to pull.
+    """
+    if app_names is None:
+        apps = DatabaseGateway.list_app_images()
+    else:
+        apps = DatabaseGateway.list_app_images(app_names, venv=venv)
+        for name in app_names:
+            if name not in {a["name"] for a in apps}:
+                raise AppNotInstalled(name)
+    images = group_apps_by_image(apps)
+    logger.info(f"{len(images)} images are used by {len(apps)} apps.")
+
+    layers, failures, done = {}, {}, 0
+    progress_lock = threading.Lock()
+
+    def report(image=None, layer=None, current=0, total=0):
+        with progress_lock:
+            if layer:
+                layers[(image, layer)] = (current, total)
+            if on_progress:
+                on_progress(done, len(images), sum(c for c, _ in layers.values()),
+                            sum(t for _, t in layers.values()))
+
+    def pull(image):
+        return _pull_image(SystemGateway, DockerServiceGateway, image,
+                           progress=lambda *args: report(image, *args))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(images)))) as executor:
+        futures = {executor.submit(pull, image): image for image in images}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except (DockerServiceGateway.ImagePullFailed,
+                    DockerServiceGateway.DockerServiceUnavailable) as error:
+                logger.error(f"failed to pull {futures[future]}: {error}")
+                failures[futures[future]] = str(error)
+            done += 1
+            report()
+    return images, failures
+
+
+def _pull_image(SystemGateway, DockerServiceGateway, image, progress=None):
+    # shims and other uam processes wait here while the image is being pulled.
+    with SystemGateway.lock_file(build_image_lock_path(image)):
+        if DockerServiceGateway.image_exists(image):
+            logger.info(f"image {image} is already pulled.")
+            return False
+        DockerServiceGateway.pull_image(image, progress=progress)
+        return True
@@ -0,0 +1,14 @@
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_formula_cache_stats(SystemGateway):
+    logger.info("reading formula cache stats ...")
+    return SystemGateway.get_formula_cache_stats()
+
+
+def clear_formula_cache(SystemGateway):
+    logger.info("clearing formula cache ...")
+    SystemGateway.clear_formula_cache()
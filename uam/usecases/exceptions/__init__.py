@@ -1,2 +1,5 @@
 from uam.usecases.exceptions.tap import *
-from uam.usecases.exceptions.app import *
\ No newline at end of file
+from uam.usecases.exceptions.app import *
+from uam.usecases.exceptions.search import *
+from uam.usecases.exceptions.sync import *
+from uam.usecases.exceptions.system import *
@@ -1,4 +1,4 @@
-from uam.settings import UamBaseException
+from uam.settings import UamBaseException, ErrorTypes
 
 
 class AppNameFormatInvalid(UamBaseException):
@@ -112,4 +112,43 @@ class NoNewVersionFound(UamBaseException):
     def __init__(self, version):
         self.version = version
         self.help_text = self.help_text.format(version)
-        super(NoNewVersionFound, self).__init__()
\ No newline at end of file
+        super(NoNewVersionFound, self).__init__()
+
+
+class AppsUpgradeFailed(UamBaseException):
+    type = ErrorTypes.SYSTEM_ERROR
+    help_text = "failed to upgrade apps: {}."
+
+    def __init__(self, app_names):
+        self.app_names = app_names
+        self.help_text = self.help_text.format(", ".join(app_names))
+        super(AppsUpgradeFailed, self).__init__()
+
+
+class ImagesPullFailed(UamBaseException):
+    type = ErrorTypes.SYSTEM_ERROR
+    help_text = "failed to pull images: {}."
+
+    def __init__(self, images):
+        self.images = images
+        self.help_text = self.help_text.format(", ".join(images))
+        super(ImagesPullFailed, self).__init__()
+
+
+class LockedFormulaNotFound(UamBaseException):
+    help_text = "formula of {} {} is not found in tap {}."
+
+    def __init__(self, app_name, tap_name, version):
+        self.app_name = app_name
+        self.help_text = self.help_text.format(app_name, version, tap_name)
+        super(LockedFormulaNotFound, self).__init__()
+
+
+class AppsSyncFailed(UamBaseException):
+    type = ErrorTypes.SYSTEM_ERROR
+    help_text = "failed to sync apps: {}."
+
+    def __init__(self, app_names):
+        self.app_names = app_names
+        self.help_text = self.help_text.format(", ".join(app_names))
+        super(AppsSyncFailed, self).__init__()
@@ -0,0 +1,5 @@
+from uam.settings import UamBaseException
+
+
+class SearchUnavailable(UamBaseException):
+    help_text = "sqlite of this python has no fts5 support, uam search is not available."
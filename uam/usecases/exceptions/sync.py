@@ -0,0 +1,10 @@
+from uam.settings import UamBaseException
+
+
+class LockfileMalformed(UamBaseException):
+    help_text = "lockfile {} is malformed: {}."
+
+    def __init__(self, path, reason):
+        self.path = path
+        self.help_text = self.help_text.format(path, reason)
+        super(LockfileMalformed, self).__init__()
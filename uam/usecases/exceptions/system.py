@@ -0,0 +1,10 @@
+from uam.settings import UamBaseException
+
+
+class NoPreviousGeneration(UamBaseException):
+    help_text = "shims of {} have no previous generation to roll back to."
+
+    def __init__(self, venv):
+        self.venv = venv
+        self.help_text = self.help_text.format(f"venv {venv}" if venv else "the default venv")
+        super(NoPreviousGeneration, self).__init__()
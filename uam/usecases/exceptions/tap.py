@@ -37,4 +37,23 @@ class TapRemoveNotFound(UamBaseException):
 
 
 class TapUpdateError(UamBaseException):
-    pass
\ No newline at end of file
+    pass
+
+
+class TapUpdateNotFound(TapUpdateError):
+    help_text = "{} not found in taps."
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.help_text = self.help_text.format(alias)
+        super(TapUpdateNotFound, self).__init__()
+
+
+class TapUpdateFailed(TapUpdateError):
+    type = ErrorTypes.SYSTEM_ERROR
+    help_text = "failed to update taps: {}."
+
+    def __init__(self, aliases):
+        self.aliases = aliases
+        self.help_text = self.help_text.format(", ".join(aliases))
+        super(TapUpdateFailed, self).__init__()
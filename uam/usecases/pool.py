@@ -0,0 +1,32 @@
+import logging
+import time
+
+from uam.entities.pool import (build_pool_labels, build_pool_lock_path,
+                               build_pool_status)
+
+
+logger = logging.getLogger(__name__)
+
+
+def list_pool(DockerServiceGateway, SystemGateway):
+    logger.info("querying pooled containers ...")
+    containers = DockerServiceGateway.list_containers(build_pool_labels())
+    lock_states = {
+        c["id"]: SystemGateway.get_lock_state(build_pool_lock_path(c["id"]))
+        for c in containers
+    }
+    return build_pool_status(containers, lock_states, time.time())
+
+
+def prune_pool(DockerServiceGateway, SystemGateway, prune_all=False):
+    pruned = []
+    for c in list_pool(DockerServiceGateway, SystemGateway):
+        if c["busy"]:
+            continue
+        if not prune_all and not c["expired"]:
+            continue
+        logger.info(f"evicting pooled container {c['name']} of {c['app']} ...")
+        DockerServiceGateway.remove_container(c["container_id"])
+        SystemGateway.remove_file(build_pool_lock_path(c["container_id"]))
+        pruned.append(c)
+    return pruned
@@ -0,0 +1,22 @@
+import logging
+
+from uam.entities.search import build_search_query
+from uam.usecases.exceptions import SearchUnavailable
+from uam.usecases.tap import list_taps
+
+
+logger = logging.getLogger(__name__)
+
+
+def search_formulas(DatabaseGateway, query, limit=20):
+    match_query = build_search_query(query)
+    if not match_query:
+        return []
+    aliases = [t['alias'] for t in list_taps(DatabaseGateway)]
+    logger.info(f"searching formulas of {len(aliases)} taps ...")
+    try:
+        return DatabaseGateway.search_formulas(match_query, aliases, limit)
+    except DatabaseGateway.SearchUnavailable:
+        error = SearchUnavailable()
+        logger.error(error.help_text)
+        raise error
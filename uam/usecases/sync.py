@@ -0,0 +1,54 @@
+import logging
+
+from uam.settings import UPGRADE_CONCURRENCY
+from uam.usecases.app import sync_apps
+from uam.usecases.tap import add_tap, list_taps
+from uam.usecases.venv import create_venv
+from uam.usecases.exceptions.sync import LockfileMalformed
+from uam.entities.lock import parse_lockfile
+from uam.entities.tap import complete_shorten_address
+from uam.entities.exceptions import lock as lock_excs
+
+
+logger = logging.getLogger(__name__)
+
+
+def sync_lockfile(DatabaseGateway, SystemGateway, DockerServiceGateway, lockfile_path,
+                  prune=False, verify=False, concurrency=UPGRADE_CONCURRENCY):
+    """
+    Converge taps, venvs and apps to the ones locked in lockfile_path. Taps
+    and venvs are only added, apps are changed as sync_apps does. Returns
+    the added taps along with the synced apps, and the errors of apps failed
+    to sync.
+    """
+    logger.info(f"reading lockfile {lockfile_path} ...")
+    try:
+        lock = parse_lockfile(SystemGateway.read_yaml_content(lockfile_path))
+    except lock_excs.LockfileMalformed as error:
+        logger.error(error.message)
+        raise LockfileMalformed(lockfile_path, error.reason)
+
+    added_taps = _sync_taps(SystemGateway, DatabaseGateway, lock["taps"])
+    for venv in lock["venvs"]:
+        create_venv(SystemGateway, venv)
+    # shells see the shims of all synced apps changing at once.
+    with SystemGateway.stage_bin_folders():
+        synced, failures = sync_apps(DatabaseGateway, SystemGateway, DockerServiceGateway,
+                                     lock["apps"], [""] + lock["venvs"], prune=prune,
+                                     verify=verify, concurrency=concurrency)
+    return {**synced, "taps": added_taps}, failures
+
+
+def _sync_taps(SystemGateway, DatabaseGateway, locked_taps):
+    taps = {t["alias"]: t for t in list_taps(DatabaseGateway)}
+    added_taps = []
+    for t in locked_taps:
+        tap = taps.get(t["alias"])
+        if not tap:
+            logger.info(f"adding tap {t['alias']} ...")
+            add_tap(SystemGateway, DatabaseGateway, t["alias"], t["address"])
+            added_taps.append(t["alias"])
+        elif complete_shorten_address(tap["address"]) != complete_shorten_address(t["address"]):
+            logger.warning(f"tap {t['alias']} is added from {tap['address']} "
+                           f"instead of {t['address']}, keeping it.")
+    return added_taps
@@ -1,9 +1,12 @@
 import logging
 
 
-from uam.settings import (BUILTIN_TAPS, UAM_PATH, TAP_PATH,
+from uam.settings import (BUILTIN_TAPS, UAM_PATH, TAP_PATH, BIN_PATH, VENVS_PATH,
                           GLOBAL_NETWORK_NAME, CONTAINER_META_LABELS)
-from uam.entities.tap import complete_shorten_address
+from uam.entities.tap import complete_shorten_address, build_tap_sparse_paths
+from uam.entities.venv import build_venv_path
+from uam.usecases.tap import list_taps, index_tap
+from uam.usecases.exceptions.system import NoPreviousGeneration
 
 
 logger = logging.getLogger(__name__)
@@ -11,7 +14,8 @@ logger = logging.getLogger(__name__)
 
 def initialize(SystemGateway, DatabaseGateway, DockerServiceGateway):
     logger.info("checking uam's home path...")
-    SystemGateway.assure_folder(UAM_PATH)
+    for path in (UAM_PATH, TAP_PATH, BIN_PATH, VENVS_PATH):
+        SystemGateway.assure_folder(path)
 
     logger.info("checking database ...")
     DatabaseGateway.assure_tables()
@@ -20,9 +24,29 @@ def initialize(SystemGateway, DatabaseGateway, DockerServiceGateway):
     for t in BUILTIN_TAPS:
         logger.info(f"checking {t['alias']}")
         git_addr = complete_shorten_address(t["address"])
-        SystemGateway.clone_repo(TAP_PATH, t['alias'], git_addr)
+        SystemGateway.clone_repo(TAP_PATH, t['alias'], git_addr,
+                                 sparse_paths=build_tap_sparse_paths())
+
+    logger.info("indexing formulas of all taps ...")
+    for t in list_taps(DatabaseGateway):
+        index_tap(SystemGateway, DatabaseGateway, t['alias'])
 
     logger.info("checking docker assets")
     logger.info(f"checking docker network {GLOBAL_NETWORK_NAME}")
     DockerServiceGateway.assure_network(GLOBAL_NETWORK_NAME,
-                                        labels=CONTAINER_META_LABELS)
\ No newline at end of file
+                                        labels=CONTAINER_META_LABELS)
+
+
+def rollback_shims(SystemGateway, venv=""):
+    """
+    Restore the shims of venv to the ones before its last bulk operation, by
+    switching its bin folder back to the previous generation. Apps stored in
+    the database are left as they are. Returns the left and the restored
+    generations.
+    """
+    venv_path = build_venv_path(venv) if venv else ""
+    generations = SystemGateway.rollback_bin_folder(venv_path)
+    if generations is None:
+        raise NoPreviousGeneration(venv)
+    logger.info(f"switched from generation {generations[0]} to {generations[1]}.")
+    return generations
@@ -1,12 +1,20 @@
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from uam.settings import TAP_PATH
-from uam.usecases.exceptions import TapAddConflict, TapRemoveBuiltin, TapRemoveNotFound
+from uam.settings import (TAP_PATH, FORMULA_FOLDER_NAME, TAP_UPDATE_CONCURRENCY,
+                          TAP_UPDATE_TIMEOUT)
+from uam.usecases.exceptions import (TapAddConflict, TapRemoveBuiltin, TapRemoveNotFound,
+                                     TapUpdateNotFound)
 from uam.entities.tap import (validiate_new_tap, complete_shorten_address,
-                              get_address_by_alias, build_sorted_taps,
-                              is_tap_builtin)
+                              build_sorted_taps,
+                              is_tap_builtin, build_tap_formula_folder_path,
+                              build_tap_sparse_paths,
+                              parse_formula_path)
+from uam.entities.app import build_upgradable_apps, parse_formula
+from uam.entities.search import select_latest_formulas, build_search_entry
 from uam.entities.exceptions import tap as tap_excs
+from uam.entities.exceptions import app as app_excs
 
 
 logger = logging.getLogger(__name__)
@@ -32,11 +40,12 @@ def add_tap(SystemGateway, DatabaseGateway, alias, address, priority=0):
 
     address = complete_shorten_address(address)
     logger.info(f"cloning repo {address} ...")
-    SystemGateway.clone_repo(TAP_PATH, alias, address)
+    SystemGateway.clone_repo(TAP_PATH, alias, address, sparse_paths=build_tap_sparse_paths())
     logger.info(f"storing tap data into database ...")
     DatabaseGateway.store_tap({
         "alias": alias, "address": address, "priority": priority
     })
+    index_tap(SystemGateway, DatabaseGateway, alias)
 
 
 def remove_tap(SystemGateway, DatabaseGateway, alias):
@@ -55,6 +64,7 @@ def remove_tap(SystemGateway, DatabaseGateway, alias):
     SystemGateway.remove_repo(target_path)
 
     logger.info(f"deleting tap from database ...")
+    DatabaseGateway.delete_formula_index(alias)
     DatabaseGateway.delete_tap(alias)
 
 
@@ -64,14 +74,134 @@ def list_taps(DatabaseGateway):
     return build_sorted_taps(external_taps)
 
 
-def update_tap(SystemGateway, DatabaseGateway, alias=None):
-    if not alias:
-        for t in list_taps(DatabaseGateway):
-            update_tap(SystemGateway, DatabaseGateway, alias=t['alias'])
-        return
+def update_tap(SystemGateway, DatabaseGateway, alias=None,
+               concurrency=TAP_UPDATE_CONCURRENCY, timeout=TAP_UPDATE_TIMEOUT):
+    """
+    Pull the repos of tap, or of all taps when alias is empty, and refresh
+    their formula indexes. Repos are pulled by up to concurrency threads,
+    while indexes are refreshed one by one as pulls finish. Returns installed
+    apps which have newer versions in the taps now, along with the reasons of
+    the taps failed to update keyed by alias.
+    """
+    taps = {t['alias']: t for t in list_taps(DatabaseGateway)}
+    if alias and alias not in taps:
+        error = TapUpdateNotFound(alias)
+        logger.error(error.help_text)
+        raise error
+    targets = [taps[alias]] if alias else list(taps.values())
+
+    upgradable_apps, failures = {}, {}
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(targets)))) as executor:
+        futures = {
+            executor.submit(_pull_tap, SystemGateway, t, timeout): t['alias'] for t in targets
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            tap_alias = futures[future]
+            try:
+                revision = future.result()
+            except SystemGateway.RepoUpdateFailed as error:
+                logger.error(f"[{done}/{len(targets)}] {error.help_text}")
+                failures[tap_alias] = error.help_text
+                continue
+            logger.info(f"[{done}/{len(targets)}] tap {tap_alias} updated to {revision}.")
+            upgradable_apps[tap_alias] = _find_upgradable_apps(
+                SystemGateway, DatabaseGateway, tap_alias, revision)
+
+    return [a for t in targets for a in upgradable_apps.get(t['alias'], [])], failures
+
+
+def _pull_tap(SystemGateway, tap, timeout):
+    git_addr = complete_shorten_address(tap['address'])
+    repo_path = os.path.join(TAP_PATH, tap['alias'])
+    revision = SystemGateway.get_repo_revision(repo_path)
+    if revision and revision == SystemGateway.get_remote_revision(repo_path, git_addr, timeout):
+        logger.info(f"repo {tap['alias']} is already at the remote's HEAD.")
+        return revision
+    logger.info(f"updating repo {tap['alias']} from {git_addr} ...")
+    SystemGateway.update_repo(repo_path, git_addr, timeout=timeout)
+    return SystemGateway.get_repo_revision(repo_path)
+
+
+def _find_upgradable_apps(SystemGateway, DatabaseGateway, alias, revision):
+    changed_apps = refresh_tap_index(SystemGateway, DatabaseGateway, alias, revision)
+    if changed_apps is not None and not changed_apps:
+        return []
+    apps = [
+        a for a in DatabaseGateway.list_tap_apps(alias)
+        if changed_apps is None or a['name'] in changed_apps
+    ]
+    return build_upgradable_apps(apps, DatabaseGateway.get_formula_versions(alias))
+
+
+def index_tap(SystemGateway, DatabaseGateway, alias):
+    logger.info(f"indexing formulas of tap {alias} ...")
+    revision = SystemGateway.get_repo_revision(os.path.join(TAP_PATH, alias))
+    formulas = SystemGateway.scan_formulas(build_tap_formula_folder_path(alias))
+    DatabaseGateway.store_formula_index(alias, formulas, revision=revision,
+                                        search_entries=_build_search_entries(SystemGateway, formulas))
+    logger.info(f"{len(formulas)} formulas of tap {alias} indexed.")
+
+
+def refresh_tap_index(SystemGateway, DatabaseGateway, alias, revision):
+    """
+    Bring tap's formula index to revision, re-reading only the formula files
+    git reports as changed since the indexed revision. Returns the names of
+    apps whose formulas changed, or None when the whole tap was re-indexed.
+    """
+    indexed_revision = DatabaseGateway.get_tap_revision(alias)
+    if revision and indexed_revision == revision:
+        logger.info(f"formula index of tap {alias} is up to date.")
+        return set()
+    if not revision or not indexed_revision:
+        index_tap(SystemGateway, DatabaseGateway, alias)
+        return None
 
-    address = get_address_by_alias(alias, list_taps(DatabaseGateway))
-    git_addr = complete_shorten_address(address)
     repo_path = os.path.join(TAP_PATH, alias)
-    logger.info(f'updating repo {alias} from {git_addr} ...')
-    SystemGateway.update_repo(repo_path, git_addr)
\ No newline at end of file
+    try:
+        changes = SystemGateway.diff_repo(repo_path, indexed_revision, revision,
+                                          FORMULA_FOLDER_NAME)
+    except SystemGateway.RepoDiffFailed:
+        logger.warning(f"can not diff tap {alias} from the indexed revision, re-indexing it ...")
+        index_tap(SystemGateway, DatabaseGateway, alias)
+        return None
+
+    formulas, removed_paths, changed_apps = [], [], set()
+    for status, path in changes:
+        parsed = parse_formula_path(path)
+        if not parsed:
+            continue
+        app_name, version = parsed
+        formula_path = os.path.join(repo_path, path)
+        changed_apps.add(app_name)
+        # modified formulas are removed and indexed again.
+        removed_paths.append(formula_path)
+        if status != 'D':
+            formulas.append({
+                'app_name': app_name,
+                'version': version,
+                'path': formula_path,
+                'content_hash': SystemGateway.hash_file(formula_path),
+            })
+    # search entries of changed apps are rebuilt from their latest formulas.
+    removed = set(removed_paths)
+    current_formulas = [
+        f for f in DatabaseGateway.get_tap_formulas(alias, changed_apps) if f['path'] not in removed
+    ] + formulas
+    logger.info(f"{len(changes)} formula files of tap {alias} changed, updating its index ...")
+    DatabaseGateway.update_formula_index(
+        alias, formulas, removed_paths, revision,
+        search_entries=_build_search_entries(SystemGateway, current_formulas),
+        search_apps=changed_apps)
+    return changed_apps
+
+
+def _build_search_entries(SystemGateway, formulas):
+    entries = []
+    for f in select_latest_formulas(formulas):
+        try:
+            data = SystemGateway.read_formula(f['path'], parse_formula)
+        except app_excs.FormulaMalformed:
+            logger.warning(f"formula {f['path']} is malformed, it is searchable by name only.")
+            data = {}
+        entries.append(build_search_entry(f, data))
+    return entries